@@ -0,0 +1,229 @@
+"""Copies clock-in images out of Discord's CDN
+
+Discord attachment URLs expire, so every clock-in image is downloaded in the
+background, a thumbnail and a perceptual hash are computed, the hash is
+compared with the user's recent images, both images are uploaded to a store
+and only then is the attendance record pointed at the copies. The reply to the user
+never waits for any of this; until the copy is done the record keeps the
+Discord URL.
+
+Memory stays bounded: at most ATTACHMENT_CONCURRENCY images are held at a
+time, each no larger than ATTACHMENT_MAX_BYTES, and jobs beyond
+ATTACHMENT_QUEUE_SIZE are skipped instead of piling up.
+"""
+import asyncio
+import datetime
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from PIL import Image, ImageOps
+import database
+from cache import TTLCache
+from clockin_queue import clockin_queue
+from phash import phash, to_signed, to_unsigned, HashIndex
+from config import (
+    ATTACHMENT_STORE, ATTACHMENT_BUCKET, ATTACHMENT_LOCAL_PATH, ATTACHMENT_LOCAL_URL,
+    ATTACHMENT_MAX_BYTES, ATTACHMENT_CONCURRENCY, ATTACHMENT_QUEUE_SIZE,
+    ATTACHMENT_TIMEOUT, THUMBNAIL_SIZE, IMAGE_HASH_MAX_DISTANCE, IMAGE_HASH_HISTORY_DAYS
+)
+
+# Seconds given to in-progress images when the bot shuts down
+DRAIN_TIMEOUT = 10
+
+# Size of the pieces read from Discord while downloading
+CHUNK_SIZE = 64 * 1024
+
+# One image to copy. Exactly one of `attendance_id` (saved directly) and
+# `client_ref` (saved through the clock-in queue) is set.
+ImageJob = namedtuple('ImageJob', [
+    'url', 'content_type', 'filename', 'server_id', 'user_id', 'attendance_date',
+    'attendance_id', 'client_ref'
+])
+
+class AttachmentTooLarge(Exception):
+    """Raised when an attachment is bigger than ATTACHMENT_MAX_BYTES"""
+
+class SupabaseStore:
+    """Stores images in a public Supabase Storage bucket"""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    async def save(self, path: str, data: bytes, content_type: str):
+        """Store an image and return its public URL"""
+        return await database.upload_image(self.bucket, path, data, content_type)
+
+class LocalStore:
+    """Stores images on the local filesystem
+
+    Returns `base_url` + path when a base URL is set (for a directory served
+    by a web server), otherwise the absolute file path.
+    """
+
+    def __init__(self, root: str, base_url: str = None):
+        self.root = root
+        self.base_url = base_url
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    async def save(self, path: str, data: bytes, content_type: str):
+        """Store an image and return where it can be found"""
+        full_path = os.path.join(self.root, path)
+        await asyncio.to_thread(self._write, full_path, data)
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{path}"
+        return os.path.abspath(full_path)
+
+def make_thumbnail(data: bytes):
+    """Render a JPEG thumbnail no larger than THUMBNAIL_SIZE on each side
+
+    Returns the thumbnail and the perceptual hash of the image, computed
+    from the same decoded copy.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets JPEG decode at a reduced size instead of full resolution
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        output = io.BytesIO()
+        image.convert('RGB').save(output, 'JPEG', quality=80, optimize=True)
+        image_hash = phash(image)
+    return output.getvalue(), image_hash
+
+class AttachmentPipeline:
+    """Background workers copying clock-in images to a store"""
+
+    def __init__(self, store, concurrency: int, queue_size: int):
+        self.store = store
+        self.concurrency = concurrency
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        # Thumbnails are CPU work, kept off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='thumbnails')
+        self._session = None
+        self._workers = []
+        # (server_id, user_id) -> HashIndex of the user's recent image hashes,
+        # kept a day so the next clock-in of the user needs no query
+        self._histories = TTLCache(1000, 24 * 3600)
+
+    async def start(self):
+        """Start the download workers"""
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=ATTACHMENT_TIMEOUT))
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Give queued images a moment to finish, then stop the workers"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self._queue.qsize()} clock-in images were not copied before shutdown")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self._session.close()
+        self._executor.shutdown(wait=False)
+
+    @property
+    def pending(self):
+        """Images waiting to be copied"""
+        return self._queue.qsize()
+
+    def submit(self, job: ImageJob):
+        """Queue an image for copying, returning False when the queue is full"""
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            print(f"⚠️ Image queue full, keeping the Discord URL for {job.client_ref or job.attendance_id}")
+            return False
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                print(f"Error storing clock-in image {job.client_ref or job.attendance_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _download(self, url: str):
+        """Stream an attachment into memory, refusing anything over the size cap"""
+        async with self._session.get(url) as response:
+            response.raise_for_status()
+            if response.content_length and response.content_length > ATTACHMENT_MAX_BYTES:
+                raise AttachmentTooLarge(f"{response.content_length} bytes")
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data.extend(chunk)
+                if len(data) > ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge(f"more than {ATTACHMENT_MAX_BYTES} bytes")
+            return bytes(data)
+
+    async def _history(self, server_id: int, user_id: int, attendance_date: str):
+        """Hash index of a user's images, loaded from Supabase once"""
+        key = (server_id, user_id)
+        index = self._histories.get(key)
+        if index is None:
+            since = datetime.date.fromisoformat(attendance_date) - datetime.timedelta(days=IMAGE_HASH_HISTORY_DAYS)
+            index = HashIndex()
+            for day, image_hash in await database.image_hash_history(server_id, user_id, since.isoformat()):
+                index.add(to_unsigned(image_hash), day)
+            self._histories.set(key, index)
+        return index
+
+    async def _check_duplicate(self, job: ImageJob, image_hash: int):
+        """Return (date, distance) of the closest earlier image of the user, or None"""
+        index = await self._history(job.server_id, job.user_id, job.attendance_date)
+        matches = [
+            (distance, day)
+            for distance, day in index.query(image_hash, IMAGE_HASH_MAX_DISTANCE)
+            if day != job.attendance_date
+        ]
+        index.add(image_hash, job.attendance_date)
+        return (matches[0][1], matches[0][0]) if matches else None
+
+    async def _process(self, job: ImageJob):
+        data = await self._download(job.url)
+        loop = asyncio.get_running_loop()
+        thumbnail, image_hash = await loop.run_in_executor(self._executor, make_thumbnail, data)
+        try:
+            duplicate = await self._check_duplicate(job, image_hash)
+        except Exception as e:
+            # Still keep the image, it just goes unchecked
+            print(f"Error checking clock-in image {job.client_ref or job.attendance_id} for re-use: {e}")
+            duplicate = None
+
+        name = job.client_ref or str(job.attendance_id)
+        extension = os.path.splitext(job.filename)[1].lower() or '.img'
+        folder = f"{job.server_id}/{job.attendance_date}"
+        image_url = await self.store.save(f"{folder}/{name}{extension}", data, job.content_type)
+        thumbnail_url = await self.store.save(f"{folder}/{name}_thumb.jpg", thumbnail, 'image/jpeg')
+
+        image = {
+            'image_url': image_url,
+            'thumbnail_url': thumbnail_url,
+            'image_hash': to_signed(image_hash),
+            'similar_to_date': duplicate[0] if duplicate else None,
+            'image_distance': duplicate[1] if duplicate else None
+        }
+        if job.client_ref:
+            if not await clockin_queue.set_image(job.client_ref, image):
+                await database.update_attendance_image_by_ref(job.client_ref, image)
+        else:
+            await database.update_attendance_image(job.attendance_id, image)
+
+def _create_store():
+    if ATTACHMENT_STORE == 'local':
+        return LocalStore(ATTACHMENT_LOCAL_PATH, ATTACHMENT_LOCAL_URL)
+    return SupabaseStore(ATTACHMENT_BUCKET)
+
+# Shared by every command in this process, unused when ATTACHMENT_STORE is 'none'
+attachment_pipeline = AttachmentPipeline(_create_store(), ATTACHMENT_CONCURRENCY, ATTACHMENT_QUEUE_SIZE)
@@ -1,26 +1,238 @@
 import discord
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
 import asyncio
 import datetime
-from supabase import create_client, Client
-from config import DISCORD_TOKEN, BOT_PREFIX, BOT_NAME, BOT_VERSION, SUPABASE_URL, SUPABASE_KEY
-
-# Setup Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+import tempfile
+import time
+import database
+from cache import guild_cache, membership_cache, member_page_cache, today_counter, Membership
+from clockin_queue import clockin_queue, REJECTED_RETENTION_DAYS
+from attachments import attachment_pipeline, ImageJob
+from reminders import ReminderService
+from guild_settings import guild_settings, GuildSettings
+import export as attendance_export
+from metrics import metrics_server, Counter, Gauge, Histogram
+from loop_watchdog import watchdog
+from config import (
+    DISCORD_TOKEN, BOT_PREFIX, BOT_NAME, BOT_VERSION, ATTENDANCE_REPORT_MAX_DAYS,
+    USERLIST_VIEW_TIMEOUT, CLOCKIN_WRITE_BEHIND, TODAY_COUNT_RECONCILE_INTERVAL,
+    ATTACHMENT_STORE, ATTACHMENT_MAX_BYTES, POINTS_ON_TIME, POINTS_ALMOST_LATE, POINTS_LATE,
+    LEADERBOARD_SIZE, CLOCKOUT_MAX_HOURS, CLOCKOUT_SWEEP_INTERVAL, EXPORT_MAX_DAYS,
+    EXPORT_MAX_FILE_BYTES, PREFIX_COMMANDS, SLASH_COMMAND_SYNC, SHARD_COUNT, SHARD_IDS,
+    MEMBER_CACHE, METRICS_PORT, STALL_WATCHDOG
+)
 
 # Setup bot dengan intents yang diperlukan
 intents = discord.Intents.default()
-intents.message_content = True
 intents.members = True
+# Message content is only needed for prefix commands; without it commands
+# still work when the bot is mentioned, e.g. "@OKEbot clockin"
+if PREFIX_COMMANDS:
+    intents.message_content = True
+
+# Member events stay on, but members are only kept as MEMBER_CACHE says. Commands
+# get their author from the message or interaction, registered users are cached
+# as memberships, and the member list is downloaded only by the commands needing it.
+if MEMBER_CACHE == 'full':
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+elif MEMBER_CACHE == 'joined':
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.joined = True
+else:
+    member_cache_flags = discord.MemberCacheFlags.none()
+
+# Connects SHARD_IDS of SHARD_COUNT shards, or all shards Discord recommends.
+# A server's events all arrive on one shard, so every cached entry about a
+# server is owned by the single process connecting that shard.
+bot = commands.AutoShardedBot(
+    command_prefix=BOT_PREFIX if PREFIX_COMMANDS else commands.when_mentioned,
+    intents=intents,
+    help_command=None,
+    # Messages are never read back, so none are cached
+    max_messages=None,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=MEMBER_CACHE == 'full',
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS
+)
+
+# Jobs that cover every server run in one process only: the one connecting shard 0
+PRIMARY_WORKER = SHARD_IDS is None or 0 in SHARD_IDS
+
+# Slash commands are registered once per process, not on every reconnect
+app_commands_synced = False
+
+# Clock-in reminders of every server, on one timer
+reminders = ReminderService(bot)
+
+# Metrics served on /metrics, see metrics.py
+command_seconds = Histogram(
+    'okebot_command_duration_seconds', 'Time from starting a command to its completion', ('command', 'status')
+)
+command_delay_seconds = Histogram(
+    'okebot_command_delay_seconds', 'Time from Discord receiving a command to the bot starting it', ('command',)
+)
+command_errors = Counter('okebot_command_errors_total', 'Commands that raised an error', ('command', 'error'))
+
+CACHES = {
+    'guild': guild_cache,
+    'membership': membership_cache,
+    'member_page': member_page_cache,
+    'guild_settings': guild_settings
+}
+
+def cache_lookups():
+    lookups = {}
+    for name, cache in CACHES.items():
+        lookups[(name, 'hit')] = cache.hits
+        lookups[(name, 'miss')] = cache.misses
+    return lookups
+
+def cache_hit_ratios():
+    return {
+        (name,): cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0
+        for name, cache in CACHES.items()
+    }
+
+def queue_depths():
+    return {
+        ('clockin',): clockin_queue.pending,
+        ('attachments',): attachment_pipeline.pending,
+        ('reminders',): reminders.sender.pending,
+        ('database',): database.queued_requests()
+    }
+
+Gauge('okebot_gateway_latency_seconds', 'Heartbeat latency of each shard', ('shard',),
+      lambda: {(shard_id,): latency for shard_id, latency in bot.latencies})
+Gauge('okebot_guilds', 'Servers connected by this process', function=lambda: len(bot.guilds))
+Counter('okebot_cache_lookups_total', 'Cache lookups by result', ('cache', 'result'), cache_lookups)
+Gauge('okebot_cache_hit_ratio', 'Share of cache lookups served from the cache', ('cache',), cache_hit_ratios)
+Gauge('okebot_cache_entries', 'Entries held by each cache', ('cache',),
+      lambda: {(name,): len(cache) for name, cache in CACHES.items()})
+Gauge('okebot_queue_depth', 'Items waiting in background queues', ('queue',), queue_depths)
+Gauge('okebot_scheduled_reminders', 'Clock-in reminders on the timer', function=lambda: len(reminders.scheduler))
+Counter('okebot_reminder_messages_total', 'Reminder messages by result', ('result',),
+        lambda: {('sent',): reminders.sender.sent, ('failed',): reminders.sender.failed})
+
+@bot.event
+async def setup_hook():
+    """Start background services before connecting to Discord"""
+    if STALL_WATCHDOG:
+        watchdog.start()
+    if METRICS_PORT:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            # The bot runs fine without metrics
+            print(f"Error starting metrics endpoint: {e}")
+    if CLOCKIN_WRITE_BEHIND:
+        await clockin_queue.start()
+    if ATTACHMENT_STORE != 'none':
+        await attachment_pipeline.start()
+    reconcile_today_counts.start()
+    if PRIMARY_WORKER:
+        close_stale_sessions.start()
+    reminders.start()
+
+@tasks.loop(seconds=TODAY_COUNT_RECONCILE_INTERVAL)
+async def reconcile_today_counts():
+    """Correct the live today's-attendance counters from the database"""
+    # Servers are grouped by their local date, which differs between timezones
+    by_date = {}
+    for server_id, day in today_counter.entries():
+        settings = guild_settings.peek(server_id)
+        today = settings.today().isoformat() if settings else None
+        if day != today:
+            # Left over from the server's previous day, or its settings changed
+            today_counter.discard(server_id)
+        else:
+            by_date.setdefault(today, []).append(server_id)
+    for today, server_ids in by_date.items():
+        try:
+            # Read the queue first: a clock-in flushed in between is counted
+            # twice until the next run rather than missed
+            pending = await clockin_queue.pending_counts(today) if CLOCKIN_WRITE_BEHIND else {}
+            counts = await database.today_counts(server_ids, today)
+            for server_id in server_ids:
+                today_counter.set(server_id, today, counts.get(server_id, 0) + pending.get(server_id, 0))
+        except Exception as e:
+            print(f"Error reconciling today's attendance counts: {e}")
 
-bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents, help_command=None)
+@tasks.loop(seconds=CLOCKOUT_SWEEP_INTERVAL)
+async def close_stale_sessions():
+    """Clock out sessions left open longer than CLOCKOUT_MAX_HOURS"""
+    try:
+        closed = await database.close_stale_sessions(CLOCKOUT_MAX_HOURS)
+        if closed:
+            print(f"🧹 Closed {closed} sessions without a clock-out")
+    except Exception as e:
+        print(f"Error closing stale sessions: {e}")
+
+async def sync_guild_commands(guild: discord.Guild):
+    """Register the slash commands in one server, where they are available at once"""
+    bot.tree.copy_global_to(guild=guild)
+    await bot.tree.sync(guild=guild)
+
+async def sync_app_commands():
+    """Register the slash commands with Discord as set by SLASH_COMMAND_SYNC"""
+    try:
+        if SLASH_COMMAND_SYNC == 'global':
+            if not PRIMARY_WORKER:
+                return
+            for command in bot.tree.get_commands():
+                command.guild_only = True
+            synced = await bot.tree.sync()
+            print(f"⌨️ Synced {len(synced)} global slash commands")
+            return
+        synced = 0
+        for guild in bot.guilds:
+            try:
+                await sync_guild_commands(guild)
+                synced += 1
+            except discord.HTTPException as e:
+                print(f"Error syncing slash commands in {guild.name}: {e}")
+        print(f"⌨️ Synced slash commands in {synced} servers")
+    except Exception as e:
+        print(f"Error syncing slash commands: {e}")
 
 @bot.event
 async def on_ready():
     """Event called when bot is ready"""
     print(f'🤖 {bot.user} has logged in to Discord!')
-    print(f'📊 Bot connected to {len(bot.guilds)} servers')
-    print(f'👥 Serving {len(bot.users)} users')
+    print(f'📊 Bot connected to {len(bot.guilds)} servers on {len(bot.shards)} of {bot.shard_count} shards')
+    print(f'👥 Serving {sum(guild.member_count or 0 for guild in bot.guilds)} members')
+    
+    # Warm the guild cache with a single bulk lookup
+    servers = []
+    try:
+        servers = await database.get_servers(guild.id for guild in bot.guilds)
+        for server in servers:
+            guild_cache.set(int(server['server_id']), server['id'])
+        print(f'🗂️ Cached {len(guild_cache)} registered servers')
+    except Exception as e:
+        print(f"Error warming guild cache: {e}")
+    
+    # Load every server's schedule up front, clock-ins then never wait for it;
+    # without the server list, settings are loaded on first use instead
+    if servers:
+        try:
+            await guild_settings.load(server['id'] for server in servers)
+            print(f'🕗 Loaded settings of {len(guild_settings)} servers')
+        except Exception as e:
+            print(f"Error loading server settings: {e}")
+    
+    # Schedule clock-in reminders (on_ready also runs after reconnects, rescheduling is harmless)
+    try:
+        await reminders.load(bot.guilds)
+    except Exception as e:
+        print(f"Error loading clock-in reminders: {e}")
+    
+    # Register slash commands in the background, it takes a request per server
+    global app_commands_synced
+    if SLASH_COMMAND_SYNC in ('guild', 'global') and not app_commands_synced:
+        app_commands_synced = True
+        asyncio.create_task(sync_app_commands())
     
     # Set bot status
     await bot.change_presence(
@@ -30,9 +242,49 @@ async def on_ready():
         )
     )
 
+@bot.event
+async def on_shard_ready(shard_id):
+    """Event called when a shard has connected and received its servers"""
+    print(f'🧩 Shard {shard_id} ready')
+
+@bot.before_invoke
+async def before_command(ctx):
+    """Time the command and acknowledge it when it came as a slash command"""
+    start_command_timer(ctx)
+    # Slash commands must be acknowledged within 3 seconds, most commands query the
+    # database first. Commands answering privately set extras={'ephemeral': True}.
+    if ctx.interaction and not ctx.interaction.response.is_done():
+        await ctx.defer(ephemeral=ctx.command.extras.get('ephemeral', False))
+
+def start_command_timer(ctx):
+    """Note when a command starts and how long Discord took to deliver it"""
+    ctx.started_at = time.perf_counter()
+    # A stall while the command runs is reported with its name and server
+    watchdog.command_started(ctx)
+    created_at = ctx.interaction.created_at if ctx.interaction else ctx.message.created_at
+    delay = (discord.utils.utcnow() - created_at).total_seconds()
+    command_delay_seconds.observe(max(0.0, delay), ctx.command.qualified_name)
+
+def observe_command(ctx, status: str):
+    """Record the duration of a command once and stop tracking it"""
+    started = getattr(ctx, 'started_at', None)
+    if started is None:
+        return
+    ctx.started_at = None
+    watchdog.command_finished(ctx)
+    command_seconds.observe(time.perf_counter() - started, ctx.command.qualified_name, status)
+
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    """Record the duration of a finished command"""
+    observe_command(ctx, 'error' if ctx.command_failed else 'ok')
+
 @bot.event
 async def on_command_error(ctx, error):
     """Handle command errors"""
+    # Slash commands failing in their callback skip the after_invoke hook
+    observe_command(ctx, 'error')
+    command_errors.inc(ctx.command.qualified_name if ctx.command else 'unknown', type(error).__name__)
     if isinstance(error, commands.CommandNotFound):
         await ctx.send(f"❌ Command not found! Use `{BOT_PREFIX}help` to see available commands.")
     elif isinstance(error, commands.MissingPermissions):
@@ -65,13 +317,54 @@ async def on_member_remove(member):
         )
         await channel.send(embed=embed)
 
+@bot.event
+async def on_guild_update(before, after):
+    """Keep the stored server details in sync"""
+    if guild_cache.get(after.id) is None:
+        return
+    try:
+        await database.update_server(after.id, {
+            'name': after.name,
+            'icon_url': str(after.icon.url) if after.icon else None,
+            'member_count': after.member_count,
+            'owner_id': str(after.owner_id)
+        })
+    except Exception as e:
+        print(f"Error updating server details: {e}")
+        guild_cache.invalidate(after.id)
+
+@bot.event
+async def on_guild_join(guild):
+    """Make the slash commands available in a newly joined server"""
+    if SLASH_COMMAND_SYNC == 'guild':
+        try:
+            await sync_guild_commands(guild)
+        except discord.HTTPException as e:
+            print(f"Error syncing slash commands in {guild.name}: {e}")
+
+@bot.event
+async def on_guild_remove(guild):
+    """Forget cached data of a server the bot left"""
+    server_id = guild_cache.get(guild.id)
+    if server_id is not None:
+        reminders.remove_server(server_id)
+        guild_settings.invalidate(server_id)
+        today_counter.discard(server_id)
+    membership_cache.invalidate_where(lambda key: key[0] == guild.id)
+    forget_member_pages(guild.id)
+    guild_cache.invalidate(guild.id)
+
 async def ensure_server_registered(guild: discord.Guild):
     """Ensure server is registered in database"""
+    server_id = guild_cache.get(guild.id)
+    if server_id is not None:
+        return server_id
+    
     try:
         # Check if server exists
-        response = supabase.table('servers').select('*').eq('server_id', str(guild.id)).execute()
+        server = await database.get_server(guild.id)
         
-        if not response.data:
+        if not server:
             # Insert new server
             server_data = {
                 'server_id': str(guild.id),
@@ -81,15 +374,39 @@ async def ensure_server_registered(guild: discord.Guild):
                 'created_at': guild.created_at.isoformat(),
                 'owner_id': str(guild.owner_id)
             }
-            response = supabase.table('servers').insert(server_data).execute()
+            server = await database.insert_server(server_data)
         
-        return response.data[0]['id'] if response.data else None
+        if not server:
+            return None
+        guild_cache.set(guild.id, server['id'])
+        return server['id']
     except Exception as e:
         print(f"Error ensuring server registration: {e}")
         return None
 
-@bot.command(name='register')
+async def get_membership(server_id: int, guild_id: int, discord_id: int):
+    """Resolve a Discord user in a server, served from the membership cache"""
+    key = (guild_id, discord_id)
+    membership = membership_cache.get(key)
+    if membership is not None:
+        return membership
+    
+    user = await database.get_user_with_membership(discord_id, server_id)
+    if user:
+        membership = Membership(user['id'], user['username'], bool(user['user_servers']))
+    else:
+        membership = Membership(None, None, False)
+    membership_cache.set(key, membership)
+    return membership
+
+def forget_user(discord_id: int):
+    """Drop every cached membership of a Discord user"""
+    # Only servers of this process; other workers re-read theirs within MEMBERSHIP_CACHE_TTL
+    membership_cache.invalidate_where(lambda key: key[1] == discord_id)
+
+@bot.hybrid_command(name='register')
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def register(ctx, member: discord.Member = None, *, username: str = None):
     """Register user in the database"""
     if member is None:
@@ -105,20 +422,12 @@ async def register(ctx, member: discord.Member = None, *, username: str = None):
             raise Exception("Failed to register server")
 
         # Check if user already exists
-        response = supabase.table('users').select('*')\
-            .eq('discord_id', str(member.id))\
-            .execute()
+        membership = await get_membership(server_id, ctx.guild.id, member.id)
         
-        if response.data:
-            user_id = response.data[0]['id']
+        if membership.user_id:
+            user_id = membership.user_id
             # Check if user is already registered in this server
-            user_server_response = supabase.table('user_servers')\
-                .select('*')\
-                .eq('user_id', user_id)\
-                .eq('server_id', server_id)\
-                .execute()
-            
-            if user_server_response.data:
+            if membership.is_member:
                 embed = discord.Embed(
                     title="❌ Registration Failed",
                     description=f"{member.mention} is already registered in this server!",
@@ -133,7 +442,9 @@ async def register(ctx, member: discord.Member = None, *, username: str = None):
                     'joined_at': member.joined_at.isoformat() if member.joined_at else datetime.datetime.utcnow().isoformat(),
                     'registered_by': str(ctx.author.id)
                 }
-                supabase.table('user_servers').insert(user_server_data).execute()
+                await database.insert_user_server(user_server_data)
+                membership_cache.set((ctx.guild.id, member.id), membership._replace(is_member=True))
+                forget_member_pages(ctx.guild.id)
                 
                 embed = discord.Embed(
                     title="✅ Server Registration Successful",
@@ -150,8 +461,8 @@ async def register(ctx, member: discord.Member = None, *, username: str = None):
                 'avatar_url': str(member.avatar.url) if member.avatar else str(member.default_avatar.url)
             }
             
-            user_response = supabase.table('users').insert(user_data).execute()
-            user_id = user_response.data[0]['id']
+            new_user = await database.insert_user(user_data)
+            user_id = new_user['id']
             
             # Register user in this server
             user_server_data = {
@@ -160,7 +471,11 @@ async def register(ctx, member: discord.Member = None, *, username: str = None):
                 'joined_at': member.joined_at.isoformat() if member.joined_at else datetime.datetime.utcnow().isoformat(),
                 'registered_by': str(ctx.author.id)
             }
-            supabase.table('user_servers').insert(user_server_data).execute()
+            await database.insert_user_server(user_server_data)
+            # Other servers may hold a cached "not registered" result
+            forget_user(member.id)
+            membership_cache.set((ctx.guild.id, member.id), Membership(user_id, username, True))
+            forget_member_pages(ctx.guild.id)
             
             embed = discord.Embed(
                 title="✅ Registration Successful",
@@ -174,6 +489,7 @@ async def register(ctx, member: discord.Member = None, *, username: str = None):
         embed.add_field(name="Server", value=ctx.guild.name, inline=True)
         embed.add_field(name="Registration Time", value=datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), inline=True)
     except Exception as e:
+        forget_user(member.id)
         embed = discord.Embed(
             title="❌ Registration Error",
             description=f"An error occurred during registration: {str(e)}",
@@ -184,8 +500,97 @@ async def register(ctx, member: discord.Member = None, *, username: str = None):
     embed.set_footer(text=f"Requested by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='unregister')
+# Members sent to the database per bulk registration request
+REGISTER_BATCH_SIZE = 200
+
+async def guild_members(guild: discord.Guild):
+    """Every member of a server, downloaded on demand unless the member cache holds them all"""
+    if guild.chunked:
+        return guild.members
+    # Not cached, the list is released once the command is done
+    return await guild.chunk(cache=False)
+
+async def bulk_register(ctx, members, target: str):
+    """Register many members with one diff query and batched inserts"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+
+        registered_ids = await database.registered_discord_ids(server_id)
+        
+        skipped = 0
+        missing = []
+        for member in members:
+            if member.bot or str(member.id) in registered_ids:
+                skipped += 1
+                continue
+            missing.append({
+                'discord_id': str(member.id),
+                'username': member.name,
+                'avatar_url': str(member.avatar.url) if member.avatar else str(member.default_avatar.url),
+                'joined_at': member.joined_at.isoformat() if member.joined_at else None
+            })
+        
+        created = 0
+        failed = 0
+        for i in range(0, len(missing), REGISTER_BATCH_SIZE):
+            batch = missing[i:i + REGISTER_BATCH_SIZE]
+            try:
+                _, registered = await database.register_members(server_id, ctx.author.id, batch)
+                created += registered
+                # Registered in the meantime by someone else
+                skipped += len(batch) - registered
+            except Exception as e:
+                print(f"Error registering member batch: {e}")
+                failed += len(batch)
+        
+        # Cached "not registered" results are stale now
+        changed_ids = {int(member['discord_id']) for member in missing}
+        membership_cache.invalidate_where(lambda key: key[1] in changed_ids)
+        forget_member_pages(ctx.guild.id)
+        
+        embed = discord.Embed(
+            title="✅ Bulk Registration Complete" if not failed else "⚠️ Bulk Registration Finished With Errors",
+            description=f"Registered {target} in **{ctx.guild.name}**.",
+            color=discord.Color.green() if not failed else discord.Color.orange(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        embed.add_field(name="✅ Created", value=str(created), inline=True)
+        embed.add_field(name="⏭️ Skipped", value=str(skipped), inline=True)
+        embed.add_field(name="❌ Failed", value=str(failed), inline=True)
+        embed.add_field(name="Registered By", value=ctx.author.mention, inline=True)
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Registration Error",
+            description=f"An error occurred during bulk registration: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='registerrole')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def register_role(ctx, role: discord.Role):
+    """Register every member of a role"""
+    members = [member for member in await guild_members(ctx.guild) if member.get_role(role.id)]
+    await bulk_register(ctx, members, f"members of {role.mention}")
+
+@bot.hybrid_command(name='registerall')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def register_all(ctx):
+    """Register every member of the server"""
+    await bulk_register(ctx, await guild_members(ctx.guild), "all members")
+
+@bot.hybrid_command(name='unregister')
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def unregister(ctx, member: discord.Member = None):
     """Unregister a user from the current server"""
     # Default to command author if no member specified
@@ -199,11 +604,9 @@ async def unregister(ctx, member: discord.Member = None):
             raise Exception("Failed to register server")
 
         # Check if user exists
-        user_response = supabase.table('users').select('*')\
-            .eq('discord_id', str(member.id))\
-            .execute()
+        membership = await get_membership(server_id, ctx.guild.id, member.id)
         
-        if not user_response.data:
+        if not membership.user_id:
             embed = discord.Embed(
                 title="❌ Unregistration Failed",
                 description=f"{member.mention} is not registered in the system!",
@@ -211,16 +614,10 @@ async def unregister(ctx, member: discord.Member = None):
                 timestamp=datetime.datetime.utcnow()
             )
         else:
-            user_id = user_response.data[0]['id']
+            user_id = membership.user_id
             
             # Check if user is registered in this server
-            user_server_response = supabase.table('user_servers')\
-                .select('*')\
-                .eq('user_id', user_id)\
-                .eq('server_id', server_id)\
-                .execute()
-            
-            if not user_server_response.data:
+            if not membership.is_member:
                 embed = discord.Embed(
                     title="❌ Unregistration Failed",
                     description=f"{member.mention} is not registered in this server!",
@@ -229,11 +626,9 @@ async def unregister(ctx, member: discord.Member = None):
                 )
             else:
                 # Remove user from this server
-                supabase.table('user_servers')\
-                    .delete()\
-                    .eq('user_id', user_id)\
-                    .eq('server_id', server_id)\
-                    .execute()
+                await database.delete_user_server(user_id, server_id)
+                membership_cache.set((ctx.guild.id, member.id), membership._replace(is_member=False))
+                forget_member_pages(ctx.guild.id)
                 
                 embed = discord.Embed(
                     title="✅ Unregistration Successful",
@@ -249,6 +644,7 @@ async def unregister(ctx, member: discord.Member = None):
                 embed.add_field(name="Unregistration Time", value=datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), inline=True)
     
     except Exception as e:
+        forget_user(member.id)
         embed = discord.Embed(
             title="❌ Unregistration Error",
             description=f"An error occurred during unregistration: {str(e)}",
@@ -259,8 +655,9 @@ async def unregister(ctx, member: discord.Member = None):
     embed.set_footer(text=f"Requested by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='changeusername')
+@bot.hybrid_command(name='changeusername')
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def change_username(ctx, member: discord.Member = None, *, new_username: str = None):
     """Change username for a registered user"""
     # Default to command author if no member specified
@@ -280,11 +677,9 @@ async def change_username(ctx, member: discord.Member = None, *, new_username: s
     
     try:
         # Check if user exists
-        user_response = supabase.table('users').select('*')\
-            .eq('discord_id', str(member.id))\
-            .execute()
+        user = await database.get_user(member.id)
         
-        if not user_response.data:
+        if not user:
             embed = discord.Embed(
                 title="❌ Username Change Failed",
                 description=f"{member.mention} is not registered in the system!",
@@ -292,13 +687,13 @@ async def change_username(ctx, member: discord.Member = None, *, new_username: s
                 timestamp=datetime.datetime.utcnow()
             )
         else:
-            old_username = user_response.data[0]['username']
+            old_username = user['username']
             
             # Update username
-            supabase.table('users')\
-                .update({'username': new_username})\
-                .eq('discord_id', str(member.id))\
-                .execute()
+            await database.update_username(member.id, new_username)
+            forget_user(member.id)
+            # The username may be listed on any server's userlist pages
+            member_page_cache.invalidate_where(lambda key: True)
             
             embed = discord.Embed(
                 title="✅ Username Changed Successfully",
@@ -325,94 +720,164 @@ async def change_username(ctx, member: discord.Member = None, *, new_username: s
     embed.set_footer(text=f"Requested by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='userlist')
+# Registered users shown per userlist page
+USERLIST_PAGE_SIZE = 20
+
+async def fetch_member_page(guild_id: int, server_id: int, after):
+    """Get a userlist page (plus one look-ahead row), cached per guild"""
+    key = (guild_id, after)
+    rows = member_page_cache.get(key)
+    if rows is None:
+        rows = await database.server_members_page(server_id, after, USERLIST_PAGE_SIZE + 1)
+        member_page_cache.set(key, rows)
+    return rows
+
+async def fetch_member_total(guild_id: int, server_id: int):
+    """Get the number of registered users, cached per guild"""
+    key = (guild_id, 'total')
+    total = member_page_cache.get(key)
+    if total is None:
+        total = await database.count_user_servers(server_id)
+        member_page_cache.set(key, total)
+    return total
+
+def forget_member_pages(guild_id: int):
+    """Drop the cached userlist pages of a guild"""
+    member_page_cache.invalidate_where(lambda key: key[0] == guild_id)
+
+class UserListView(discord.ui.View):
+    """Previous/Next navigation for the registered users list"""
+
+    def __init__(self, ctx, server_id: int, total: int):
+        super().__init__(timeout=USERLIST_VIEW_TIMEOUT)
+        self.ctx = ctx
+        self.server_id = server_id
+        self.total = total
+        self.page = 0
+        # Keyset cursor of every visited page, page 0 starts at the beginning
+        self.cursors = [None]
+        self.message = None
+
+    @property
+    def page_count(self):
+        return max(1, -(-self.total // USERLIST_PAGE_SIZE))
+
+    async def render(self):
+        """Fetch the current page and build its embed"""
+        guild = self.ctx.guild
+        rows = await fetch_member_page(guild.id, self.server_id, self.cursors[self.page])
+        has_next = len(rows) > USERLIST_PAGE_SIZE
+        rows = rows[:USERLIST_PAGE_SIZE]
+        
+        if has_next and len(self.cursors) == self.page + 1:
+            self.cursors.append((rows[-1]['joined_at'], rows[-1]['id']))
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not has_next
+        
+        embed = discord.Embed(
+            title="📋 Registered Users",
+            description=f"List of registered users in **{guild.name}**",
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        # Add server stats
+        total_members = guild.member_count
+        registration_rate = round((self.total / total_members) * 100, 1) if total_members > 0 else 0
+        embed.add_field(
+            name="📊 Statistics",
+            value=f"**Registered:** {self.total}\n**Total Members:** {total_members}\n**Registration Rate:** {registration_rate}%",
+            inline=False
+        )
+        
+        user_list = []
+        for i, record in enumerate(rows, self.page * USERLIST_PAGE_SIZE + 1):
+            discord_id = record['discord_id']
+            
+            # Mentions render from the id alone, members need not be cached
+            user_mention = f"<@{discord_id}>"
+            
+            # Format join date
+            try:
+                join_date = datetime.datetime.fromisoformat(record['joined_at'].replace('Z', '+00:00'))
+                formatted_date = join_date.strftime("%Y-%m-%d")
+            except:
+                formatted_date = "Unknown"
+            
+            user_list.append(f"`{i:2d}.` {user_mention} **{record['username']}** *(joined: {formatted_date})*")
+        
+        # Split into two fields to stay under Discord's 1024 characters per field
+        chunk_size = USERLIST_PAGE_SIZE // 2
+        for i in range(0, len(user_list), chunk_size):
+            embed.add_field(
+                name="👥 Users" if i == 0 else "👥 Users (continued)",
+                value="\n".join(user_list[i:i + chunk_size]),
+                inline=False
+            )
+        
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count} • Requested by {self.ctx.author.name}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.ctx.author.id:
+            await interaction.response.send_message("❌ Only the person who ran this command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    async def show(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        try:
+            embed = await self.render()
+        except Exception as e:
+            await interaction.followup.send(f"❌ An error occurred while fetching user list: {str(e)}", ephemeral=True)
+            return
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.page + 1 < len(self.cursors):
+            self.page += 1
+        await self.show(interaction)
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+@bot.hybrid_command(name='userlist')
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def user_list(ctx):
     """List all registered users on this server"""
+    view = None
     try:
         # Ensure server is registered first
         server_id = await ensure_server_registered(ctx.guild)
         if not server_id:
             raise Exception("Failed to register server")
 
-        # Get all registered users for this server with their details
-        response = supabase.table('user_servers')\
-            .select('*, users(discord_id, username, registered_at, avatar_url)')\
-            .eq('server_id', server_id)\
-            .order('joined_at', desc=False)\
-            .execute()
+        total = await fetch_member_total(ctx.guild.id, server_id)
         
-        if not response.data:
+        if not total:
             embed = discord.Embed(
                 title="📋 Registered Users",
                 description=f"No users are registered in **{ctx.guild.name}** yet.",
                 color=discord.Color.blue(),
                 timestamp=datetime.datetime.utcnow()
             )
+            embed.set_footer(text=f"Requested by {ctx.author.name}")
         else:
-            embed = discord.Embed(
-                title="📋 Registered Users",
-                description=f"List of registered users in **{ctx.guild.name}**",
-                color=discord.Color.blue(),
-                timestamp=datetime.datetime.utcnow()
-            )
-            
-            # Add server stats
-            total_registered = len(response.data)
-            total_members = ctx.guild.member_count
-            registration_rate = round((total_registered / total_members) * 100, 1) if total_members > 0 else 0
-            
-            embed.add_field(
-                name="📊 Statistics",
-                value=f"**Registered:** {total_registered}\n**Total Members:** {total_members}\n**Registration Rate:** {registration_rate}%",
-                inline=False
-            )
-            
-            # Create user list with pagination if needed
-            user_list = []
-            for i, record in enumerate(response.data, 1):
-                user_data = record['users']
-                discord_id = user_data['discord_id']
-                username = user_data['username']
-                joined_at = record['joined_at']
-                registered_by = record['registered_by']
-                
-                # Try to get Discord member object for mention
-                try:
-                    member = ctx.guild.get_member(int(discord_id))
-                    user_mention = member.mention if member else f"<@{discord_id}>"
-                except:
-                    user_mention = f"<@{discord_id}>"
-                
-                # Format join date
-                try:
-                    join_date = datetime.datetime.fromisoformat(joined_at.replace('Z', '+00:00'))
-                    formatted_date = join_date.strftime("%Y-%m-%d")
-                except:
-                    formatted_date = "Unknown"
-                
-                user_list.append(f"`{i:2d}.` {user_mention} **{username}** *(joined: {formatted_date})*")
-            
-            # Split into chunks if too many users (Discord embed limit)
-            chunk_size = 20
-            user_chunks = [user_list[i:i + chunk_size] for i in range(0, len(user_list), chunk_size)]
-            
-            for i, chunk in enumerate(user_chunks):
-                field_name = "👥 Users" if i == 0 else f"👥 Users (continued {i+1})"
-                embed.add_field(
-                    name=field_name,
-                    value="\n".join(chunk),
-                    inline=False
-                )
-                
-                # Discord has a limit of 25 fields per embed
-                if i >= 24:
-                    embed.add_field(
-                        name="⚠️ Note",
-                        value=f"Only showing first {(i+1) * chunk_size} users. Use database queries for complete list.",
-                        inline=False
-                    )
-                    break
+            view = UserListView(ctx, server_id, total)
+            embed = await view.render()
+            if view.page_count == 1:
+                view = None
     
     except Exception as e:
         embed = discord.Embed(
@@ -421,110 +886,72 @@ async def user_list(ctx):
             color=discord.Color.red(),
             timestamp=datetime.datetime.utcnow()
         )
+        embed.set_footer(text=f"Requested by {ctx.author.name}")
     
+    if view:
+        view.message = await ctx.send(embed=embed, view=view)
+    else:
+        await ctx.send(embed=embed)
+
+def not_registered_embed(ctx, membership: Membership, title: str = "❌ Clock-in Failed"):
+    """Build the clock-in or clock-out reply for users not registered in this server"""
+    if not membership.user_id:
+        description = f"You are not registered! Please ask an admin to register you first using `{BOT_PREFIX}register`."
+    else:
+        description = f"You are not registered in this server! Please ask an admin to register you using `{BOT_PREFIX}register`."
+    embed = discord.Embed(
+        title=title,
+        description=description,
+        color=discord.Color.red(),
+        timestamp=datetime.datetime.utcnow()
+    )
     embed.set_footer(text=f"Requested by {ctx.author.name}")
-    await ctx.send(embed=embed)
+    return embed
 
-@bot.command(name='clockin')
-async def clock_in(ctx, *, notes: str = None):
-    """Clock in for attendance with optional image and notes"""
+@bot.hybrid_command(name='clockin')
+@app_commands.describe(image="Photo for attendance verification", notes="Optional notes")
+async def clock_in(ctx, image: discord.Attachment = None, *, notes: str = None):
+    """Clock in for attendance with an image and optional notes"""
     try:
-        # Get Indonesian time (GMT+7)
-        import pytz
-        jakarta_tz = pytz.timezone('Asia/Jakarta')
-        now_jakarta = datetime.datetime.now(jakarta_tz)
-        current_time = now_jakarta.time()
-        
-        # Check if clock-in is allowed (07:30 or later)
-        earliest_time = datetime.time(7, 30)  # 07:30
-        if current_time < earliest_time:
-            embed = discord.Embed(
-                title="⏰ Too Early to Clock In",
-                description=f"Clock-in is only allowed from **07:30** onwards.\n\nCurrent time: **{current_time.strftime('%H:%M')}** (GMT+7)\nEarliest allowed: **07:30** (GMT+7)",
-                color=discord.Color.orange(),
-                timestamp=datetime.datetime.utcnow()
-            )
-            embed.set_footer(text=f"Requested by {ctx.author.name}")
-            await ctx.send(embed=embed)
-            return
-        
         # Ensure server is registered first
         server_id = await ensure_server_registered(ctx.guild)
         if not server_id:
             raise Exception("Failed to register server")
-
-        # Check if user is registered
-        user_response = supabase.table('users').select('*')\
-            .eq('discord_id', str(ctx.author.id))\
-            .execute()
-        
-        if not user_response.data:
-            embed = discord.Embed(
-                title="❌ Clock-in Failed",
-                description=f"You are not registered! Please ask an admin to register you first using `{BOT_PREFIX}register`.",
-                color=discord.Color.red(),
-                timestamp=datetime.datetime.utcnow()
-            )
-            embed.set_footer(text=f"Requested by {ctx.author.name}")
-            await ctx.send(embed=embed)
-            return
-        
-        user_id = user_response.data[0]['id']
-        username = user_response.data[0]['username']
-        
-        # Check if user is registered in this server
-        user_server_response = supabase.table('user_servers')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .eq('server_id', server_id)\
-            .execute()
         
-        if not user_server_response.data:
-            embed = discord.Embed(
-                title="❌ Clock-in Failed",
-                description=f"You are not registered in this server! Please ask an admin to register you using `{BOT_PREFIX}register`.",
-                color=discord.Color.red(),
-                timestamp=datetime.datetime.utcnow()
-            )
-            embed.set_footer(text=f"Requested by {ctx.author.name}")
-            await ctx.send(embed=embed)
-            return
+        # Local time of the server
+        settings = await guild_settings.get(server_id)
+        now_local = settings.now()
+        current_time = now_local.time()
+        offset = settings.utc_offset(now_local)
         
-        # Check for today's attendance (prevent multiple clock-ins per day) - using Jakarta timezone
-        today_jakarta = now_jakarta.date()
-        # Convert Jakarta date to UTC for database query
-        today_utc_start = jakarta_tz.localize(datetime.datetime.combine(today_jakarta, datetime.time.min)).astimezone(pytz.UTC)
-        today_utc_end = jakarta_tz.localize(datetime.datetime.combine(today_jakarta, datetime.time.max)).astimezone(pytz.UTC)
-        
-        existing_attendance = supabase.table('attendance')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .eq('server_id', server_id)\
-            .gte('clock_in_time', today_utc_start.isoformat())\
-            .lt('clock_in_time', today_utc_end.isoformat())\
-            .execute()
-        
-        if existing_attendance.data:
-            existing_time = existing_attendance.data[0]['clock_in_time']
-            try:
-                clock_time = datetime.datetime.fromisoformat(existing_time.replace('Z', '+00:00'))
-                formatted_time = clock_time.strftime("%H:%M:%S")
-            except:
-                formatted_time = "Unknown time"
-            
+        # Check if clock-in is allowed yet
+        if current_time < settings.earliest_time:
+            earliest = settings.earliest_time.strftime('%H:%M')
             embed = discord.Embed(
-                title="⚠️ Already Clocked In",
-                description=f"You have already clocked in today at **{formatted_time}**!",
+                title="⏰ Too Early to Clock In",
+                description=f"Clock-in is only allowed from **{earliest}** onwards.\n\nCurrent time: **{current_time.strftime('%H:%M')}** ({offset})\nEarliest allowed: **{earliest}** ({offset})",
                 color=discord.Color.orange(),
                 timestamp=datetime.datetime.utcnow()
             )
             embed.set_footer(text=f"Requested by {ctx.author.name}")
             await ctx.send(embed=embed)
             return
+
+        # Known unregistered users are turned away without a database request
+        membership_key = (ctx.guild.id, ctx.author.id)
+        if CLOCKIN_WRITE_BEHIND:
+            # The queue needs the user id up front
+            membership = await get_membership(server_id, ctx.guild.id, ctx.author.id)
+        else:
+            membership = membership_cache.get(membership_key)
+        if membership is not None and not membership.is_member:
+            await ctx.send(embed=not_registered_embed(ctx, membership))
+            return
         
         # Handle image attachment - REQUIRED
+        # Prefix commands fill `image` from the message's first attachment
         image_url = None
-        if not ctx.message.attachments:
+        if image is None:
             embed = discord.Embed(
                 title="❌ Image Required",
                 description="Please attach an image when clocking in. Images are required for attendance verification.",
@@ -535,7 +962,7 @@ async def clock_in(ctx, *, notes: str = None):
             await ctx.send(embed=embed)
             return
         
-        attachment = ctx.message.attachments[0]
+        attachment = image
         if attachment.content_type and attachment.content_type.startswith('image/'):
             image_url = attachment.url
         else:
@@ -550,34 +977,69 @@ async def clock_in(ctx, *, notes: str = None):
             return
         
         # Determine lateness status
-        late_time = datetime.time(9, 0)  # 09:00
-        almost_late_time = datetime.time(8, 45)  # 08:45 (15 minutes before 9 AM)
-        
+        punctuality, points = settings.classify(current_time)
         lateness_status = ""
         embed_color = discord.Color.green()
         
-        if current_time > late_time:
+        if punctuality == 'late':
             lateness_status = " 😱 **YOU ARE LATE!**"
             embed_color = discord.Color.red()
-        elif current_time >= almost_late_time:
+        elif punctuality == 'almost_late':
             lateness_status = " ⚠️ **ALMOST LATE!**"
             embed_color = discord.Color.orange()
         
-        # Create attendance record (store in UTC but display in Jakarta time)
-        attendance_data = {
-            'user_id': user_id,
-            'server_id': server_id,
-            'clock_in_time': now_jakarta.astimezone(pytz.UTC).isoformat(),
-            'image_url': image_url,
-            'notes': notes
-        }
+        if CLOCKIN_WRITE_BEHIND:
+            # Acknowledge from the local queue, Supabase is updated in the background
+            result = await clockin_queue.submit(
+                server_id,
+                membership.user_id,
+                now_local.date().isoformat(),
+                now_local.astimezone(datetime.timezone.utc).isoformat(),
+                image_url,
+                notes,
+                punctuality,
+                points
+            )
+        else:
+            # Validate membership, enforce one clock-in per day, insert the record
+            # and count today's attendance in a single request
+            result = await database.clock_in(
+                server_id,
+                ctx.author.id,
+                now_local.astimezone(datetime.timezone.utc).isoformat(),
+                image_url,
+                notes,
+                punctuality,
+                points
+            )
+            if not result:
+                raise Exception("No response from the database")
+            
+            membership = Membership(result['user_id'], result['username'], result['status'] not in ('not_registered', 'not_member'))
+            membership_cache.set(membership_key, membership)
+            
+            if not membership.is_member:
+                await ctx.send(embed=not_registered_embed(ctx, membership))
+                return
         
-        response = supabase.table('attendance').insert(attendance_data).execute()
+        if result['status'] == 'already_clocked_in':
+            try:
+                clock_time = datetime.datetime.fromisoformat(result['clock_in_time'].replace('Z', '+00:00'))
+                formatted_time = clock_time.astimezone(settings.tz).strftime("%H:%M:%S")
+            except:
+                formatted_time = "Unknown time"
+            
+            embed = discord.Embed(
+                title="⚠️ Already Clocked In",
+                description=f"You have already clocked in today at **{formatted_time}**!",
+                color=discord.Color.orange(),
+                timestamp=datetime.datetime.utcnow()
+            )
         
-        if response.data:
+        elif result['status'] == 'ok':
             embed = discord.Embed(
                 title=f"✅ Clock-in Successful{lateness_status}",
-                description=f"**{username}** has successfully clocked in!",
+                description=f"**{membership.username}** has successfully clocked in!",
                 color=embed_color,
                 timestamp=datetime.datetime.utcnow()
             )
@@ -585,25 +1047,38 @@ async def clock_in(ctx, *, notes: str = None):
             # Add attendance details
             embed.add_field(name="👤 User", value=ctx.author.mention, inline=True)
             embed.add_field(name="🏢 Server", value=ctx.guild.name, inline=True)
-            embed.add_field(name="⏰ Time (GMT+7)", value=now_jakarta.strftime("%Y-%m-%d %H:%M:%S"), inline=True)
+            embed.add_field(name=f"⏰ Time ({offset})", value=now_local.strftime("%Y-%m-%d %H:%M:%S"), inline=True)
             
             if notes:
                 embed.add_field(name="📝 Notes", value=notes, inline=False)
             
+            embed.add_field(name="🏅 Points", value=f"+{points}", inline=True)
+            
             if image_url:
                 embed.add_field(name="📷 Image", value="Attached", inline=True)
                 embed.set_image(url=image_url)
+                
+                # Copy the image before the Discord URL expires, in the background
+                if ATTACHMENT_STORE != 'none' and attachment.size <= ATTACHMENT_MAX_BYTES:
+                    attachment_pipeline.submit(ImageJob(
+                        url=image_url,
+                        content_type=attachment.content_type,
+                        filename=attachment.filename,
+                        server_id=server_id,
+                        user_id=membership.user_id,
+                        attendance_date=now_local.date().isoformat(),
+                        attendance_id=result.get('attendance_id'),
+                        client_ref=result.get('client_ref')
+                    ))
             
-            # Get today's attendance count for this server (using Jakarta timezone)
-            today_count_response = supabase.table('attendance')\
-                .select('*', count='exact')\
-                .eq('server_id', server_id)\
-                .gte('clock_in_time', today_utc_start.isoformat())\
-                .lt('clock_in_time', today_utc_end.isoformat())\
-                .execute()
-            
-            today_count = today_count_response.count if today_count_response.count else 0
-            embed.add_field(name="📊 Today's Attendance", value=f"{today_count} people clocked in", inline=True)
+            # Today's attendance count for this server (in its local date)
+            today = now_local.date().isoformat()
+            today_count = today_counter.increment(server_id, today)
+            if today_count is None and result.get('today_count') is not None:
+                today_count = result['today_count']
+                today_counter.set(server_id, today, today_count)
+            if today_count is not None:
+                embed.add_field(name="📊 Today's Attendance", value=f"{today_count} people clocked in", inline=True)
         
         else:
             embed = discord.Embed(
@@ -624,99 +1099,268 @@ async def clock_in(ctx, *, notes: str = None):
     embed.set_footer(text=f"Requested by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='attendance')
-@commands.has_permissions(administrator=True)
-async def attendance_report(ctx, days: int = 7):
-    """Show attendance report for the server"""
+def format_duration(seconds: float):
+    """Format a number of seconds as hours and minutes, e.g. 7h 05m"""
+    minutes = int(seconds) // 60
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+@bot.hybrid_command(name='clockout')
+async def clock_out(ctx):
+    """Clock out, closing today's open attendance session"""
     try:
         # Ensure server is registered first
         server_id = await ensure_server_registered(ctx.guild)
         if not server_id:
             raise Exception("Failed to register server")
-
-        # Limit days to reasonable range
-        if days < 1:
-            days = 1
-        elif days > 30:
-            days = 30
         
-        # Get attendance data for the specified period
-        start_date = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        # Known unregistered users are turned away without a database request
+        membership_key = (ctx.guild.id, ctx.author.id)
+        if CLOCKIN_WRITE_BEHIND:
+            membership = await get_membership(server_id, ctx.guild.id, ctx.author.id)
+            # A clock-in still in the local queue must reach Supabase before it can be closed
+            if membership.is_member and await clockin_queue.has_pending(server_id, membership.user_id):
+                await clockin_queue.flush()
+        else:
+            membership = membership_cache.get(membership_key)
+        if membership is not None and not membership.is_member:
+            await ctx.send(embed=not_registered_embed(ctx, membership, "❌ Clock-out Failed"))
+            return
         
-        response = supabase.table('attendance')\
-            .select('*, users(username, discord_id)')\
-            .eq('server_id', server_id)\
-            .gte('clock_in_time', start_date.isoformat())\
-            .order('clock_in_time', desc=True)\
-            .execute()
+        settings = await guild_settings.get(server_id)
+        now_local = settings.now()
+        offset = settings.utc_offset(now_local)
         
-        embed = discord.Embed(
-            title="📊 Attendance Report",
-            description=f"Attendance data for **{ctx.guild.name}** (Last {days} days)",
-            color=discord.Color.blue(),
-            timestamp=datetime.datetime.utcnow()
+        # Find and close the open session in a single request
+        result = await database.clock_out(
+            server_id,
+            ctx.author.id,
+            now_local.astimezone(datetime.timezone.utc).isoformat(),
+            CLOCKOUT_MAX_HOURS
         )
+        if not result:
+            raise Exception("No response from the database")
         
-        if not response.data:
-            embed.add_field(
-                name="🚨 No Data",
-                value=f"No attendance records found for the last {days} days.",
-                inline=False
+        membership = Membership(result['user_id'], result['username'], result['status'] not in ('not_registered', 'not_member'))
+        membership_cache.set(membership_key, membership)
+        
+        if not membership.is_member:
+            await ctx.send(embed=not_registered_embed(ctx, membership, "❌ Clock-out Failed"))
+            return
+        
+        if result['status'] == 'not_clocked_in':
+            embed = discord.Embed(
+                title="⚠️ Not Clocked In",
+                description=f"You have no open attendance to clock out from. Use `{BOT_PREFIX}clockin` first.",
+                color=discord.Color.orange(),
+                timestamp=datetime.datetime.utcnow()
             )
-        else:
-            # Group by date
-            daily_stats = {}
-            total_unique_users = set()
-            
-            for record in response.data:
-                try:
-                    clock_time = datetime.datetime.fromisoformat(record['clock_in_time'].replace('Z', '+00:00'))
-                    date_key = clock_time.date()
-                    
-                    if date_key not in daily_stats:
-                        daily_stats[date_key] = {
-                            'count': 0,
-                            'users': [],
-                            'with_images': 0
-                        }
-                    
-                    daily_stats[date_key]['count'] += 1
-                    daily_stats[date_key]['users'].append(record['users']['username'])
-                    total_unique_users.add(record['users']['username'])
-                    
-                    if record.get('image_url'):
-                        daily_stats[date_key]['with_images'] += 1
-                        
-                except Exception as e:
-                    continue
-            
-            # Summary statistics
-            total_clock_ins = len(response.data)
-            unique_users_count = len(total_unique_users)
-            days_with_activity = len(daily_stats)
+        
+        elif result['status'] == 'ok':
+            clock_in_time = datetime.datetime.fromisoformat(result['clock_in_time'].replace('Z', '+00:00'))
+            clock_out_time = datetime.datetime.fromisoformat(result['clock_out_time'].replace('Z', '+00:00'))
             
-            embed.add_field(
-                name="📊 Summary Statistics",
-                value=f"**Total Clock-ins:** {total_clock_ins}\n**Unique Users:** {unique_users_count}\n**Active Days:** {days_with_activity}/{days}",
-                inline=False
+            embed = discord.Embed(
+                title="👋 Clock-out Successful",
+                description=f"**{membership.username}** has clocked out!",
+                color=discord.Color.green(),
+                timestamp=datetime.datetime.utcnow()
             )
-            
-            # Daily breakdown (show last 7 days max in embed)
-            sorted_dates = sorted(daily_stats.keys(), reverse=True)
-            display_dates = sorted_dates[:7]  # Show only last 7 days in embed
-            
-            daily_breakdown = []
-            for date in display_dates:
-                stats = daily_stats[date]
-                date_str = date.strftime("%Y-%m-%d (%a)")
-                users_str = ", ".join(stats['users'][:5])  # Show first 5 users
-                if len(stats['users']) > 5:
-                    users_str += f" +{len(stats['users']) - 5} more"
-                
-                image_info = f" (📷{stats['with_images']})" if stats['with_images'] > 0 else ""
-                daily_breakdown.append(f"**{date_str}:** {stats['count']} clock-ins{image_info}\n{users_str}")
-            
-            if daily_breakdown:
+            embed.add_field(name="👤 User", value=ctx.author.mention, inline=True)
+            embed.add_field(name=f"🟢 Clock-in ({offset})", value=clock_in_time.astimezone(settings.tz).strftime("%Y-%m-%d %H:%M:%S"), inline=True)
+            embed.add_field(name=f"🔴 Clock-out ({offset})", value=clock_out_time.astimezone(settings.tz).strftime("%Y-%m-%d %H:%M:%S"), inline=True)
+            embed.add_field(name="⏱️ Worked", value=format_duration((clock_out_time - clock_in_time).total_seconds()), inline=True)
+        
+        else:
+            embed = discord.Embed(
+                title="❌ Clock-out Failed",
+                description="Failed to record your clock-out. Please try again.",
+                color=discord.Color.red(),
+                timestamp=datetime.datetime.utcnow()
+            )
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Clock-out Error",
+            description=f"An error occurred during clock-out: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='hours')
+async def hours(ctx):
+    """Show your worked hours per day of this week"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        membership = await get_membership(server_id, ctx.guild.id, ctx.author.id)
+        if not membership.is_member:
+            await ctx.send(embed=not_registered_embed(ctx, membership, "❌ Not Registered"))
+            return
+        
+        # Weeks start on Monday, as in the database
+        today = (await guild_settings.get(server_id)).today()
+        week_start = today - datetime.timedelta(days=today.weekday())
+        rows = await database.worked_hours(server_id, week_start.isoformat(), today.isoformat(), 'day', membership.user_id)
+        
+        embed = discord.Embed(
+            title="⏱️ Worked Hours - This Week",
+            description=f"**{membership.username}** in **{ctx.guild.name}**",
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        if not rows:
+            embed.add_field(name="🚨 No Data", value="You have not clocked in this week.", inline=False)
+        else:
+            lines = []
+            for row in rows:
+                date_str = datetime.date.fromisoformat(row['period_start']).strftime("%Y-%m-%d (%a)")
+                if row['open_sessions']:
+                    status = " - 🟢 still clocked in"
+                elif row['missed_clock_outs']:
+                    status = " - ⚠️ no clock-out"
+                else:
+                    status = ""
+                lines.append(f"**{date_str}**: {format_duration(row['worked_seconds'])}{status}")
+            embed.add_field(name="📅 Daily", value="\n".join(lines), inline=False)
+            embed.add_field(name="📊 Total", value=format_duration(sum(row['worked_seconds'] for row in rows)), inline=True)
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Error",
+            description=f"An error occurred while loading your hours: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='hoursreport')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def hours_report(ctx, weeks: int = 1):
+    """Show the worked hours of every member per week"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        weeks = max(1, min(weeks, ATTENDANCE_REPORT_MAX_DAYS // 7))
+        today = (await guild_settings.get(server_id)).today()
+        start_date = today - datetime.timedelta(days=today.weekday() + 7 * (weeks - 1))
+        
+        # One aggregated query for the whole server
+        rows = await database.worked_hours(server_id, start_date.isoformat(), today.isoformat(), 'week')
+        
+        embed = discord.Embed(
+            title="⏱️ Worked Hours Report",
+            description=f"Worked hours per member in **{ctx.guild.name}** (Last {weeks} week{'s' if weeks > 1 else ''})",
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        if not rows:
+            embed.add_field(name="🚨 No Data", value="No attendance in this period.", inline=False)
+        else:
+            by_week = {}
+            for row in rows:
+                by_week.setdefault(row['period_start'], []).append(row)
+            # Most recent weeks first; embeds hold at most 25 fields
+            for week_start in sorted(by_week, reverse=True)[:25]:
+                lines = []
+                for row in by_week[week_start]:
+                    missed = f" ⚠️ {row['missed_clock_outs']} without clock-out" if row['missed_clock_outs'] else ""
+                    line = f"**{row['username']}**: {format_duration(row['worked_seconds'])} ({row['sessions']} days){missed}"
+                    # Embed field values are limited to 1024 characters
+                    if sum(len(l) + 1 for l in lines) + len(line) > 1024:
+                        break
+                    lines.append(line)
+                embed.add_field(name=f"📅 Week of {week_start}", value="\n".join(lines), inline=False)
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Error",
+            description=f"An error occurred while generating the hours report: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='attendance')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def attendance_report(ctx, days: int = 7):
+    """Show attendance report for the server"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+
+        # Limit days to reasonable range
+        if days < 1:
+            days = 1
+        elif days > ATTENDANCE_REPORT_MAX_DAYS:
+            days = ATTENDANCE_REPORT_MAX_DAYS
+        
+        # Get attendance data for the specified period (Jakarta calendar days)
+        today = (await guild_settings.get(server_id)).today()
+        start_date = today - datetime.timedelta(days=days - 1)
+        
+        # Aggregated per day in the database, only the numbers come back
+        report = await database.attendance_report(server_id, start_date.isoformat(), today.isoformat())
+        
+        embed = discord.Embed(
+            title="📊 Attendance Report",
+            description=f"Attendance data for **{ctx.guild.name}** (Last {days} days)",
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        if not report or not report['total_clock_ins']:
+            embed.add_field(
+                name="🚨 No Data",
+                value=f"No attendance records found for the last {days} days.",
+                inline=False
+            )
+        else:
+            # Summary statistics
+            embed.add_field(
+                name="📊 Summary Statistics",
+                value=f"**Total Clock-ins:** {report['total_clock_ins']}\n**Unique Users:** {report['unique_users']}\n**Active Days:** {report['active_days']}/{days}",
+                inline=False
+            )
+            
+            # Re-used images found by the perceptual hash check
+            if report['flagged_images']:
+                embed.add_field(
+                    name="🚩 Suspicious Images",
+                    value=f"{report['flagged_images']} clock-ins re-used an earlier image. Use `{BOT_PREFIX}suspicious {days}` to review them.",
+                    inline=False
+                )
+            
+            # Daily breakdown (the last 7 active days)
+            daily_breakdown = []
+            for stats in report['daily']:
+                date_str = datetime.date.fromisoformat(stats['date']).strftime("%Y-%m-%d (%a)")
+                users_str = ", ".join(stats['usernames'])  # First 5 users
+                if stats['clock_ins'] > len(stats['usernames']):
+                    users_str += f" +{stats['clock_ins'] - len(stats['usernames'])} more"
+                
+                image_info = f" (📷{stats['with_images']})" if stats['with_images'] > 0 else ""
+                daily_breakdown.append(f"**{date_str}:** {stats['clock_ins']} clock-ins{image_info}\n{users_str}")
+            
+            if daily_breakdown:
                 embed.add_field(
                     name="📅 Daily Breakdown",
                     value="\n\n".join(daily_breakdown),
@@ -724,14 +1368,9 @@ async def attendance_report(ctx, days: int = 7):
                 )
             
             # Most active users
-            user_counts = {}
-            for record in response.data:
-                username = record['users']['username']
-                user_counts[username] = user_counts.get(username, 0) + 1
-            
-            top_users = sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+            top_users = report['top_users']
             if top_users:
-                top_users_str = "\n".join([f"{i+1}. **{user}** - {count} times" for i, (user, count) in enumerate(top_users)])
+                top_users_str = "\n".join([f"{i+1}. **{user['username']}** - {user['clock_ins']} times" for i, user in enumerate(top_users)])
                 embed.add_field(
                     name="🏆 Most Active Users",
                     value=top_users_str,
@@ -749,13 +1388,467 @@ async def attendance_report(ctx, days: int = 7):
     embed.set_footer(text=f"Requested by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='ping')
+@bot.hybrid_command(name='export')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(start="First day, YYYY-MM-DD (default: 30 days ago)", end="Last day, YYYY-MM-DD (default: today)", file_format="csv or parquet")
+async def export(ctx, start: str = None, end: str = None, file_format: str = None):
+    """Export attendance between two dates as CSV or Parquet files"""
+    # Prefix arguments may come in any order, e.g. `export parquet` or `export 2024-01-01 csv`
+    args = [arg for arg in (start, end, file_format) if arg]
+    file_format = 'csv'
+    dates = []
+    for arg in args:
+        if arg.lower() in attendance_export.FORMATS:
+            file_format = arg.lower()
+            continue
+        try:
+            dates.append(datetime.date.fromisoformat(arg))
+        except ValueError:
+            await ctx.send(f"❌ Invalid argument `{arg}`! Use `{BOT_PREFIX}export [from] [to] [csv|parquet]` with dates as YYYY-MM-DD.")
+            return
+    if len(dates) > 2:
+        await ctx.send(f"❌ Too many dates! Use `{BOT_PREFIX}export [from] [to] [csv|parquet]`.")
+        return
+    if file_format == 'parquet' and not attendance_export.parquet_available():
+        await ctx.send("❌ Parquet export is not available on this bot (pyarrow is not installed). Use `csv` instead.")
+        return
+    
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        settings = await guild_settings.get(server_id)
+        end_date = dates[1] if len(dates) == 2 else settings.today()
+        start_date = dates[0] if dates else end_date - datetime.timedelta(days=29)
+        if start_date > end_date:
+            await ctx.send("❌ The start date must not be after the end date.")
+            return
+        if (end_date - start_date).days + 1 > EXPORT_MAX_DAYS:
+            await ctx.send(f"❌ Exports are limited to {EXPORT_MAX_DAYS} days.")
+            return
+        
+        status = await ctx.send(f"⏳ Exporting attendance from **{start_date}** to **{end_date}** as {file_format.upper()}...")
+        # Parts stay safely below the upload limit, which includes request overhead
+        max_bytes = int(min(EXPORT_MAX_FILE_BYTES, ctx.guild.filesize_limit) * 0.95)
+        name = f"attendance_{ctx.guild.id}_{start_date}_{end_date}"
+        
+        with tempfile.TemporaryDirectory(prefix='export-') as directory:
+            paths, rows = await attendance_export.export_attendance(
+                server_id, start_date.isoformat(), end_date.isoformat(), settings,
+                file_format, directory, name, max_bytes
+            )
+            
+            if not rows:
+                await status.edit(content=f"📭 No attendance from **{start_date}** to **{end_date}**.")
+                return
+            
+            for number, path in enumerate(paths, start=1):
+                part = f" (part {number}/{len(paths)})" if len(paths) > 1 else ""
+                await ctx.send(content=f"📦 Attendance export{part}", file=discord.File(path))
+        
+        await status.edit(content=f"✅ Exported **{rows}** attendance records from **{start_date}** to **{end_date}** ({settings.timezone}).")
+    
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred while exporting attendance: {str(e)}")
+
+LEADERBOARD_PERIODS = {'week': "This Week", 'month': "This Month", 'all': "All Time"}
+
+@bot.hybrid_command(name='leaderboard')
+async def leaderboard(ctx, period: str = 'month'):
+    """Show the users with the most attendance points"""
+    try:
+        period = period.lower()
+        if period not in LEADERBOARD_PERIODS:
+            await ctx.send(f"❌ Unknown period! Use one of: {', '.join(f'`{p}`' for p in LEADERBOARD_PERIODS)}")
+            return
+        
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        # Weeks start on Monday, as in the database
+        today = (await guild_settings.get(server_id)).today()
+        if period == 'week':
+            period_start = today - datetime.timedelta(days=today.weekday())
+        elif period == 'month':
+            period_start = today.replace(day=1)
+        else:
+            period_start = None
+        
+        rows = await database.leaderboard(server_id, period, period_start.isoformat() if period_start else None, LEADERBOARD_SIZE)
+        
+        embed = discord.Embed(
+            title=f"🏆 Leaderboard - {LEADERBOARD_PERIODS[period]}",
+            description=f"Attendance points in **{ctx.guild.name}**",
+            color=discord.Color.gold(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        if not rows:
+            embed.add_field(name="🚨 No Data", value="Nobody has earned points in this period yet.", inline=False)
+        else:
+            medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+            lines = []
+            for row in rows:
+                rank = medals.get(row['rank'], f"{row['rank']}.")
+                streak = f" | 🔥 {row['streak']}" if row['streak'] > 1 else ""
+                lines.append(f"{rank} **{row['username']}** - {row['points']} pts ({row['clock_ins']} clock-ins){streak}")
+            embed.add_field(name="📋 Ranking", value="\n".join(lines), inline=False)
+            embed.add_field(
+                name="ℹ️ Points",
+                value=f"On time: {POINTS_ON_TIME} | Almost late: {POINTS_ALMOST_LATE} | Late: {POINTS_LATE}\n🔥 Clock-ins in a row without being late",
+                inline=False
+            )
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Error",
+            description=f"An error occurred while loading the leaderboard: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_group(name='reminder', fallback='list', invoke_without_command=True)
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def reminder(ctx):
+    """List the clock-in reminders of this server"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        rows = await database.list_reminders([server_id])
+        settings = await guild_settings.get(server_id)
+        
+        embed = discord.Embed(
+            title="⏰ Clock-in Reminders",
+            description=f"Members who have not clocked in yet are reminded at these times ({settings.timezone})",
+            color=discord.Color.blue(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        if not rows:
+            embed.add_field(name="📭 No Reminders", value=f"Add one with `{BOT_PREFIX}reminder add HH:MM [#channel]`", inline=False)
+        else:
+            lines = [
+                f"**{row['remind_at'][:5]}** - " + (f"ping in <#{row['channel_id']}>" if row['channel_id'] else "DM")
+                for row in rows
+            ]
+            embed.add_field(name="📋 Reminders", value="\n".join(lines), inline=False)
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Error",
+            description=f"An error occurred while listing reminders: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+def parse_time_of_day(value: str):
+    """Parse HH:MM, returning None when invalid"""
+    try:
+        return datetime.datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        return None
+
+@reminder.command(name='add')
+@commands.has_permissions(administrator=True)
+async def reminder_add(ctx, time: str, channel: discord.TextChannel = None):
+    """Remind members who have not clocked in at a daily time, by DM or in a channel"""
+    remind_at = parse_time_of_day(time)
+    if remind_at is None:
+        await ctx.send(f"❌ Invalid time! Use HH:MM, for example `{BOT_PREFIX}reminder add 08:30`.")
+        return
+    
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        row = await database.upsert_reminder(server_id, remind_at.isoformat(), channel.id if channel else None, ctx.author.id)
+        if not row:
+            raise Exception("Failed to save reminder")
+        await reminders.add(row, ctx.guild.id)
+        settings = await guild_settings.get(server_id)
+        
+        where = f"with a ping in {channel.mention}" if channel else "by DM"
+        await ctx.send(f"✅ Members who have not clocked in will be reminded {where} every day at **{remind_at.strftime('%H:%M')}** ({settings.timezone}).")
+    
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred while adding the reminder: {str(e)}")
+
+@reminder.command(name='remove')
+@commands.has_permissions(administrator=True)
+async def reminder_remove(ctx, time: str):
+    """Remove the reminder at a daily time"""
+    remind_at = parse_time_of_day(time)
+    if remind_at is None:
+        await ctx.send(f"❌ Invalid time! Use HH:MM, for example `{BOT_PREFIX}reminder remove 08:30`.")
+        return
+    
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        row = await database.delete_reminder(server_id, remind_at.isoformat())
+        if not row:
+            await ctx.send(f"❌ There is no reminder at **{remind_at.strftime('%H:%M')}**.")
+            return
+        reminders.remove(row)
+        await ctx.send(f"✅ Removed the reminder at **{remind_at.strftime('%H:%M')}**.")
+    
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred while removing the reminder: {str(e)}")
+
+def settings_embed(ctx, settings: GuildSettings, title: str):
+    """Build the embed describing a server's work schedule"""
+    embed = discord.Embed(
+        title=title,
+        description=f"Work schedule of **{ctx.guild.name}**",
+        color=discord.Color.blue(),
+        timestamp=datetime.datetime.utcnow()
+    )
+    embed.add_field(name="🌏 Timezone", value=f"{settings.timezone} ({settings.utc_offset()})", inline=False)
+    embed.add_field(name="🟢 Earliest Clock-in", value=settings.earliest_time.strftime('%H:%M'), inline=True)
+    embed.add_field(name="🟠 Almost Late From", value=settings.almost_late_time.strftime('%H:%M'), inline=True)
+    embed.add_field(name="🔴 Late After", value=settings.late_time.strftime('%H:%M'), inline=True)
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    return embed
+
+@bot.hybrid_group(name='settings', fallback='show', invoke_without_command=True)
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def server_settings(ctx):
+    """Show the work schedule of this server"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        await ctx.send(embed=settings_embed(ctx, await guild_settings.get(server_id), "⚙️ Server Settings"))
+    
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred while loading the settings: {str(e)}")
+
+async def update_settings(ctx, **changes):
+    """Validate and save changed settings, then drop the cached copy"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        current = await guild_settings.get(server_id)
+        try:
+            updated = GuildSettings.build(**{
+                'timezone': current.timezone,
+                'earliest_time': current.earliest_time,
+                'almost_late_time': current.almost_late_time,
+                'late_time': current.late_time,
+                **changes
+            })
+        except ValueError as e:
+            await ctx.send(f"❌ {str(e)}")
+            return
+        
+        row = await database.upsert_guild_settings(server_id, {
+            'timezone': updated.timezone,
+            'earliest_time': updated.earliest_time.isoformat(),
+            'almost_late_time': updated.almost_late_time.isoformat(),
+            'late_time': updated.late_time.isoformat()
+        }, ctx.author.id)
+        if not row:
+            raise Exception("Failed to save settings")
+        
+        guild_settings.invalidate(server_id)
+        if updated.timezone != current.timezone:
+            # The local day and reminder times move with the timezone
+            today_counter.discard(server_id)
+            await reminders.reschedule_server(server_id)
+        
+        await ctx.send(embed=settings_embed(ctx, await guild_settings.get(server_id), "✅ Settings Updated"))
+    
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred while saving the settings: {str(e)}")
+
+@server_settings.command(name='timezone')
+@commands.has_permissions(administrator=True)
+async def settings_timezone(ctx, timezone: str):
+    """Set the timezone of this server, e.g. Asia/Makassar"""
+    await update_settings(ctx, timezone=timezone)
+
+async def update_settings_time(ctx, field: str, value: str, example: str):
+    """Parse an HH:MM argument and save it as one of the schedule times"""
+    time_of_day = parse_time_of_day(value)
+    if time_of_day is None:
+        await ctx.send(f"❌ Invalid time! Use HH:MM, for example `{BOT_PREFIX}settings {example}`.")
+        return
+    await update_settings(ctx, **{field: time_of_day})
+
+@server_settings.command(name='earliest')
+@commands.has_permissions(administrator=True)
+async def settings_earliest(ctx, time: str):
+    """Set the earliest time members can clock in"""
+    await update_settings_time(ctx, 'earliest_time', time, 'earliest 07:30')
+
+@server_settings.command(name='almostlate')
+@commands.has_permissions(administrator=True)
+async def settings_almost_late(ctx, time: str):
+    """Set the time from which clock-ins count as almost late"""
+    await update_settings_time(ctx, 'almost_late_time', time, 'almostlate 08:45')
+
+@server_settings.command(name='late')
+@commands.has_permissions(administrator=True)
+async def settings_late(ctx, time: str):
+    """Set the time after which clock-ins count as late"""
+    await update_settings_time(ctx, 'late_time', time, 'late 09:00')
+
+@server_settings.command(name='reload')
+@commands.has_permissions(administrator=True)
+async def settings_reload(ctx):
+    """Read the settings again after they were changed in Supabase"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        guild_settings.invalidate(server_id)
+        today_counter.discard(server_id)
+        await reminders.reschedule_server(server_id)
+        await ctx.send(embed=settings_embed(ctx, await guild_settings.get(server_id), "🔄 Settings Reloaded"))
+    
+    except Exception as e:
+        await ctx.send(f"❌ An error occurred while reloading the settings: {str(e)}")
+
+@bot.hybrid_command(name='suspicious')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def suspicious(ctx, days: int = 30):
+    """List clock-ins whose image looks like an earlier one of the same user"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        days = max(1, min(days, ATTENDANCE_REPORT_MAX_DAYS))
+        today = (await guild_settings.get(server_id)).today()
+        since = today - datetime.timedelta(days=days - 1)
+        
+        rows = await database.suspicious_clock_ins(server_id, since.isoformat())
+        
+        embed = discord.Embed(
+            title="🚩 Suspicious Clock-ins",
+            description=f"Clock-in images in **{ctx.guild.name}** that look like an earlier image of the same user (Last {days} days)",
+            color=discord.Color.orange(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        if not rows:
+            embed.add_field(name="✅ Nothing Found", value="No re-used images found.", inline=False)
+        else:
+            lines = []
+            for row in rows:
+                # Distance 0 is the same picture, higher values are closer to a lookalike
+                similarity = "same image" if row['image_distance'] == 0 else f"{row['image_distance']} bits apart"
+                line = f"**{row['attendance_date']}** - **{row['username']}**: like {row['similar_to_date']} ({similarity}) [image]({row['image_url']})"
+                # Embed field values are limited to 1024 characters
+                if sum(len(l) + 1 for l in lines) + len(line) > 1024:
+                    break
+                lines.append(line)
+            embed.add_field(name=f"📋 Flagged ({len(rows)})", value="\n".join(lines), inline=False)
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Error",
+            description=f"An error occurred while listing suspicious clock-ins: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='unsaved')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def unsaved(ctx, days: int = 7):
+    """List acknowledged clock-ins that could not be saved to Supabase"""
+    try:
+        # Ensure server is registered first
+        server_id = await ensure_server_registered(ctx.guild)
+        if not server_id:
+            raise Exception("Failed to register server")
+        
+        days = max(1, min(days, REJECTED_RETENTION_DAYS))
+        settings = await guild_settings.get(server_id)
+        since = settings.today() - datetime.timedelta(days=days - 1)
+        
+        rows = await clockin_queue.rejected(server_id, since.isoformat()) if CLOCKIN_WRITE_BEHIND else []
+        
+        embed = discord.Embed(
+            title="📥 Unsaved Clock-ins",
+            description=f"Clock-ins in **{ctx.guild.name}** that were confirmed but could not be saved (Last {days} days)",
+            color=discord.Color.orange(),
+            timestamp=datetime.datetime.utcnow()
+        )
+        
+        if not rows:
+            embed.add_field(name="✅ Nothing Found", value="Every confirmed clock-in was saved.", inline=False)
+        else:
+            users = await database.get_users({row['user_id'] for row in rows})
+            lines = []
+            for row in rows:
+                user = users.get(row['user_id'])
+                who = f"<@{user['discord_id']}>" if user else f"user {row['user_id']}"
+                clock_time = datetime.datetime.fromisoformat(row['clock_in_time']).astimezone(settings.tz).strftime("%H:%M")
+                # A conflict means another clock-in of that day was already stored and kept
+                reason = "already clocked in" if row['reject_reason'] == 'conflict' else row['reject_reason']
+                line = f"**{row['attendance_date']} {clock_time}** - {who}: {reason}"
+                if row['image_url']:
+                    line += f" [image]({row['image_url']})"
+                # Embed field values are limited to 1024 characters
+                if sum(len(l) + 1 for l in lines) + len(line) > 1024:
+                    break
+                lines.append(line)
+            embed.add_field(name=f"📋 Unsaved ({len(rows)})", value="\n".join(lines), inline=False)
+    
+    except Exception as e:
+        embed = discord.Embed(
+            title="❌ Error",
+            description=f"An error occurred while listing unsaved clock-ins: {str(e)}",
+            color=discord.Color.red(),
+            timestamp=datetime.datetime.utcnow()
+        )
+    
+    embed.set_footer(text=f"Requested by {ctx.author.name}")
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='ping')
 async def ping(ctx):
     """Test bot latency"""
-    latency = round(bot.latency * 1000)
+    # Latency of the shard serving this server, the average over all shards in DMs
+    shard = bot.get_shard(ctx.guild.shard_id) if ctx.guild else None
+    latency = round((shard.latency if shard else bot.latency) * 1000)
     await ctx.send(f'🏓 Pong! Latency: **{latency}ms**')
 
-@bot.command(name='info')
+@bot.hybrid_command(name='info')
 async def info(ctx):
     """Bot information and statistics"""
     embed = discord.Embed(
@@ -765,13 +1858,15 @@ async def info(ctx):
     )
     embed.add_field(name="Version", value=BOT_VERSION, inline=True)
     embed.add_field(name="Servers", value=len(bot.guilds), inline=True)
-    embed.add_field(name="Users", value=len(bot.users), inline=True)
+    embed.add_field(name="Members", value=sum(guild.member_count or 0 for guild in bot.guilds), inline=True)
+    if ctx.guild:
+        embed.add_field(name="Shard", value=f"{ctx.guild.shard_id + 1}/{bot.shard_count}", inline=True)
     embed.add_field(name="Prefix", value=BOT_PREFIX, inline=True)
     embed.add_field(name="Library", value="discord.py", inline=True)
     embed.set_footer(text=f"Requested by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='server')
+@bot.hybrid_command(name='server')
 async def server(ctx):
     """Server information"""
     guild = ctx.guild
@@ -780,7 +1875,7 @@ async def server(ctx):
         color=discord.Color.blue(),
         timestamp=datetime.datetime.utcnow()
     )
-    embed.add_field(name="Owner", value=guild.owner.mention, inline=True)
+    embed.add_field(name="Owner", value=f"<@{guild.owner_id}>", inline=True)
     embed.add_field(name="Members", value=guild.member_count, inline=True)
     embed.add_field(name="Created", value=guild.created_at.strftime("%Y-%m-%d"), inline=True)
     if guild.icon:
@@ -788,7 +1883,7 @@ async def server(ctx):
     embed.set_footer(text=f"Server ID: {guild.id}")
     await ctx.send(embed=embed)
 
-@bot.command(name='user')
+@bot.hybrid_command(name='user')
 async def user(ctx, member: discord.Member = None):
     """User information"""
     member = member or ctx.author
@@ -805,22 +1900,30 @@ async def user(ctx, member: discord.Member = None):
     embed.set_footer(text=f"User ID: {member.id}")
     await ctx.send(embed=embed)
 
-@bot.command(name='clear')
+@bot.hybrid_command(name='clear', extras={'ephemeral': True})
 @commands.has_permissions(manage_messages=True)
+@app_commands.default_permissions(manage_messages=True)
 async def clear(ctx, amount: int = 5):
     """Delete messages"""
-    await ctx.channel.purge(limit=amount + 1)
-    msg = await ctx.send(f'🗑️ Deleted {amount} messages.')
-    await asyncio.sleep(3)
-    await msg.delete()
+    # The command message of a prefix command is deleted too
+    await ctx.channel.purge(limit=amount + (0 if ctx.interaction else 1))
+    msg = await ctx.send(f'🗑️ Deleted {amount} messages.', ephemeral=True)
+    if ctx.interaction is None:
+        await asyncio.sleep(3)
+        await msg.delete()
 
-@bot.command(name='say')
+@bot.hybrid_command(name='say', extras={'ephemeral': True})
 async def say(ctx, *, message: str):
     """Make the bot say something"""
-    await ctx.message.delete()
-    await ctx.send(message)
+    if ctx.interaction is None:
+        await ctx.message.delete()
+        await ctx.send(message)
+    else:
+        # Slash commands have no message to delete; answer privately and post separately
+        await ctx.send("✅ Sent.", ephemeral=True)
+        await ctx.channel.send(message)
 
-@bot.command(name='embed')
+@bot.hybrid_command(name='embed')
 async def embed(ctx, title: str, *, description: str):
     """Create a custom embed"""
     embed = discord.Embed(
@@ -832,12 +1935,12 @@ async def embed(ctx, title: str, *, description: str):
     embed.set_footer(text=f"Created by {ctx.author.name}")
     await ctx.send(embed=embed)
 
-@bot.command(name='help')
+@bot.hybrid_command(name='help')
 async def help(ctx):
     """Show help message"""
     embed = discord.Embed(
         title=f"📚 {BOT_NAME} Commands",
-        description=f"Prefix: `{BOT_PREFIX}`",
+        description=f"Prefix: `{BOT_PREFIX}` - every command is also available as a `/` slash command",
         color=discord.Color.blue(),
         timestamp=datetime.datetime.utcnow()
     )
@@ -855,21 +1958,41 @@ async def help(ctx):
     
     # User Commands
     user_commands = [
-        f"`{BOT_PREFIX}clockin [notes]` - Clock in for attendance (image required)"
+        f"`{BOT_PREFIX}clockin [notes]` - Clock in for attendance (image required)",
+        f"`{BOT_PREFIX}clockout` - Clock out and see the time worked",
+        f"`{BOT_PREFIX}hours` - Show your worked hours this week",
+        f"`{BOT_PREFIX}leaderboard [week|month|all]` - Show attendance points ranking (default: month)"
     ]
     embed.add_field(name="👤 User Commands", value="\n".join(user_commands), inline=False)
     
     # Admin Commands
     admin_commands = [
         f"`{BOT_PREFIX}register [@user] [username]` - Register user",
+        f"`{BOT_PREFIX}registerrole @role` - Register every member of a role",
+        f"`{BOT_PREFIX}registerall` - Register every member of the server",
         f"`{BOT_PREFIX}unregister [@user]` - Unregister user",
         f"`{BOT_PREFIX}changeusername [@user] [new_username]` - Change username for a registered user",
         f"`{BOT_PREFIX}userlist` - List all registered users on this server",
         f"`{BOT_PREFIX}attendance [days]` - Show attendance report (default: 7 days)",
+        f"`{BOT_PREFIX}hoursreport [weeks]` - Show worked hours per member (default: this week)",
+        f"`{BOT_PREFIX}export [from] [to] [csv|parquet]` - Download attendance as a file (default: last 30 days, CSV)",
+        f"`{BOT_PREFIX}suspicious [days]` - List clock-ins re-using an earlier image (default: 30 days)",
+        f"`{BOT_PREFIX}unsaved [days]` - List confirmed clock-ins that could not be saved (default: 7 days)",
         f"`{BOT_PREFIX}clear [amount]` - Delete messages"
     ]
     embed.add_field(name="⚡ Admin Commands", value="\n".join(admin_commands), inline=False)
     
+    # Embed field values are limited to 1024 characters, so setup commands get their own
+    setup_commands = [
+        f"`{BOT_PREFIX}reminder` - List clock-in reminders",
+        f"`{BOT_PREFIX}reminder add HH:MM [#channel]` - Remind members who have not clocked in (DM, or ping in a channel)",
+        f"`{BOT_PREFIX}reminder remove HH:MM` - Remove a clock-in reminder",
+        f"`{BOT_PREFIX}settings` - Show the server's timezone and clock-in times",
+        f"`{BOT_PREFIX}settings timezone|earliest|almostlate|late <value>` - Change the schedule (e.g. `timezone Asia/Makassar`, `late 09:00`)",
+        f"`{BOT_PREFIX}settings reload` - Re-read settings changed in Supabase"
+    ]
+    embed.add_field(name="⚙️ Setup Commands", value="\n".join(setup_commands), inline=False)
+    
     embed.set_footer(text=f"Type {BOT_PREFIX}help to see this message")
     await ctx.send(embed=embed)
 
@@ -880,11 +2003,25 @@ async def main():
         print(f"📝 Bot Name: {BOT_NAME}")
         print(f"📌 Version: {BOT_VERSION}")
         print(f"⚡ Prefix: {BOT_PREFIX}")
+        if SHARD_IDS:
+            print(f"🧩 Shards: {SHARD_IDS[0]}-{SHARD_IDS[-1]} of {SHARD_COUNT}")
         await bot.start(DISCORD_TOKEN)
     except Exception as e:
         print(f"❌ Error starting bot: {e}")
     finally:
         await bot.close()
+        reconcile_today_counts.cancel()
+        close_stale_sessions.cancel()
+        await reminders.stop()
+        # Copied images are written into the queue, stop it last
+        if ATTACHMENT_STORE != 'none':
+            await attachment_pipeline.stop()
+        if CLOCKIN_WRITE_BEHIND:
+            await clockin_queue.stop()
+        if METRICS_PORT:
+            await metrics_server.stop()
+        watchdog.stop()
+        database.shutdown()
 
 if __name__ == "__main__":
     # Run the bot
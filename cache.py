@@ -0,0 +1,142 @@
+"""In-process caches in front of Supabase lookups"""
+import time
+from collections import OrderedDict, namedtuple
+from config import MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL, USERLIST_CACHE_TTL
+
+# Result of resolving a Discord user in a server. `user_id` is None when the
+# user is not registered at all, `is_member` is False when the user exists
+# but is not registered in that server.
+Membership = namedtuple('Membership', ['user_id', 'username', 'is_member'])
+
+class GuildCache:
+    """Maps Discord guild ids to the internal `servers.id`"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._server_ids = {}
+
+    def get(self, guild_id: int):
+        """Return the cached server id or None on a miss"""
+        server_id = self._server_ids.get(guild_id)
+        if server_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return server_id
+
+    def set(self, guild_id: int, server_id: int):
+        """Remember the server id of a guild"""
+        self._server_ids[guild_id] = server_id
+
+    def invalidate(self, guild_id: int):
+        """Forget a guild"""
+        self._server_ids.pop(guild_id, None)
+
+    def __len__(self):
+        return len(self._server_ids)
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Forget a single entry"""
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Forget every entry whose key matches `predicate`"""
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def stats(self):
+        """Return size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+class DailyCounter:
+    """Per-server number of people who clocked in on the current local day
+
+    Entries are keyed by date, so a count left over from yesterday reads as
+    a miss and is seeded again.
+    """
+
+    def __init__(self):
+        # server_id -> (attendance_date, count)
+        self._counts = {}
+
+    def get(self, server_id: int, attendance_date: str):
+        """Return the count or None when it is not known for that day"""
+        entry = self._counts.get(server_id)
+        if entry is None or entry[0] != attendance_date:
+            return None
+        return entry[1]
+
+    def set(self, server_id: int, attendance_date: str, count: int):
+        """Store the count of a server for a day"""
+        self._counts[server_id] = (attendance_date, count)
+
+    def increment(self, server_id: int, attendance_date: str):
+        """Count one more clock-in, returning the new count or None if unknown"""
+        count = self.get(server_id, attendance_date)
+        if count is None:
+            return None
+        self._counts[server_id] = (attendance_date, count + 1)
+        return count + 1
+
+    def entries(self):
+        """(server_id, attendance_date) of every known count"""
+        return [(server_id, day) for server_id, (day, _) in self._counts.items()]
+
+    def discard(self, server_id: int):
+        """Forget the count of a server"""
+        self._counts.pop(server_id, None)
+
+    def __len__(self):
+        return len(self._counts)
+
+# Shared by every command in this process
+guild_cache = GuildCache()
+
+# (guild_id, discord_id) -> Membership, including negative results
+membership_cache = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL)
+
+# (guild_id, cursor) -> page rows and (guild_id, 'total') -> registered count,
+# shared by userlist views so flipping between pages is cheap
+member_page_cache = TTLCache(1024, USERLIST_CACHE_TTL)
+
+# server_id -> today's clock-in count, shown on every successful clock-in
+today_counter = DailyCounter()
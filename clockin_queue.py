@@ -0,0 +1,449 @@
+"""Durable write-behind queue for clock-ins
+
+Clock-ins are acknowledged as soon as they are committed to a local SQLite
+file in WAL mode. A background task flushes them to Supabase in batches, so
+the reply to the user no longer waits on the database and nothing is lost
+while Supabase is slow or down. Every record carries a `client_ref`
+idempotency key, so retrying a flush never inserts a clock-in twice.
+
+A clock-in accepted while the day's stored clock-ins could not be loaded
+may turn out to duplicate one already in Supabase. Supabase keeps the
+stored one and the queued row is kept as 'rejected' for admins to review
+with `!oke unsaved`.
+"""
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import database
+from cache import today_counter
+from metrics import Counter
+from config import CLOCKIN_QUEUE_PATH, CLOCKIN_FLUSH_INTERVAL, CLOCKIN_FLUSH_BATCH_SIZE
+
+# Longest wait between flush attempts while Supabase keeps failing
+MAX_FLUSH_BACKOFF = 60
+
+# Seconds a clock-in waits for the day's clock-ins from Supabase before it is
+# answered from the local queue alone; the lookup carries on in the background
+SEED_TIMEOUT = 1.0
+# Seconds before a failed lookup is tried again, doubling up to MAX_SEED_BACKOFF
+SEED_BACKOFF = 5
+MAX_SEED_BACKOFF = 120
+
+# SQLSTATE classes of errors caused by the data of a row: data exceptions
+# (22) and integrity constraint violations (23), e.g. a deleted user
+ROW_ERROR_CLASSES = ('22', '23')
+
+# Days acknowledged clock-ins refused by Supabase are kept for `!oke unsaved`
+REJECTED_RETENTION_DAYS = 30
+
+# Columns filled in once the clock-in image has been copied, see attachments.py
+IMAGE_FIELDS = ('image_url', 'thumbnail_url', 'image_hash', 'similar_to_date', 'image_distance')
+
+SCHEMA = """
+create table if not exists pending_clock_ins (
+  client_ref text primary key,
+  server_id integer not null,
+  user_id integer not null,
+  attendance_date text not null,
+  clock_in_time text not null,
+  image_url text,
+  thumbnail_url text,
+  image_hash integer,
+  similar_to_date text,
+  image_distance integer,
+  notes text,
+  punctuality text,
+  points integer not null default 0,
+  status text not null default 'pending',
+  image_dirty integer not null default 0,
+  reject_reason text,
+  created_at real not null,
+  unique (server_id, user_id, attendance_date)
+);
+create index if not exists idx_pending_clock_ins_status on pending_clock_ins(status, created_at);
+"""
+
+rejected_clock_ins = Counter(
+    'okebot_clockins_rejected_total', 'Acknowledged clock-ins Supabase refused to store', ('reason',)
+)
+
+def refuses_rows(error: Exception):
+    """Whether the database refused the rows themselves, so retrying cannot succeed"""
+    # Errors without a JSON body carry the HTTP status as an int instead
+    return isinstance(error.code, str) and error.code[:2] in ROW_ERROR_CLASSES
+
+class ClockInQueue:
+    """Local duplicate guard and write-behind buffer for attendance rows"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending = 0
+        self._conn = None
+        # SQLite connections are bound to the thread that opened them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='clockin-queue')
+        # (server_id, attendance_date) -> {user_id: clock_in_time}
+        self._today = {}
+        self._seeded = set()
+        # (server_id, attendance_date) -> running lookup, and (retry_at, backoff) after a failed one
+        self._seeding = {}
+        self._seed_retry = {}
+        self._task = None
+        self._stopping = asyncio.Event()
+        # The flush loop and commands flushing on demand take turns
+        self._flush_lock = asyncio.Lock()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # Blocking SQLite helpers, only called on the queue thread
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("pragma journal_mode=wal")
+        # Acknowledged clock-ins must survive a crash or power loss
+        self._conn.execute("pragma synchronous=full")
+        self._conn.executescript(SCHEMA)
+        # Queue files created before images were stored
+        columns = {row['name'] for row in self._conn.execute("pragma table_info(pending_clock_ins)")}
+        for column, column_type in (
+            ('thumbnail_url', 'text'), ('image_hash', 'integer'), ('similar_to_date', 'text'),
+            ('image_distance', 'integer'), ('punctuality', 'text'), ('points', 'integer not null default 0')
+        ):
+            if column not in columns:
+                self._conn.execute(f"alter table pending_clock_ins add column {column} {column_type}")
+        if 'image_dirty' not in columns:
+            self._conn.execute("alter table pending_clock_ins add column image_dirty integer not null default 0")
+        if 'reject_reason' not in columns:
+            self._conn.execute("alter table pending_clock_ins add column reject_reason text")
+        return self._conn.execute(
+            "select count(*) from pending_clock_ins where status = 'pending'"
+        ).fetchone()[0]
+
+    def _insert(self, row: dict):
+        with self._conn:
+            self._conn.execute(
+                "insert into pending_clock_ins "
+                "(client_ref, server_id, user_id, attendance_date, clock_in_time, image_url, notes, punctuality, points, created_at) "
+                "values (:client_ref, :server_id, :user_id, :attendance_date, :clock_in_time, :image_url, :notes, :punctuality, :points, :created_at)",
+                row
+            )
+
+    def _local_day(self, server_id: int, attendance_date: str):
+        rows = self._conn.execute(
+            "select user_id, clock_in_time from pending_clock_ins "
+            "where server_id = ? and attendance_date = ? and status != 'rejected'",
+            (server_id, attendance_date)
+        ).fetchall()
+        return {row['user_id']: row['clock_in_time'] for row in rows}
+
+    def _has_pending(self, server_id: int, user_id: int):
+        return self._conn.execute(
+            "select 1 from pending_clock_ins where server_id = ? and user_id = ? and status = 'pending' limit 1",
+            (server_id, user_id)
+        ).fetchone() is not None
+
+    def _next_batch(self, limit: int):
+        rows = self._conn.execute(
+            f"select client_ref, server_id, user_id, clock_in_time, {', '.join(IMAGE_FIELDS)}, notes, punctuality, points "
+            "from pending_clock_ins where status = 'pending' order by created_at limit ?",
+            (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _mark(self, updates: list):
+        # A new image that arrived while the row was being flushed stays dirty
+        with self._conn:
+            self._conn.executemany(
+                "update pending_clock_ins set status = ?, reject_reason = ?, "
+                "image_dirty = case when image_url is ? then 0 else image_dirty end "
+                "where client_ref = ?",
+                updates
+            )
+
+    def _set_image(self, client_ref: str, image: dict):
+        assignments = ', '.join(f"{field} = :{field}" for field in IMAGE_FIELDS)
+        with self._conn:
+            return self._conn.execute(
+                f"update pending_clock_ins set {assignments}, image_dirty = 1 where client_ref = :client_ref",
+                {**{field: image.get(field) for field in IMAGE_FIELDS}, 'client_ref': client_ref}
+            ).rowcount
+
+    def _dirty_images(self):
+        rows = self._conn.execute(
+            f"select client_ref, {', '.join(IMAGE_FIELDS)} from pending_clock_ins "
+            "where image_dirty = 1 and status = 'flushed'"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _clear_dirty(self, client_ref: str, image_url: str):
+        with self._conn:
+            self._conn.execute(
+                "update pending_clock_ins set image_dirty = 0 where client_ref = ? and image_url is ?",
+                (client_ref, image_url)
+            )
+
+    def _pending_counts(self, attendance_date: str):
+        rows = self._conn.execute(
+            "select server_id, count(*) from pending_clock_ins "
+            "where status = 'pending' and attendance_date = ? group by server_id",
+            (attendance_date,)
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def _rejected(self, server_id: int, since_date: str):
+        rows = self._conn.execute(
+            "select user_id, attendance_date, clock_in_time, image_url, notes, reject_reason from pending_clock_ins "
+            "where server_id = ? and status = 'rejected' and attendance_date >= ? order by created_at",
+            (server_id, since_date)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _prune(self, before_date: str, rejected_before: str):
+        with self._conn:
+            self._conn.execute(
+                "delete from pending_clock_ins where status = 'flushed' and attendance_date < ? and image_dirty = 0",
+                (before_date,)
+            )
+            self._conn.execute(
+                "delete from pending_clock_ins where status = 'rejected' and attendance_date < ?",
+                (rejected_before,)
+            )
+
+    # Public API
+
+    async def start(self):
+        """Open the queue file and start the background flusher"""
+        self.pending = await self._run(self._open)
+        if self.pending:
+            print(f"📥 {self.pending} queued clock-ins waiting to be saved")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Flush what can be flushed and close the queue file"""
+        for task in list(self._seeding.values()):
+            task.cancel()
+        if self._task:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        if self._conn:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def _clock_ins_of_day(self, server_id: int, attendance_date: str):
+        """Known clock-ins of a server on a day, seeded from Supabase once"""
+        key = (server_id, attendance_date)
+        if key not in self._today:
+            # A new day started for this server, forget its previous ones. Local
+            # dates of servers in different timezones are at most a day apart,
+            # so anything older belongs to no server any more.
+            yesterday = (datetime.date.fromisoformat(attendance_date) - datetime.timedelta(days=1)).isoformat()
+            stale = [k for k in self._today if (k[0] == server_id and k[1] != attendance_date) or k[1] < yesterday]
+            for old_key in stale:
+                del self._today[old_key]
+                self._seeded.discard(old_key)
+                self._seed_retry.pop(old_key, None)
+            local = await self._run(self._local_day, server_id, attendance_date)
+            clock_ins = self._today.setdefault(key, {})
+            for user_id, clock_in_time in local.items():
+                clock_ins.setdefault(user_id, clock_in_time)
+
+        if key not in self._seeded:
+            task = self._seeding.get(key)
+            retry_at = self._seed_retry.get(key, (0, 0))[0]
+            if task is None and time.monotonic() >= retry_at:
+                task = self._seeding[key] = asyncio.create_task(self._seed(server_id, attendance_date))
+            if task is not None:
+                # A healthy database answers in time; during an outage the clock-in is
+                # accepted on local knowledge instead of waiting out timeouts and retries
+                await asyncio.wait({task}, timeout=SEED_TIMEOUT)
+        return self._today[key]
+
+    async def _seed(self, server_id: int, attendance_date: str):
+        """Add a day's clock-ins already stored in Supabase to the known ones"""
+        key = (server_id, attendance_date)
+        try:
+            stored = await database.clocked_in_today(server_id, attendance_date)
+        except Exception as e:
+            backoff = min(self._seed_retry.get(key, (0, SEED_BACKOFF / 2))[1] * 2, MAX_SEED_BACKOFF)
+            self._seed_retry[key] = (time.monotonic() + backoff, backoff)
+            print(f"Error loading today's clock-ins, retrying in {backoff:.0f}s: {e}")
+            return
+        finally:
+            self._seeding.pop(key, None)
+        clock_ins = self._today.get(key)
+        if clock_ins is None:
+            # The day was forgotten meanwhile
+            return
+        for user_id, clock_in_time in stored.items():
+            clock_ins.setdefault(user_id, clock_in_time)
+        self._seeded.add(key)
+        self._seed_retry.pop(key, None)
+        if today_counter.get(server_id, attendance_date) is None:
+            today_counter.set(server_id, attendance_date, len(clock_ins))
+
+    async def submit(self, server_id: int, user_id: int, attendance_date: str, clock_in_time: str, image_url: str, notes: str,
+                     punctuality: str = None, points: int = 0):
+        """Accept a clock-in unless the user already clocked in that day
+
+        Returns a dict with `status` ('ok' or 'already_clocked_in'),
+        `clock_in_time` and `client_ref`. Loading the day also seeds
+        `today_counter` for that server.
+        """
+        clock_ins = await self._clock_ins_of_day(server_id, attendance_date)
+
+        if user_id in clock_ins:
+            return {'status': 'already_clocked_in', 'clock_in_time': clock_ins[user_id], 'client_ref': None}
+
+        row = {
+            'client_ref': uuid.uuid4().hex,
+            'server_id': server_id,
+            'user_id': user_id,
+            'attendance_date': attendance_date,
+            'clock_in_time': clock_in_time,
+            'image_url': image_url,
+            'notes': notes,
+            'punctuality': punctuality,
+            'points': points,
+            'created_at': time.time()
+        }
+        try:
+            await self._run(self._insert, row)
+        except sqlite3.IntegrityError:
+            # A concurrent message of the same user won the race
+            return {'status': 'already_clocked_in', 'clock_in_time': clock_ins.get(user_id), 'client_ref': None}
+
+        clock_ins[user_id] = clock_in_time
+        self.pending += 1
+        return {'status': 'ok', 'clock_in_time': clock_in_time, 'client_ref': row['client_ref']}
+
+    async def set_image(self, client_ref: str, image: dict):
+        """Store the copied image of a queued clock-in (see IMAGE_FIELDS)
+
+        Rows already flushed are patched in Supabase by the next flush.
+        Returns False when the clock-in is not in the queue.
+        """
+        return await self._run(self._set_image, client_ref, image) > 0
+
+    async def user_ids_of_day(self, server_id: int, attendance_date: str):
+        """Users with a clock-in in the queue for a server and day"""
+        return set(await self._run(self._local_day, server_id, attendance_date))
+
+    async def has_pending(self, server_id: int, user_id: int):
+        """Whether a clock-in of the user is still waiting to be saved to Supabase"""
+        return await self._run(self._has_pending, server_id, user_id)
+
+    async def pending_counts(self, attendance_date: str):
+        """Get {server_id: clock-ins not yet saved to Supabase} for a day"""
+        return await self._run(self._pending_counts, attendance_date)
+
+    async def rejected(self, server_id: int, since_date: str):
+        """Acknowledged clock-ins of a server Supabase refused, oldest first
+
+        Each row has `user_id`, `attendance_date`, `clock_in_time`,
+        `image_url`, `notes` and `reject_reason` ('conflict' when the user
+        already had a stored clock-in that day, otherwise the error).
+        """
+        return await self._run(self._rejected, server_id, since_date)
+
+    async def _send(self, rows: list):
+        """Flush rows, isolating rows the database refuses outright
+
+        Only errors caused by the data of a row (see ROW_ERROR_CLASSES) drop
+        rows; outages, timeouts and server errors propagate so the whole
+        batch is retried later. A refused batch is split in halves until the
+        bad rows are found, so one bad row (for example a user deleted
+        meanwhile) cannot block the queue forever.
+        """
+        try:
+            return await database.flush_clock_ins(rows)
+        except database.APIError as e:
+            if not refuses_rows(e):
+                raise
+            if len(rows) == 1:
+                print(f"⚠️ Rejected queued clock-in {rows[0]['client_ref']}: {e}")
+                return {rows[0]['client_ref']: e.message or str(e)}
+        middle = len(rows) // 2
+        results = await self._send(rows[:middle])
+        results.update(await self._send(rows[middle:]))
+        return results
+
+    async def flush(self):
+        """Send queued clock-ins to Supabase until the queue is empty
+
+        Afterwards, patch the images of clock-ins saved before their image
+        was stored.
+        """
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        while True:
+            rows = await self._run(self._next_batch, CLOCKIN_FLUSH_BATCH_SIZE)
+            if not rows:
+                break
+
+            results = await self._send(rows)
+            updates = []
+            for row in rows:
+                status = results.get(row['client_ref'])
+                if status in ('inserted', 'duplicate'):
+                    updates.append(('flushed', None, row['image_url'], row['client_ref']))
+                elif status == 'conflict':
+                    # Acknowledged while the day's stored clock-ins were unknown; kept for `!oke unsaved`
+                    print(f"⚠️ Rejected queued clock-in {row['client_ref']}: user {row['user_id']} already clocked in that day")
+                    rejected_clock_ins.inc('conflict')
+                    updates.append(('rejected', 'conflict', row['image_url'], row['client_ref']))
+                elif status is not None:
+                    rejected_clock_ins.inc('invalid')
+                    updates.append(('rejected', status, row['image_url'], row['client_ref']))
+            await self._run(self._mark, updates)
+            self.pending = max(0, self.pending - len(updates))
+            if len(updates) < len(rows):
+                # The same rows would come back next time; retry them after a backoff
+                raise Exception(f"no flush result for {len(rows) - len(updates)} queued clock-ins")
+
+            if len(rows) < CLOCKIN_FLUSH_BATCH_SIZE:
+                break
+
+        # Images stored after their clock-in was already saved
+        for row in await self._run(self._dirty_images):
+            client_ref = row.pop('client_ref')
+            await database.update_attendance_image_by_ref(client_ref, row)
+            await self._run(self._clear_dirty, client_ref, row['image_url'])
+
+    async def _flush_loop(self):
+        delay = CLOCKIN_FLUSH_INTERVAL
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+                delay = CLOCKIN_FLUSH_INTERVAL
+                # Keep flushed rows for a day as part of the duplicate guard
+                oldest_kept = min((key[1] for key in self._today), default=None)
+                if oldest_kept:
+                    rejected_before = datetime.date.fromisoformat(oldest_kept) - datetime.timedelta(days=REJECTED_RETENTION_DAYS)
+                    await self._run(self._prune, oldest_kept, rejected_before.isoformat())
+            except Exception as e:
+                print(f"Error flushing queued clock-ins: {e}")
+                delay = min(delay * 2, MAX_FLUSH_BACKOFF)
+
+            if self._stopping.is_set():
+                return
+
+# Shared by every command in this process
+clockin_queue = ClockInQueue(CLOCKIN_QUEUE_PATH)
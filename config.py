@@ -13,10 +13,115 @@ if not DISCORD_TOKEN:
 BOT_PREFIX = os.getenv('BOT_PREFIX', '!oke ')  # Default: "!oke " (with space)
 BOT_NAME = os.getenv('BOT_NAME', 'OKEbot')
 BOT_VERSION = os.getenv('BOT_VERSION', '1.0.0')
+# Prefix commands need the privileged message content intent; with 'false' slash commands and
+# commands mentioning the bot ("@OKEbot clockin") are served
+PREFIX_COMMANDS = os.getenv('PREFIX_COMMANDS', 'true').lower() == 'true'
+# Where slash commands are registered at startup: 'guild' (every server, available at once), 'global' or 'off'
+SLASH_COMMAND_SYNC = os.getenv('SLASH_COMMAND_SYNC', 'guild').lower()
+
+# Sharding: total shards (empty: Discord's recommendation) and the shards this process connects
+# (empty: all of them). launcher.py runs SHARD_WORKERS processes and sets SHARD_IDS for each
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '1'))
+if SHARD_IDS and SHARD_COUNT is None:
+    raise ValueError("SHARD_IDS requires SHARD_COUNT")
 
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
 if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Supabase configuration not found in environment variables")
\ No newline at end of file
+    raise ValueError("Supabase configuration not found in environment variables")
+
+# Database access settings
+# Maximum number of Supabase requests running at the same time
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', '16'))
+# HTTP connection pool, sized so every concurrent request keeps a warm connection
+DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', str(DB_MAX_CONCURRENCY)))
+# Seconds an idle connection is kept open, long enough to span the morning clock-in burst
+DB_KEEPALIVE_EXPIRY = float(os.getenv('DB_KEEPALIVE_EXPIRY', '120'))
+# Per-request timeouts in seconds
+DB_CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+DB_READ_TIMEOUT = float(os.getenv('DB_READ_TIMEOUT', '10'))
+# Retries of idempotent reads after connection errors, with jittered backoff starting at DB_RETRY_BACKOFF seconds
+DB_READ_RETRIES = int(os.getenv('DB_READ_RETRIES', '2'))
+DB_RETRY_BACKOFF = float(os.getenv('DB_RETRY_BACKOFF', '0.25'))
+# Per-server rate limit: requests per second and burst size, calls over the limit wait their turn
+DB_GUILD_RATE = float(os.getenv('DB_GUILD_RATE', '20'))
+DB_GUILD_BURST = int(os.getenv('DB_GUILD_BURST', '40'))
+
+# Discord members kept in memory: 'none' (members come with each command and are fetched when
+# needed), 'joined' (also members who join while the bot runs) or 'full' (every member, downloaded at startup)
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'none').lower()
+
+# Membership cache: maximum entries and seconds before an entry is re-read
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', '10000'))
+MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', '600'))
+
+# Longest period (in days) accepted by the attendance report
+ATTENDANCE_REPORT_MAX_DAYS = int(os.getenv('ATTENDANCE_REPORT_MAX_DAYS', '366'))
+
+# Userlist pagination: seconds a fetched page stays cached and the buttons stay active
+USERLIST_CACHE_TTL = float(os.getenv('USERLIST_CACHE_TTL', '60'))
+USERLIST_VIEW_TIMEOUT = float(os.getenv('USERLIST_VIEW_TIMEOUT', '300'))
+
+# Attendance exports: longest period (in days), rows read per request and exports running at once
+EXPORT_MAX_DAYS = int(os.getenv('EXPORT_MAX_DAYS', '366'))
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+EXPORT_CONCURRENCY = int(os.getenv('EXPORT_CONCURRENCY', '2'))
+# Largest export file uploaded; the server's own upload limit applies when it is lower
+EXPORT_MAX_FILE_BYTES = int(os.getenv('EXPORT_MAX_FILE_BYTES', str(10 * 1024 * 1024)))
+
+# Write-behind clock-ins: acknowledge from a local SQLite queue and save to Supabase in the background
+CLOCKIN_WRITE_BEHIND = os.getenv('CLOCKIN_WRITE_BEHIND', 'true').lower() == 'true'
+CLOCKIN_QUEUE_PATH = os.getenv('CLOCKIN_QUEUE_PATH', 'data/clockin_queue.db')
+# Seconds between flushes and clock-ins sent per flush request
+CLOCKIN_FLUSH_INTERVAL = float(os.getenv('CLOCKIN_FLUSH_INTERVAL', '2'))
+CLOCKIN_FLUSH_BATCH_SIZE = int(os.getenv('CLOCKIN_FLUSH_BATCH_SIZE', '100'))
+
+# Sessions without a clock-out are closed after this many hours, checked every CLOCKOUT_SWEEP_INTERVAL seconds
+CLOCKOUT_MAX_HOURS = float(os.getenv('CLOCKOUT_MAX_HOURS', '16'))
+CLOCKOUT_SWEEP_INTERVAL = float(os.getenv('CLOCKOUT_SWEEP_INTERVAL', '600'))
+
+# Clock-in images are copied out of Discord's expiring CDN: 'supabase' (Storage bucket), 'local' or 'none'
+ATTACHMENT_STORE = os.getenv('ATTACHMENT_STORE', 'supabase').lower()
+ATTACHMENT_BUCKET = os.getenv('ATTACHMENT_BUCKET', 'attendance-images')
+# Directory of the local store and optional base URL it is served from
+ATTACHMENT_LOCAL_PATH = os.getenv('ATTACHMENT_LOCAL_PATH', 'data/attachments')
+ATTACHMENT_LOCAL_URL = os.getenv('ATTACHMENT_LOCAL_URL')
+# Largest image copied (bytes), images copied at the same time, images waiting and download timeout (seconds)
+ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', str(8 * 1024 * 1024)))
+ATTACHMENT_CONCURRENCY = int(os.getenv('ATTACHMENT_CONCURRENCY', '4'))
+ATTACHMENT_QUEUE_SIZE = int(os.getenv('ATTACHMENT_QUEUE_SIZE', '500'))
+ATTACHMENT_TIMEOUT = float(os.getenv('ATTACHMENT_TIMEOUT', '30'))
+# Longest side of stored thumbnails in pixels
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '320'))
+# Clock-in images whose perceptual hash is at most this many bits (0-7) from one
+# of the same user's images of the last IMAGE_HASH_HISTORY_DAYS days are flagged
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv('IMAGE_HASH_MAX_DISTANCE', '6'))
+IMAGE_HASH_HISTORY_DAYS = int(os.getenv('IMAGE_HASH_HISTORY_DAYS', '365'))
+
+# Points earned by an on-time, almost late and late clock-in (thresholds are set per server
+# with `!oke settings`), and users shown on the leaderboard
+POINTS_ON_TIME = int(os.getenv('POINTS_ON_TIME', '10'))
+POINTS_ALMOST_LATE = int(os.getenv('POINTS_ALMOST_LATE', '7'))
+POINTS_LATE = int(os.getenv('POINTS_LATE', '3'))
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '10'))
+
+# Clock-in reminders: messages sent per second, most messages waiting, and whether weekends are skipped
+REMINDER_SEND_RATE = float(os.getenv('REMINDER_SEND_RATE', '5'))
+REMINDER_QUEUE_SIZE = int(os.getenv('REMINDER_QUEUE_SIZE', '10000'))
+REMINDER_WEEKDAYS_ONLY = os.getenv('REMINDER_WEEKDAYS_ONLY', 'true').lower() == 'true'
+
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics, disabled without a port.
+# launcher.py gives each worker its own port: METRICS_PORT plus the worker number
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+
+# Event loop stall watchdog (opt-in, runs a thread): prints the blocking stack and command when the loop is stuck longer than STALL_THRESHOLD seconds
+STALL_WATCHDOG = os.getenv('STALL_WATCHDOG', 'false').lower() == 'true'
+STALL_THRESHOLD = float(os.getenv('STALL_THRESHOLD', '0.5'))
+
+# Seconds between corrections of the live today's-attendance counters from the database
+TODAY_COUNT_RECONCILE_INTERVAL = float(os.getenv('TODAY_COUNT_RECONCILE_INTERVAL', '300'))
@@ -0,0 +1,633 @@
+"""Async data-access layer for Supabase
+
+supabase-py only ships a synchronous client, so every request is built here
+and executed on a bounded thread pool. Command handlers await these helpers
+instead of calling `.execute()` on the event loop.
+"""
+import asyncio
+import datetime
+import functools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from postgrest.exceptions import APIError  # re-exported for callers
+from postgrest.utils import SyncClient
+from supabase import create_client, Client
+from config import (
+    SUPABASE_URL, SUPABASE_KEY, DB_MAX_CONCURRENCY, DB_MAX_CONNECTIONS,
+    DB_KEEPALIVE_EXPIRY, DB_CONNECT_TIMEOUT, DB_READ_TIMEOUT,
+    DB_READ_RETRIES, DB_RETRY_BACKOFF, DB_GUILD_RATE, DB_GUILD_BURST
+)
+from ratelimit import GuildRateLimiter
+from metrics import Counter, Histogram
+
+# Setup Supabase client
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def _create_session(session: SyncClient):
+    """Build a pooled keep-alive HTTP session replacing the default one"""
+    return SyncClient(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=httpx.Timeout(DB_READ_TIMEOUT, connect=DB_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=DB_MAX_CONNECTIONS,
+            max_keepalive_connections=DB_MAX_CONNECTIONS,
+            keepalive_expiry=DB_KEEPALIVE_EXPIRY
+        )
+    )
+
+# Reuse warm TLS connections across requests and never wait forever on one
+_default_session = supabase.postgrest.session
+supabase.postgrest.session = _create_session(_default_session)
+_default_session.close()
+
+# Worker threads double as the concurrency cap for in-flight requests
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix='supabase')
+
+# Spreads the requests of one busy server instead of letting it flood the pool
+_limiter = GuildRateLimiter(DB_GUILD_RATE, DB_GUILD_BURST)
+
+# Reads currently running, shared by identical concurrent calls
+_inflight = {}
+
+# Maximum number of values sent in a single `in` filter
+IN_FILTER_CHUNK_SIZE = 200
+
+request_seconds = Histogram(
+    'okebot_db_request_duration_seconds', 'Supabase request latency', ('table', 'operation')
+)
+request_errors = Counter(
+    'okebot_db_request_errors_total', 'Failed Supabase requests', ('table', 'operation', 'error')
+)
+pool_wait_seconds = Histogram(
+    'okebot_db_pool_wait_seconds', 'Time Supabase requests waited for a free worker thread'
+)
+
+# HTTP methods of PostgREST requests by operation
+_OPERATIONS = {'GET': 'select', 'HEAD': 'count', 'POST': 'insert', 'PATCH': 'update', 'DELETE': 'delete'}
+
+def _labels(query):
+    """(table, operation) of a built query, RPCs are labelled by function"""
+    path = query.path.strip('/')
+    if path.startswith('rpc/'):
+        return path[4:], 'rpc'
+    operation = _OPERATIONS.get(query.http_method, query.http_method.lower())
+    if operation == 'insert' and 'resolution=' in query.headers.get('prefer', ''):
+        operation = 'upsert'
+    return path, operation
+
+def _timed(func, table: str, operation: str, submitted: float):
+    """Call `func` on a worker thread, recording its latency and errors"""
+    started = time.perf_counter()
+    pool_wait_seconds.observe(started - submitted)
+    try:
+        return func()
+    except Exception as e:
+        request_errors.inc(table, operation, type(e).__name__)
+        raise
+    finally:
+        request_seconds.observe(time.perf_counter() - started, table, operation)
+
+def queued_requests():
+    """Requests waiting for a free worker thread"""
+    return _executor._work_queue.qsize()
+
+async def _execute(query, retry: bool = False, server_id: int = None):
+    """Run a built query on the database thread pool
+
+    Idempotent reads pass `retry=True` and are retried on connection errors
+    and timeouts with jittered exponential backoff. Requests made for a
+    server pass its `server_id` and wait for that server's rate limit.
+    """
+    loop = asyncio.get_running_loop()
+    table, operation = _labels(query)
+    attempts = DB_READ_RETRIES + 1 if retry else 1
+    for attempt in range(attempts):
+        if server_id is not None:
+            await _limiter.acquire(server_id)
+        try:
+            return await loop.run_in_executor(
+                _executor, _timed, query.execute, table, operation, time.perf_counter()
+            )
+        except httpx.TransportError:
+            if attempt + 1 >= attempts:
+                raise
+            await asyncio.sleep(random.uniform(0, DB_RETRY_BACKOFF * 2 ** attempt))
+
+def _coalesced(func):
+    """Share one in-flight request between concurrent identical reads
+
+    Callers receive the same result object and must not modify it.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            _inflight[key] = task
+            task.add_done_callback(lambda _: _inflight.pop(key, None))
+        # One caller giving up must not cancel the request for the others
+        return await asyncio.shield(task)
+    return wrapper
+
+def _first(response):
+    """Return the first row of a response or None"""
+    return response.data[0] if response.data else None
+
+def shutdown():
+    """Stop accepting new database work and release the worker threads"""
+    _executor.shutdown(wait=False, cancel_futures=True)
+    supabase.postgrest.session.close()
+
+# Servers
+
+@_coalesced
+async def get_server(guild_id: int):
+    """Get the server row for a Discord guild"""
+    response = await _execute(
+        supabase.table('servers').select('*').eq('server_id', str(guild_id)),
+        retry=True
+    )
+    return _first(response)
+
+async def get_servers(guild_ids):
+    """Get the server rows for many Discord guilds"""
+    guild_ids = [str(guild_id) for guild_id in guild_ids]
+    rows = []
+    # Chunked so the `in` filter stays within URL length limits
+    for i in range(0, len(guild_ids), IN_FILTER_CHUNK_SIZE):
+        response = await _execute(
+            supabase.table('servers')
+                .select('id, server_id')
+                .in_('server_id', guild_ids[i:i + IN_FILTER_CHUNK_SIZE]),
+            retry=True
+        )
+        rows.extend(response.data)
+    return rows
+
+async def update_server(guild_id: int, server_data: dict):
+    """Update the stored details of a server"""
+    await _execute(
+        supabase.table('servers').update(server_data).eq('server_id', str(guild_id))
+    )
+
+async def insert_server(server_data: dict):
+    """Insert a new server row"""
+    response = await _execute(supabase.table('servers').insert(server_data))
+    return _first(response)
+
+# Users
+
+@_coalesced
+async def get_user(discord_id: int):
+    """Get the user row for a Discord user"""
+    response = await _execute(
+        supabase.table('users').select('*').eq('discord_id', str(discord_id)),
+        retry=True
+    )
+    return _first(response)
+
+@_coalesced
+async def get_user_with_membership(discord_id: int, server_id: int):
+    """Get a user row with its membership in one server embedded
+
+    The embedded `user_servers` list is empty when the user is not
+    registered in that server.
+    """
+    response = await _execute(
+        supabase.table('users')
+            .select('id, username, user_servers(id)')
+            .eq('discord_id', str(discord_id))
+            .eq('user_servers.server_id', server_id),
+        retry=True,
+        server_id=server_id
+    )
+    return _first(response)
+
+async def get_users(user_ids):
+    """Get {id: user row} for many user ids"""
+    user_ids = list(user_ids)
+    users = {}
+    for i in range(0, len(user_ids), IN_FILTER_CHUNK_SIZE):
+        response = await _execute(
+            supabase.table('users')
+                .select('id, discord_id, username')
+                .in_('id', user_ids[i:i + IN_FILTER_CHUNK_SIZE]),
+            retry=True
+        )
+        users.update({row['id']: row for row in response.data})
+    return users
+
+async def insert_user(user_data: dict):
+    """Insert a new user row"""
+    response = await _execute(supabase.table('users').insert(user_data))
+    return _first(response)
+
+async def update_username(discord_id: int, username: str):
+    """Change the stored username of a user"""
+    await _execute(
+        supabase.table('users')
+            .update({'username': username})
+            .eq('discord_id', str(discord_id))
+    )
+
+# User servers
+
+async def insert_user_server(user_server_data: dict):
+    """Register a user in a server"""
+    response = await _execute(
+        supabase.table('user_servers').insert(user_server_data),
+        server_id=user_server_data['server_id']
+    )
+    return _first(response)
+
+async def delete_user_server(user_id: int, server_id: int):
+    """Remove a user from a server"""
+    await _execute(
+        supabase.table('user_servers')
+            .delete()
+            .eq('user_id', user_id)
+            .eq('server_id', server_id),
+        server_id=server_id
+    )
+
+@_coalesced
+async def count_user_servers(server_id: int):
+    """Count the registered users of a server"""
+    response = await _execute(
+        supabase.table('user_servers')
+            .select('id', count='exact')
+            .eq('server_id', server_id)
+            .limit(1),
+        retry=True,
+        server_id=server_id
+    )
+    return response.count if response.count else 0
+
+@_coalesced
+async def server_members_page(server_id: int, after=None, limit: int = 20):
+    """Get one page of a server's registered users ordered by (joined_at, id)
+
+    `after` is the (joined_at, id) of the last row of the previous page, or
+    None for the first page.
+    """
+    after_joined_at, after_id = after if after else (None, None)
+    response = await _execute(
+        supabase.rpc('server_members_page', {
+            'p_server_id': server_id,
+            'p_after_joined_at': after_joined_at,
+            'p_after_id': after_id,
+            'p_limit': limit
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return response.data
+
+@_coalesced
+async def registered_discord_ids(server_id: int):
+    """Get the Discord ids of every registered user of a server"""
+    response = await _execute(
+        supabase.rpc('registered_discord_ids', {'p_server_id': server_id}),
+        retry=True,
+        server_id=server_id
+    )
+    row = _first(response)
+    return set(row['discord_ids']) if row else set()
+
+async def register_members(server_id: int, registered_by: int, members: list):
+    """Register a batch of members in one request
+
+    `members` holds dicts with `discord_id`, `username`, `avatar_url` and
+    `joined_at`. Returns the number of users created and of memberships added.
+    """
+    response = await _execute(
+        supabase.rpc('register_members', {
+            'p_server_id': server_id,
+            'p_registered_by': str(registered_by),
+            'p_members': members
+        }),
+        server_id=server_id
+    )
+    row = _first(response)
+    return (row['created_users'], row['registered']) if row else (0, 0)
+
+# Attendance
+
+async def clock_in(server_id: int, discord_id: int, clock_in_time: str, image_url: str, notes: str,
+                   punctuality: str = None, points: int = 0):
+    """Record a clock-in through the `clock_in` database function
+
+    Returns one row with `status` ('ok', 'already_clocked_in', 'not_member'
+    or 'not_registered'), the user's id and username, the attendance id and
+    time, and for 'ok' the server's clock-in count for that day.
+    """
+    response = await _execute(
+        supabase.rpc('clock_in', {
+            'p_server_id': server_id,
+            'p_discord_id': str(discord_id),
+            'p_clock_in_time': clock_in_time,
+            'p_image_url': image_url,
+            'p_notes': notes,
+            'p_punctuality': punctuality,
+            'p_points': points
+        }),
+        server_id=server_id
+    )
+    return _first(response)
+
+async def clock_out(server_id: int, discord_id: int, clock_out_time: str, max_hours: float):
+    """Close a user's open session through the `clock_out` database function
+
+    Returns one row with `status` ('ok', 'not_clocked_in', 'not_member' or
+    'not_registered'), the user's id and username, and for 'ok' the
+    attendance id with its clock-in and clock-out times. Sessions older
+    than `max_hours` are not closed.
+    """
+    response = await _execute(
+        supabase.rpc('clock_out', {
+            'p_server_id': server_id,
+            'p_discord_id': str(discord_id),
+            'p_clock_out_time': clock_out_time,
+            'p_max_duration': f"{max_hours} hours"
+        }),
+        server_id=server_id
+    )
+    return _first(response)
+
+async def close_stale_sessions(max_hours: float):
+    """Close every session open for longer than `max_hours`, returning how many"""
+    response = await _execute(
+        supabase.rpc('close_stale_sessions', {'p_max_duration': f"{max_hours} hours"})
+    )
+    row = _first(response)
+    return row['closed'] if row else 0
+
+@_coalesced
+async def clocked_in_today(server_id: int, attendance_date: str):
+    """Get {user_id: clock_in_time} of everyone who clocked in on a local day"""
+    response = await _execute(
+        supabase.rpc('clocked_in_today', {
+            'p_server_id': server_id,
+            'p_date': attendance_date
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    row = _first(response)
+    return {int(user_id): clock_in_time for user_id, clock_in_time in row['clock_ins'].items()} if row else {}
+
+async def flush_clock_ins(rows: list):
+    """Insert a batch of queued clock-ins, keyed by their `client_ref`
+
+    Returns {client_ref: status} where status is 'inserted', 'duplicate'
+    (already stored by an earlier flush) or 'conflict' (the user already has
+    another clock-in that day). Safe to retry with the same rows.
+    """
+    response = await _execute(supabase.rpc('flush_clock_ins', {'p_rows': rows}))
+    return {row['client_ref']: row['status'] for row in response.data}
+
+async def today_counts(server_ids, attendance_date: str):
+    """Get {server_id: people clocked in} for a local day from the daily rollup"""
+    server_ids = list(server_ids)
+    counts = {}
+    for i in range(0, len(server_ids), IN_FILTER_CHUNK_SIZE):
+        response = await _execute(
+            supabase.table('attendance_daily_rollup')
+                .select('server_id, unique_users')
+                .eq('attendance_date', attendance_date)
+                .in_('server_id', server_ids[i:i + IN_FILTER_CHUNK_SIZE]),
+            retry=True
+        )
+        counts.update({row['server_id']: row['unique_users'] for row in response.data})
+    return counts
+
+async def update_attendance_image(attendance_id: int, image: dict):
+    """Store the copied image of an attendance row
+
+    `image` holds `image_url`, `thumbnail_url`, `image_hash`,
+    `similar_to_date` and `image_distance`.
+    """
+    await _execute(supabase.table('attendance').update(image).eq('id', attendance_id))
+
+async def update_attendance_image_by_ref(client_ref: str, image: dict):
+    """Same as `update_attendance_image` for a row inserted from the clock-in queue"""
+    await _execute(supabase.table('attendance').update(image).eq('client_ref', client_ref))
+
+async def image_hash_history(server_id: int, user_id: int, since_date: str):
+    """Get [(attendance_date, image_hash)] of a user's hashed clock-ins since a local date"""
+    response = await _execute(
+        supabase.table('attendance')
+            .select('attendance_date, image_hash')
+            .eq('server_id', server_id)
+            .eq('user_id', user_id)
+            .gte('attendance_date', since_date)
+            .not_.is_('image_hash', 'null'),
+        retry=True,
+        server_id=server_id
+    )
+    return [(row['attendance_date'], row['image_hash']) for row in response.data]
+
+@_coalesced
+async def suspicious_clock_ins(server_id: int, since_date: str, limit: int = 20):
+    """Get the most recent clock-ins whose image resembles an earlier one of the same user"""
+    response = await _execute(
+        supabase.rpc('suspicious_clock_ins', {
+            'p_server_id': server_id,
+            'p_since': since_date,
+            'p_limit': limit
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return response.data
+
+@_coalesced
+async def leaderboard(server_id: int, period: str, period_start: str = None, limit: int = 10):
+    """Get the top users of a server by points
+
+    `period` is 'week' or 'month' (starting on `period_start`) or 'all'.
+    Rows hold `rank`, `username`, `points`, `clock_ins`, `streak` and
+    `best_streak`.
+    """
+    response = await _execute(
+        supabase.rpc('leaderboard', {
+            'p_server_id': server_id,
+            'p_period': period,
+            'p_period_start': period_start,
+            'p_limit': limit
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return response.data
+
+async def unclocked_members(server_id: int, attendance_date: str):
+    """Get [(user_id, discord_id)] of registered users without a clock-in on a local day"""
+    response = await _execute(
+        supabase.rpc('unclocked_members', {
+            'p_server_id': server_id,
+            'p_date': attendance_date
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return [(row['user_id'], row['discord_id']) for row in response.data]
+
+@_coalesced
+async def worked_hours(server_id: int, start_date: str, end_date: str, period: str = 'day', user_id: int = None):
+    """Get worked time per user and 'day' or 'week' of a server between two local dates
+
+    Every row holds `period_start`, `user_id`, `username`, `sessions`,
+    `worked_seconds`, `open_sessions` and `missed_clock_outs`. Pass
+    `user_id` to get the rows of one user.
+    """
+    response = await _execute(
+        supabase.rpc('worked_hours', {
+            'p_server_id': server_id,
+            'p_start_date': start_date,
+            'p_end_date': end_date,
+            'p_period': period,
+            'p_user_id': user_id
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return response.data
+
+async def export_attendance_page(server_id: int, start_date: str, end_date: str, after=None, limit: int = 1000):
+    """Get one page of a server's attendance between two local dates, with usernames
+
+    Rows are ordered by (attendance_date, id). `after` is the
+    (attendance_date, id) of the last row of the previous page, or None for
+    the first page.
+    """
+    after_date, after_id = after if after else (None, None)
+    response = await _execute(
+        supabase.rpc('export_attendance', {
+            'p_server_id': server_id,
+            'p_start_date': start_date,
+            'p_end_date': end_date,
+            'p_after_date': after_date,
+            'p_after_id': after_id,
+            'p_limit': limit
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return response.data
+
+@_coalesced
+async def attendance_report(server_id: int, start_date: str, end_date: str):
+    """Get the aggregated attendance report of a server between two local dates
+
+    Returns one row with `total_clock_ins`, `unique_users`, `active_days`,
+    `daily` (most recent days first), `top_users` and `flagged_images`.
+    """
+    response = await _execute(
+        supabase.rpc('attendance_report', {
+            'p_server_id': server_id,
+            'p_start_date': start_date,
+            'p_end_date': end_date
+        }),
+        retry=True,
+        server_id=server_id
+    )
+    return _first(response)
+
+# Settings
+
+@_coalesced
+async def get_guild_settings(server_id: int):
+    """Get the settings row of a server or None when it has the defaults"""
+    response = await _execute(
+        supabase.table('guild_settings').select('*').eq('server_id', server_id),
+        retry=True,
+        server_id=server_id
+    )
+    return _first(response)
+
+async def list_guild_settings(server_ids):
+    """Get the settings rows of many servers, skipping those with the defaults"""
+    server_ids = list(server_ids)
+    rows = []
+    for i in range(0, len(server_ids), IN_FILTER_CHUNK_SIZE):
+        response = await _execute(
+            supabase.table('guild_settings')
+                .select('*')
+                .in_('server_id', server_ids[i:i + IN_FILTER_CHUNK_SIZE]),
+            retry=True
+        )
+        rows.extend(response.data)
+    return rows
+
+async def upsert_guild_settings(server_id: int, settings: dict, updated_by: int):
+    """Save some settings of a server, returning the full row"""
+    response = await _execute(
+        supabase.table('guild_settings').upsert({
+            **settings,
+            'server_id': server_id,
+            'updated_by': str(updated_by),
+            'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat()
+        }),
+        server_id=server_id
+    )
+    return _first(response)
+
+# Reminders
+
+async def list_reminders(server_ids):
+    """Get the clock-in reminders of many servers"""
+    server_ids = list(server_ids)
+    rows = []
+    for i in range(0, len(server_ids), IN_FILTER_CHUNK_SIZE):
+        response = await _execute(
+            supabase.table('clock_in_reminders')
+                .select('id, server_id, remind_at, channel_id')
+                .in_('server_id', server_ids[i:i + IN_FILTER_CHUNK_SIZE])
+                .order('remind_at'),
+            retry=True
+        )
+        rows.extend(response.data)
+    return rows
+
+async def upsert_reminder(server_id: int, remind_at: str, channel_id, created_by: int):
+    """Create a reminder, or change the channel of the one at the same time"""
+    response = await _execute(
+        supabase.table('clock_in_reminders').upsert({
+            'server_id': server_id,
+            'remind_at': remind_at,
+            'channel_id': str(channel_id) if channel_id else None,
+            'created_by': str(created_by)
+        }, on_conflict='server_id,remind_at'),
+        server_id=server_id
+    )
+    return _first(response)
+
+async def delete_reminder(server_id: int, remind_at: str):
+    """Delete the reminder of a server at a time, returning it or None"""
+    response = await _execute(
+        supabase.table('clock_in_reminders')
+            .delete()
+            .eq('server_id', server_id)
+            .eq('remind_at', remind_at),
+        server_id=server_id
+    )
+    return _first(response)
+
+# Storage
+
+async def upload_image(bucket: str, path: str, data: bytes, content_type: str):
+    """Upload an image to a public Storage bucket and return its public URL
+
+    Existing objects are overwritten, so a retried upload is harmless.
+    """
+    storage = supabase.storage.from_(bucket)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_executor, _timed, functools.partial(
+        storage.upload, path, data, {'content-type': content_type, 'x-upsert': 'true'}
+    ), f"storage/{bucket}", 'upload', time.perf_counter())
+    return storage.get_public_url(path)
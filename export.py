@@ -0,0 +1,212 @@
+"""Streams a server's attendance into CSV or Parquet files
+
+Rows are read from Supabase one page at a time with keyset pagination and
+appended to files on disk, so memory holds a single page however long the
+exported period is. Output is split into parts that each fit Discord's
+attachment size limit.
+"""
+import asyncio
+import csv
+import datetime
+import io
+import os
+import database
+from config import EXPORT_PAGE_SIZE, EXPORT_CONCURRENCY
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    # Parquet exports are only offered when pyarrow is installed
+    pyarrow = None
+
+FORMATS = ('csv', 'parquet')
+
+COLUMNS = [
+    'date', 'discord_id', 'username', 'clock_in', 'clock_out', 'worked_hours',
+    'auto_clocked_out', 'punctuality', 'points', 'notes', 'image_url', 'similar_to_date'
+]
+
+# Exports running at once, each holding a page in memory and files on disk
+_slots = asyncio.Semaphore(EXPORT_CONCURRENCY)
+
+def parquet_available():
+    """Whether Parquet exports can be written"""
+    return pyarrow is not None
+
+def _timestamp(value: str, tz):
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(tz)
+
+def _record(row: dict, tz):
+    """Convert an export_attendance row to local times and worked hours"""
+    clock_in = _timestamp(row['clock_in_time'], tz)
+    clock_out = _timestamp(row['clock_out_time'], tz)
+    worked = None
+    if clock_out and not row['auto_clocked_out']:
+        worked = round((clock_out - clock_in).total_seconds() / 3600, 2)
+    return {
+        'date': datetime.date.fromisoformat(row['attendance_date']),
+        'discord_id': row['discord_id'],
+        'username': row['username'],
+        'clock_in': clock_in,
+        'clock_out': clock_out,
+        'worked_hours': worked,
+        'auto_clocked_out': row['auto_clocked_out'],
+        'punctuality': row['punctuality'],
+        'points': row['points'],
+        'notes': row['notes'],
+        'image_url': row['image_url'],
+        'similar_to_date': datetime.date.fromisoformat(row['similar_to_date']) if row['similar_to_date'] else None
+    }
+
+class CsvParts:
+    """Writes records to CSV files of at most `max_bytes` each
+
+    Every part starts with the header row and a UTF-8 BOM so spreadsheet
+    programs detect the encoding of usernames and notes.
+    """
+
+    def __init__(self, directory: str, name: str, max_bytes: int):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.paths = []
+        self._file = None
+        self._size = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._header = self._render(COLUMNS, bom=True)
+
+    def _render(self, values: list, bom: bool = False):
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerow(values)
+        return self._buffer.getvalue().encode('utf-8-sig' if bom else 'utf-8')
+
+    def _open_part(self):
+        if self._file:
+            self._file.close()
+        path = os.path.join(self.directory, f"{self.name}_part{len(self.paths) + 1}.csv")
+        self.paths.append(path)
+        self._file = open(path, 'wb')
+        self._file.write(self._header)
+        self._size = len(self._header)
+
+    def write(self, records: list):
+        """Append records, starting a new part when the current one is full"""
+        for record in records:
+            line = self._render([self._format(record[column]) for column in COLUMNS])
+            if self._file is None or (self._size + len(line) > self.max_bytes and self._size > len(self._header)):
+                self._open_part()
+            self._file.write(line)
+            self._size += len(line)
+
+    @staticmethod
+    def _format(value):
+        if value is None:
+            return ''
+        if isinstance(value, datetime.datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        return value
+
+    def close(self):
+        """Finish the last part and return the paths of all parts"""
+        if self._file:
+            self._file.close()
+            self._file = None
+        return self.paths
+
+class ParquetParts:
+    """Writes records to Parquet files of about `max_bytes` at most
+
+    Each page becomes one row group. A new part is started when the next
+    row group, estimated from the previous one, would not fit.
+    """
+
+    # Room left for the footer written when a part is closed
+    FOOTER_MARGIN = 64 * 1024
+
+    def __init__(self, directory: str, name: str, max_bytes: int, timezone: str):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.paths = []
+        self._writer = None
+        self._sink = None
+        self._last_group = 0
+        self.schema = pyarrow.schema([
+            ('date', pyarrow.date32()),
+            ('discord_id', pyarrow.string()),
+            ('username', pyarrow.string()),
+            ('clock_in', pyarrow.timestamp('s', tz=timezone)),
+            ('clock_out', pyarrow.timestamp('s', tz=timezone)),
+            ('worked_hours', pyarrow.float64()),
+            ('auto_clocked_out', pyarrow.bool_()),
+            ('punctuality', pyarrow.string()),
+            ('points', pyarrow.int16()),
+            ('notes', pyarrow.string()),
+            ('image_url', pyarrow.string()),
+            ('similar_to_date', pyarrow.date32())
+        ])
+
+    def _open_part(self):
+        self._close_part()
+        path = os.path.join(self.directory, f"{self.name}_part{len(self.paths) + 1}.parquet")
+        self.paths.append(path)
+        self._sink = pyarrow.OSFile(path, 'wb')
+        self._writer = parquet.ParquetWriter(self._sink, self.schema, compression='zstd')
+
+    def _close_part(self):
+        if self._writer:
+            self._writer.close()
+            self._sink.close()
+            self._writer = None
+
+    def write(self, records: list):
+        """Append records as one row group, starting a new part when needed"""
+        if self._writer is None or (
+            self._last_group and self._sink.tell() + self._last_group + self.FOOTER_MARGIN > self.max_bytes
+        ):
+            self._open_part()
+        table = pyarrow.Table.from_pylist(records, schema=self.schema)
+        before = self._sink.tell()
+        self._writer.write_table(table)
+        self._last_group = self._sink.tell() - before
+
+    def close(self):
+        """Finish the last part and return the paths of all parts"""
+        self._close_part()
+        return self.paths
+
+async def export_attendance(server_id: int, start_date: str, end_date: str, settings, file_format: str,
+                            directory: str, name: str, max_bytes: int):
+    """Write a server's attendance between two local dates into `directory`
+
+    Returns the paths of the written parts, none when there was no
+    attendance, and the number of rows exported.
+    """
+    async with _slots:
+        if file_format == 'parquet':
+            parts = ParquetParts(directory, name, max_bytes, settings.timezone)
+        else:
+            parts = CsvParts(directory, name, max_bytes)
+
+        rows = 0
+        after = None
+        try:
+            while True:
+                page = await database.export_attendance_page(server_id, start_date, end_date, after, EXPORT_PAGE_SIZE)
+                if not page:
+                    break
+                records = [_record(row, settings.tz) for row in page]
+                # File writes and Parquet encoding stay off the event loop
+                await asyncio.to_thread(parts.write, records)
+                rows += len(page)
+                if len(page) < EXPORT_PAGE_SIZE:
+                    break
+                after = (page[-1]['attendance_date'], page[-1]['id'])
+        finally:
+            paths = await asyncio.to_thread(parts.close)
+        return paths, rows
@@ -33,7 +33,7 @@
             mkdir -p $out/share/dbot
             
             # Copy necessary files
-            cp bot.py config.py $out/share/dbot/
+            cp *.py $out/share/dbot/
             
             # Create wrapper script
             makeWrapper ${pythonApp}/bin/python $out/bin/dbot \
@@ -0,0 +1,120 @@
+"""Per-server work schedule: timezone, earliest clock-in time and lateness thresholds
+
+Settings are read from Supabase once per server and kept as immutable
+`GuildSettings` objects with the timezone already built, so a clock-in only
+does a dictionary lookup. `!oke settings` saves changes and invalidates the
+cached copy.
+"""
+import datetime
+from collections import namedtuple
+import pytz
+import database
+from config import POINTS_ON_TIME, POINTS_ALMOST_LATE, POINTS_LATE
+
+# Schedule of servers without a guild_settings row, as in the table defaults
+DEFAULT_TIMEZONE = 'Asia/Jakarta'
+DEFAULT_EARLIEST_TIME = datetime.time(7, 30)
+DEFAULT_ALMOST_LATE_TIME = datetime.time(8, 45)
+DEFAULT_LATE_TIME = datetime.time(9, 0)
+
+class GuildSettings(namedtuple('GuildSettings', ['timezone', 'tz', 'earliest_time', 'almost_late_time', 'late_time'])):
+    """Schedule of one server, built once and never modified"""
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, timezone: str, earliest_time: datetime.time, almost_late_time: datetime.time, late_time: datetime.time):
+        """Create settings, raising ValueError for an unknown timezone or unordered times"""
+        try:
+            tz = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError:
+            raise ValueError(f"Unknown timezone: {timezone}")
+        if not earliest_time <= almost_late_time <= late_time:
+            raise ValueError("Times must be in order: earliest, almost late, late")
+        return cls(tz.zone, tz, earliest_time, almost_late_time, late_time)
+
+    @classmethod
+    def from_row(cls, row: dict):
+        """Create settings from a guild_settings row"""
+        return cls.build(
+            row['timezone'],
+            datetime.time.fromisoformat(row['earliest_time']),
+            datetime.time.fromisoformat(row['almost_late_time']),
+            datetime.time.fromisoformat(row['late_time'])
+        )
+
+    def now(self):
+        """Current local time of the server"""
+        return datetime.datetime.now(self.tz)
+
+    def today(self):
+        """Current local date of the server"""
+        return self.now().date()
+
+    def localize(self, day: datetime.date, at: datetime.time):
+        """Aware local datetime of a time of day on a date"""
+        return self.tz.localize(datetime.datetime.combine(day, at))
+
+    def classify(self, at: datetime.time):
+        """Return (punctuality, points) of a clock-in at a local time"""
+        if at > self.late_time:
+            return 'late', POINTS_LATE
+        if at >= self.almost_late_time:
+            return 'almost_late', POINTS_ALMOST_LATE
+        return 'on_time', POINTS_ON_TIME
+
+    def utc_offset(self, moment: datetime.datetime = None):
+        """Offset of the timezone as shown to users, e.g. GMT+7 or GMT+5:30"""
+        offset = (moment or self.now()).astimezone(self.tz).utcoffset()
+        minutes = int(offset.total_seconds()) // 60
+        sign = '+' if minutes >= 0 else '-'
+        hours, minutes = divmod(abs(minutes), 60)
+        return f"GMT{sign}{hours}" + (f":{minutes:02d}" if minutes else "")
+
+DEFAULT_SETTINGS = GuildSettings.build(DEFAULT_TIMEZONE, DEFAULT_EARLIEST_TIME, DEFAULT_ALMOST_LATE_TIME, DEFAULT_LATE_TIME)
+
+class GuildSettingsCache:
+    """Maps `servers.id` to the server's `GuildSettings`
+
+    Settings change only through `!oke settings`, so entries do not expire;
+    the command invalidates the server it changed.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._settings = {}
+
+    def peek(self, server_id: int):
+        """Return the cached settings or None on a miss"""
+        return self._settings.get(server_id)
+
+    async def get(self, server_id: int):
+        """Return the settings of a server, loading them on first use"""
+        settings = self._settings.get(server_id)
+        if settings is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            row = await database.get_guild_settings(server_id)
+            settings = GuildSettings.from_row(row) if row else DEFAULT_SETTINGS
+            self._settings[server_id] = settings
+        return settings
+
+    async def load(self, server_ids):
+        """Load the settings of many servers with one bulk lookup"""
+        server_ids = [server_id for server_id in server_ids if server_id not in self._settings]
+        rows = {row['server_id']: row for row in await database.list_guild_settings(server_ids)}
+        for server_id in server_ids:
+            row = rows.get(server_id)
+            self._settings[server_id] = GuildSettings.from_row(row) if row else DEFAULT_SETTINGS
+
+    def invalidate(self, server_id: int):
+        """Forget a server, its settings are read again on next use"""
+        self._settings.pop(server_id, None)
+
+    def __len__(self):
+        return len(self._settings)
+
+# Shared by every command in this process
+guild_settings = GuildSettingsCache()
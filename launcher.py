@@ -0,0 +1,163 @@
+"""Runs the bot as several worker processes, each connecting a range of shards
+
+Discord delivers all events of a server on one shard, chosen from the
+server id. Every worker runs bot.py for a contiguous range of shards, so
+each server, its members and every cache entry about it live in exactly
+one process, and gateway traffic and memory are spread over the CPU cores.
+
+Usage: python launcher.py, with SHARD_WORKERS (and optionally SHARD_COUNT)
+set. Workers that exit are restarted; SIGINT or SIGTERM stops them all.
+"""
+import asyncio
+import os
+import signal
+import sys
+import aiohttp
+from config import DISCORD_TOKEN, SHARD_COUNT, SHARD_WORKERS, CLOCKIN_QUEUE_PATH, METRICS_PORT
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+
+# Seconds each shard takes to identify; the next worker starts after the previous one's shards
+IDENTIFY_INTERVAL = 5
+# Seconds before a crashed worker is restarted, doubling up to RESTART_MAX_DELAY while it keeps crashing
+RESTART_DELAY = 5
+RESTART_MAX_DELAY = 300
+# A worker that ran this long is considered healthy again
+HEALTHY_RUNTIME = 600
+# Seconds workers get to flush their queues after being asked to stop
+STOP_TIMEOUT = 30
+
+async def recommended_shard_count():
+    """Ask Discord how many shards the bot should use"""
+    headers = {'Authorization': f'Bot {DISCORD_TOKEN}'}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers=headers) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data['shards']
+
+def shard_ranges(shard_count: int, workers: int):
+    """Split the shards into one contiguous range per worker, sizes differing by one at most"""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def worker_queue_path(index: int):
+    """Clock-in queue of a worker; worker 0 keeps the single-process file"""
+    if index == 0:
+        return CLOCKIN_QUEUE_PATH
+    root, extension = os.path.splitext(CLOCKIN_QUEUE_PATH)
+    return f"{root}.worker{index}{extension}"
+
+async def _wait(event: asyncio.Event, seconds: float):
+    """Sleep, returning True early when the event is set"""
+    try:
+        await asyncio.wait_for(event.wait(), seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+class Worker:
+    """One bot.py process connecting a range of shards, restarted when it exits"""
+
+    def __init__(self, index: int, shard_ids: list, shard_count: int):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+
+    @property
+    def name(self):
+        return f"worker {self.index} (shards {self.shard_ids[0]}-{self.shard_ids[-1]})"
+
+    def environment(self):
+        env = dict(os.environ)
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['SHARD_IDS'] = ','.join(str(shard_id) for shard_id in self.shard_ids)
+        # Each worker needs its own queue, SQLite files are not shared between processes
+        env['CLOCKIN_QUEUE_PATH'] = worker_queue_path(self.index)
+        if METRICS_PORT:
+            env['METRICS_PORT'] = str(METRICS_PORT + self.index)
+        return env
+
+    async def run(self, stopping: asyncio.Event, start_delay: float):
+        """Keep the process running until stopping is set"""
+        if await _wait(stopping, start_delay):
+            return
+        loop = asyncio.get_running_loop()
+        delay = RESTART_DELAY
+        while not stopping.is_set():
+            started = loop.time()
+            # A session of its own keeps a terminal's Ctrl+C from reaching the worker
+            # directly; stop() sends a single SIGINT so it shuts down cleanly
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, BOT_SCRIPT, env=self.environment(), start_new_session=True
+            )
+            print(f"🧩 Started {self.name}, pid {self.process.pid}")
+            code = await self.process.wait()
+            if stopping.is_set():
+                break
+            if loop.time() - started >= HEALTHY_RUNTIME:
+                delay = RESTART_DELAY
+            print(f"⚠️ {self.name} exited with code {code}, restarting in {delay}s")
+            if await _wait(stopping, delay):
+                break
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+        print(f"🛑 Stopped {self.name}")
+
+    def stop(self):
+        """Ask the process to shut down"""
+        if self.process and self.process.returncode is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def kill(self):
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+
+def warn_orphaned_queues(workers: int):
+    """Report queue files of workers that no longer exist, their clock-ins are not flushed"""
+    index = workers
+    while os.path.exists(worker_queue_path(index)):
+        print(f"⚠️ {worker_queue_path(index)} belongs to worker {index}, which is not started; "
+              f"run with SHARD_WORKERS={index + 1} once to flush it")
+        index += 1
+
+async def main():
+    """Start a worker per shard range and supervise them"""
+    shard_count = SHARD_COUNT or await recommended_shard_count()
+    ranges = shard_ranges(shard_count, SHARD_WORKERS)
+    print(f"🚀 Launching {len(ranges)} workers for {shard_count} shards")
+    warn_orphaned_queues(len(ranges))
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    workers = [Worker(index, shard_ids, shard_count) for index, shard_ids in enumerate(ranges)]
+    tasks = []
+    start_delay = 0
+    for worker in workers:
+        tasks.append(asyncio.create_task(worker.run(stopping, start_delay)))
+        # Stagger starts so identifies of different workers do not collide
+        start_delay += len(worker.shard_ids) * IDENTIFY_INTERVAL
+
+    await stopping.wait()
+    print("🛑 Stopping workers...")
+    for worker in workers:
+        worker.stop()
+    _, pending = await asyncio.wait(tasks, timeout=STOP_TIMEOUT)
+    if pending:
+        for worker in workers:
+            worker.kill()
+        await asyncio.wait(pending)
+
+if __name__ == "__main__":
+    asyncio.run(main())
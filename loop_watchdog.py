@@ -0,0 +1,125 @@
+"""Detects event loop stalls and reports what was blocking it
+
+The event loop bumps a heartbeat every few hundred milliseconds. A
+background thread checks the heartbeat and, when it is older than
+STALL_THRESHOLD seconds, prints the stack of the event loop thread, the
+task running on it and the command that task was serving. Blocking calls
+(synchronous I/O, heavy CPU work) show up in that stack. While the loop is
+responsive the cost is one timer callback and one thread wake-up per
+interval.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from metrics import Counter, Histogram
+from config import STALL_THRESHOLD
+
+# Buckets (seconds) of the stall duration histogram
+STALL_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60)
+
+# File in which the event loop calls callbacks and steps tasks
+EVENT_LOOP_DISPATCH = os.path.join('asyncio', 'events.py')
+
+stalls = Counter('okebot_event_loop_stalls_total', 'Event loop stalls longer than STALL_THRESHOLD')
+stall_seconds = Histogram('okebot_event_loop_stall_seconds', 'Duration of event loop stalls', buckets=STALL_BUCKETS)
+
+class StallWatchdog:
+    """Heartbeat on the event loop, checked from a daemon thread"""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        # Both the heartbeat and the check run this often
+        self.interval = threshold / 4
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat = 0.0
+        self._timer = None
+        self._thread = None
+        self._stopping = threading.Event()
+        # Task -> command context it is running, weak so finished tasks drop out
+        self._commands = weakref.WeakKeyDictionary()
+
+    def start(self):
+        """Start watching the running event loop"""
+        if self._thread:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+        self._thread.start()
+        print(f"🐕 Watching for event loop stalls over {self.threshold}s")
+
+    def stop(self):
+        """Stop watching"""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def command_started(self, ctx):
+        """Remember the command the current task is running"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._commands[task] = ctx
+
+    def command_finished(self, ctx):
+        """Forget the command of the current task"""
+        task = asyncio.current_task()
+        if task is not None and self._commands.get(task) is ctx:
+            del self._commands[task]
+
+    def _heartbeat(self):
+        self._beat = time.monotonic()
+        self._timer = self._loop.call_later(self.interval, self._heartbeat)
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stopping.wait(self.interval):
+            beat = self._beat
+            age = time.monotonic() - beat
+            if age <= self.threshold:
+                if stalled_since is not None:
+                    # The first beat after the stall was at `beat`
+                    duration = beat - stalled_since
+                    stall_seconds.observe(duration)
+                    print(f"🐕 Event loop responsive again after {duration:.2f}s")
+                    stalled_since = None
+            elif stalled_since is None:
+                stalled_since = beat
+                stalls.inc()
+                self._report(age)
+
+    def _report(self, age: float):
+        """Print what the event loop thread is doing right now"""
+        lines = [f"🐕 Event loop stalled for {age:.2f}s"]
+        # Read from another thread: the values may be a moment out of date, never wrong types
+        task = asyncio.current_task(self._loop)
+        if task is not None:
+            lines.append(f"   Task: {task.get_name()} running {task.get_coro().__qualname__}")
+            ctx = self._commands.get(task)
+            if ctx is not None:
+                guild = f"{ctx.guild.name} ({ctx.guild.id})" if ctx.guild else "DM"
+                lines.append(f"   Command: {ctx.command.qualified_name} in {guild} by {ctx.author} ({ctx.author.id})")
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is not None:
+            stack = traceback.extract_stack(frame)
+            # Frames of the event loop itself, up to the callback it ran, say nothing about the stall
+            for index in range(len(stack) - 1, -1, -1):
+                if stack[index].filename.endswith(EVENT_LOOP_DISPATCH):
+                    stack = stack[index + 1:] or stack
+                    break
+            lines.append("   Stack (most recent call last):")
+            lines.extend(line.rstrip('\n') for line in traceback.format_list(stack))
+        print('\n'.join(lines), flush=True)
+
+watchdog = StallWatchdog(STALL_THRESHOLD)
@@ -0,0 +1,172 @@
+"""Prometheus metrics served over HTTP from the bot's event loop
+
+Counters, gauges and histograms are plain in-process objects rendered in
+the Prometheus text format on `GET /metrics`. Values that already live
+elsewhere (queue sizes, cache statistics, gateway latency) are read by a
+callback at scrape time instead of being copied on every change.
+"""
+import asyncio
+import bisect
+import math
+import threading
+from aiohttp import web
+from config import METRICS_HOST, METRICS_PORT
+
+# Upper bounds (seconds) of latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Seconds between event loop lag samples
+LOOP_LAG_INTERVAL = 0.5
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+
+def _format(value: float):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Read at scrape time: returns a number, or {label values: number} with labels
+        self.function = function
+        # Updated from database worker threads as well as the event loop
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _label_text(self, values: tuple, extra: tuple = ()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _current(self):
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.function()
+        return value if isinstance(value, dict) else {(): value}
+
+    def _samples(self):
+        return [f"{self.name}{self._label_text(labels)} {_format(value)}" for labels, value in self._current().items()]
+
+    def render(self):
+        """Lines of this metric in the Prometheus text format"""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+class Counter(_Metric):
+    """Value that only goes up"""
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+    kind = 'gauge'
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def _samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(labels, (('le', _format(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_format(total)}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+        return lines
+
+def render():
+    """Every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            # One broken callback must not hide the other metrics
+            print(f"Error collecting metric {metric.name}: {e}")
+    return '\n'.join(lines) + '\n'
+
+loop_lag = Histogram(
+    'okebot_event_loop_lag_seconds', 'Delay of a timer on the event loop beyond its due time'
+)
+loop_lag_last = Gauge('okebot_event_loop_lag_last_seconds', 'Most recent event loop lag sample')
+
+class MetricsServer:
+    """HTTP endpoint exposing the metrics, and the event loop lag sampler"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner = None
+        self._sampler = None
+
+    async def start(self):
+        """Start serving /metrics and sampling event loop lag"""
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._sampler = asyncio.create_task(self._sample_loop_lag())
+        print(f"📈 Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        """Stop the endpoint and the sampler"""
+        if self._sampler:
+            self._sampler.cancel()
+            self._sampler = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(body=render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def _sample_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, loop.time() - due)
+            loop_lag.observe(lag)
+            loop_lag_last.set(lag)
+
+# Started by the bot when METRICS_PORT is set
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
@@ -0,0 +1,84 @@
+-- Migration: Single round-trip clock-in
+-- Validates membership, enforces one clock-in per Asia/Jakarta calendar day,
+-- inserts the attendance row and returns today's server count in one call.
+-- Concurrent clock-ins of the same user are serialized with an advisory lock,
+-- so two fast messages can no longer both pass the duplicate check.
+
+create or replace function clock_in(
+  p_server_id bigint,
+  p_discord_id text,
+  p_clock_in_time timestamp with time zone,
+  p_image_url text,
+  p_notes text
+)
+returns table (
+  status text,
+  user_id bigint,
+  username text,
+  attendance_id bigint,
+  clock_in_time timestamp with time zone,
+  today_count bigint
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  v_user users%rowtype;
+  v_attendance attendance%rowtype;
+  v_day_start timestamp with time zone;
+  v_day_end timestamp with time zone;
+begin
+  select * into v_user from users u where u.discord_id = p_discord_id;
+  if not found then
+    return query select 'not_registered'::text, null::bigint, null::text,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  if not exists (
+    select 1 from user_servers us
+    where us.user_id = v_user.id and us.server_id = p_server_id
+  ) then
+    return query select 'not_member'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  -- Bounds of the Jakarta calendar day containing the clock-in
+  v_day_start := date_trunc('day', p_clock_in_time at time zone 'Asia/Jakarta') at time zone 'Asia/Jakarta';
+  v_day_end := v_day_start + interval '1 day';
+
+  -- Serialize clock-ins of the same user in the same server
+  perform pg_advisory_xact_lock(hashtextextended('clock_in:' || p_server_id || ':' || v_user.id, 0));
+
+  select * into v_attendance from attendance a
+  where a.server_id = p_server_id
+    and a.user_id = v_user.id
+    and a.clock_in_time >= v_day_start
+    and a.clock_in_time < v_day_end
+  order by a.clock_in_time
+  limit 1;
+
+  if found then
+    return query select 'already_clocked_in'::text, v_user.id, v_user.username,
+      v_attendance.id, v_attendance.clock_in_time, null::bigint;
+    return;
+  end if;
+
+  insert into attendance (user_id, server_id, clock_in_time, image_url, notes)
+  values (v_user.id, p_server_id, p_clock_in_time, p_image_url, p_notes)
+  returning * into v_attendance;
+
+  return query select 'ok'::text, v_user.id, v_user.username,
+    v_attendance.id, v_attendance.clock_in_time,
+    (
+      select count(*) from attendance a
+      where a.server_id = p_server_id
+        and a.clock_in_time >= v_day_start
+        and a.clock_in_time < v_day_end
+    );
+end;
+$$;
+
+grant execute on function clock_in(bigint, text, timestamp with time zone, text, text)
+  to anon, authenticated, service_role;
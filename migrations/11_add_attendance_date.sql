@@ -0,0 +1,135 @@
+-- Migration: Store the Asia/Jakarta calendar date of every clock-in
+-- date(clock_in_time) uses the session time zone (UTC on Supabase) and is not
+-- IMMUTABLE, so it could neither be indexed nor give the right day for GMT+7.
+-- The local date is now stored in its own column, filled by a trigger.
+
+alter table attendance add column attendance_date date;
+
+create or replace function set_attendance_date()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.attendance_date := (new.clock_in_time at time zone 'Asia/Jakarta')::date;
+  return new;
+end;
+$$;
+
+create trigger attendance_set_date
+  before insert or update of clock_in_time on attendance
+  for each row execute function set_attendance_date();
+
+-- Backfill existing rows
+update attendance
+set attendance_date = (clock_in_time at time zone 'Asia/Jakarta')::date;
+
+alter table attendance alter column attendance_date set not null;
+
+-- Keep only the earliest clock-in of each user per day before enforcing
+-- uniqueness. The later ones are moved, with their images and notes, into
+-- attendance_duplicates_archive instead of being lost.
+create table if not exists attendance_duplicates_archive (
+  like attendance,
+  archived_at timestamp with time zone not null default now()
+);
+
+-- Only readable with the service role, the bot never uses it
+revoke all on attendance_duplicates_archive from anon, authenticated;
+
+with removed as (
+  delete from attendance a
+  using attendance b
+  where a.server_id = b.server_id
+    and a.user_id = b.user_id
+    and a.attendance_date = b.attendance_date
+    and (a.clock_in_time, a.id) > (b.clock_in_time, b.id)
+  returning a.*
+)
+insert into attendance_duplicates_archive
+select removed.*, now() from removed;
+
+-- One clock-in per user per server per local day
+create unique index idx_attendance_one_per_day on attendance(server_id, user_id, attendance_date);
+
+-- Per-day lookups and counts for a server
+create index idx_attendance_server_date on attendance(server_id, attendance_date);
+
+-- Group the statistics view by local date
+create or replace view daily_attendance_stats as
+select
+  s.name as server_name,
+  a.attendance_date,
+  count(distinct a.user_id) as unique_attendees,
+  count(a.id) as total_clock_ins,
+  array_agg(distinct u.username order by u.username) as attendee_names
+from attendance a
+join users u on a.user_id = u.id
+join servers s on a.server_id = s.id
+group by s.id, s.name, a.attendance_date
+order by attendance_date desc;
+
+-- Clock-in now relies on the unique index instead of an advisory lock
+create or replace function clock_in(
+  p_server_id bigint,
+  p_discord_id text,
+  p_clock_in_time timestamp with time zone,
+  p_image_url text,
+  p_notes text
+)
+returns table (
+  status text,
+  user_id bigint,
+  username text,
+  attendance_id bigint,
+  clock_in_time timestamp with time zone,
+  today_count bigint
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  v_user users%rowtype;
+  v_attendance attendance%rowtype;
+  v_date date := (p_clock_in_time at time zone 'Asia/Jakarta')::date;
+begin
+  select * into v_user from users u where u.discord_id = p_discord_id;
+  if not found then
+    return query select 'not_registered'::text, null::bigint, null::text,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  if not exists (
+    select 1 from user_servers us
+    where us.user_id = v_user.id and us.server_id = p_server_id
+  ) then
+    return query select 'not_member'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  insert into attendance (user_id, server_id, clock_in_time, image_url, notes)
+  values (v_user.id, p_server_id, p_clock_in_time, p_image_url, p_notes)
+  on conflict (server_id, user_id, attendance_date) do nothing
+  returning * into v_attendance;
+
+  if not found then
+    select * into v_attendance from attendance a
+    where a.server_id = p_server_id
+      and a.user_id = v_user.id
+      and a.attendance_date = v_date;
+
+    return query select 'already_clocked_in'::text, v_user.id, v_user.username,
+      v_attendance.id, v_attendance.clock_in_time, null::bigint;
+    return;
+  end if;
+
+  return query select 'ok'::text, v_user.id, v_user.username,
+    v_attendance.id, v_attendance.clock_in_time,
+    (
+      select count(*) from attendance a
+      where a.server_id = p_server_id
+        and a.attendance_date = v_date
+    );
+end;
+$$;
@@ -0,0 +1,79 @@
+-- Migration: Server-side aggregation for the attendance report
+-- Returns a single row with the period summary, the most recent days and the
+-- most active users, grouped by the local attendance_date. The payload grows
+-- with the number of days shown instead of the number of clock-ins.
+
+create or replace function attendance_report(
+  p_server_id bigint,
+  p_start_date date,
+  p_end_date date,
+  p_daily_limit integer default 7,
+  p_top_limit integer default 5,
+  p_names_per_day integer default 5
+)
+returns table (
+  total_clock_ins bigint,
+  unique_users bigint,
+  active_days bigint,
+  daily jsonb,
+  top_users jsonb
+)
+language sql
+stable
+as $$
+  with period as (
+    select a.user_id, a.attendance_date, a.clock_in_time, a.image_url
+    from attendance a
+    where a.server_id = p_server_id
+      and a.attendance_date between p_start_date and p_end_date
+  ),
+  days as (
+    select
+      p.attendance_date,
+      count(*) as clock_ins,
+      count(*) filter (where p.image_url is not null and p.image_url <> '') as with_images,
+      (array_agg(p.user_id order by p.clock_in_time desc))[1:p_names_per_day] as sample_user_ids
+    from period p
+    group by p.attendance_date
+  ),
+  recent_days as (
+    select * from days
+    order by attendance_date desc
+    limit p_daily_limit
+  ),
+  top as (
+    select p.user_id, count(*) as clock_ins
+    from period p
+    group by p.user_id
+    order by clock_ins desc, p.user_id
+    limit p_top_limit
+  )
+  select
+    (select count(*) from period),
+    (select count(distinct user_id) from period),
+    (select count(*) from days),
+    coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'date', d.attendance_date,
+        'clock_ins', d.clock_ins,
+        'with_images', d.with_images,
+        'usernames', (
+          select coalesce(jsonb_agg(u.username order by s.ord), '[]'::jsonb)
+          from unnest(d.sample_user_ids) with ordinality as s(user_id, ord)
+          join users u on u.id = s.user_id
+        )
+      ) order by d.attendance_date desc)
+      from recent_days d
+    ), '[]'::jsonb),
+    coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'username', u.username,
+        'clock_ins', t.clock_ins
+      ) order by t.clock_ins desc, t.user_id)
+      from top t
+      join users u on u.id = t.user_id
+    ), '[]'::jsonb);
+$$;
+
+grant execute on function attendance_report(bigint, date, date, integer, integer, integer)
+  to anon, authenticated, service_role;
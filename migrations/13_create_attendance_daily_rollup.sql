@@ -0,0 +1,153 @@
+-- Migration: Daily attendance rollup maintained incrementally
+-- One row per server and local day, kept current by a trigger on attendance,
+-- so reports no longer rescan raw clock-ins to build per-day numbers.
+
+create table attendance_daily_rollup (
+  server_id bigint references servers(id) not null,
+  attendance_date date not null,
+  clock_ins integer not null default 0,
+  unique_users integer not null default 0,
+  with_images integer not null default 0,
+  primary key (server_id, attendance_date)
+);
+
+alter table attendance_daily_rollup disable row level security;
+grant all privileges on attendance_daily_rollup to anon, authenticated, service_role;
+
+-- Apply the contribution of one attendance row (p_sign = 1 adds, -1 removes)
+create or replace function apply_attendance_rollup(p_row attendance, p_sign integer)
+returns void
+language plpgsql
+as $$
+declare
+  v_unique integer := 0;
+begin
+  -- A user counts once per day, whatever the number of rows
+  if not exists (
+    select 1 from attendance a
+    where a.server_id = p_row.server_id
+      and a.user_id = p_row.user_id
+      and a.attendance_date = p_row.attendance_date
+      and a.id <> p_row.id
+  ) then
+    v_unique := 1;
+  end if;
+
+  insert into attendance_daily_rollup as r (server_id, attendance_date, clock_ins, unique_users, with_images)
+  values (
+    p_row.server_id,
+    p_row.attendance_date,
+    p_sign,
+    p_sign * v_unique,
+    p_sign * (case when coalesce(p_row.image_url, '') <> '' then 1 else 0 end)
+  )
+  on conflict (server_id, attendance_date) do update
+  set clock_ins = r.clock_ins + excluded.clock_ins,
+      unique_users = r.unique_users + excluded.unique_users,
+      with_images = r.with_images + excluded.with_images;
+
+  delete from attendance_daily_rollup r
+  where r.server_id = p_row.server_id
+    and r.attendance_date = p_row.attendance_date
+    and r.clock_ins <= 0;
+end;
+$$;
+
+create or replace function maintain_attendance_rollup()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    perform apply_attendance_rollup(old, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform apply_attendance_rollup(new, 1);
+  end if;
+  return null;
+end;
+$$;
+
+create trigger attendance_maintain_rollup
+  after insert or delete or update of server_id, user_id, attendance_date, image_url on attendance
+  for each row execute function maintain_attendance_rollup();
+
+-- Covering index so per-user statistics of a period are index-only scans
+drop index if exists idx_attendance_server_date;
+create index idx_attendance_server_date on attendance(server_id, attendance_date) include (user_id);
+
+-- Report totals and the daily breakdown now come from the rollup
+create or replace function attendance_report(
+  p_server_id bigint,
+  p_start_date date,
+  p_end_date date,
+  p_daily_limit integer default 7,
+  p_top_limit integer default 5,
+  p_names_per_day integer default 5
+)
+returns table (
+  total_clock_ins bigint,
+  unique_users bigint,
+  active_days bigint,
+  daily jsonb,
+  top_users jsonb
+)
+language sql
+stable
+as $$
+  with days as (
+    select r.attendance_date, r.clock_ins, r.with_images
+    from attendance_daily_rollup r
+    where r.server_id = p_server_id
+      and r.attendance_date between p_start_date and p_end_date
+  ),
+  recent_days as (
+    select * from days
+    order by attendance_date desc
+    limit p_daily_limit
+  ),
+  period_users as (
+    select a.user_id, count(*) as clock_ins
+    from attendance a
+    where a.server_id = p_server_id
+      and a.attendance_date between p_start_date and p_end_date
+    group by a.user_id
+  ),
+  top as (
+    select * from period_users
+    order by clock_ins desc, user_id
+    limit p_top_limit
+  )
+  select
+    (select coalesce(sum(clock_ins), 0)::bigint from days),
+    (select count(*) from period_users),
+    (select count(*) from days),
+    coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'date', d.attendance_date,
+        'clock_ins', d.clock_ins,
+        'with_images', d.with_images,
+        'usernames', (
+          select coalesce(jsonb_agg(s.username order by s.clock_in_time desc), '[]'::jsonb)
+          from (
+            select u.username, a.clock_in_time
+            from attendance a
+            join users u on u.id = a.user_id
+            where a.server_id = p_server_id
+              and a.attendance_date = d.attendance_date
+            order by a.clock_in_time desc
+            limit p_names_per_day
+          ) s
+        )
+      ) order by d.attendance_date desc)
+      from recent_days d
+    ), '[]'::jsonb),
+    coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'username', u.username,
+        'clock_ins', t.clock_ins
+      ) order by t.clock_ins desc, t.user_id)
+      from top t
+      join users u on u.id = t.user_id
+    ), '[]'::jsonb);
+$$;
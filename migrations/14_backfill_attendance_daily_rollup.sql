@@ -0,0 +1,20 @@
+-- Migration: Backfill the daily attendance rollup from existing rows
+-- Safe to run again: every day is recomputed from attendance and overwritten.
+-- Writes to attendance are blocked while the rollup is rebuilt, so no clock-in
+-- can be counted twice or missed.
+
+lock table attendance in share mode;
+
+insert into attendance_daily_rollup (server_id, attendance_date, clock_ins, unique_users, with_images)
+select
+  a.server_id,
+  a.attendance_date,
+  count(*),
+  count(distinct a.user_id),
+  count(*) filter (where coalesce(a.image_url, '') <> '')
+from attendance a
+group by a.server_id, a.attendance_date
+on conflict (server_id, attendance_date) do update
+set clock_ins = excluded.clock_ins,
+    unique_users = excluded.unique_users,
+    with_images = excluded.with_images;
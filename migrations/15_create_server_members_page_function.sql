@@ -0,0 +1,36 @@
+-- Migration: Keyset pagination of registered users
+-- Pages are ordered by (joined_at, id) and start after the last row of the
+-- previous page, so every page costs the same however deep it is.
+
+create index idx_user_servers_server_joined on user_servers(server_id, joined_at, id);
+
+create or replace function server_members_page(
+  p_server_id bigint,
+  p_after_joined_at timestamp with time zone default null,
+  p_after_id bigint default null,
+  p_limit integer default 20
+)
+returns table (
+  id bigint,
+  joined_at timestamp with time zone,
+  registered_by text,
+  discord_id text,
+  username text
+)
+language sql
+stable
+as $$
+  select us.id, us.joined_at, us.registered_by, u.discord_id, u.username
+  from user_servers us
+  join users u on u.id = us.user_id
+  where us.server_id = p_server_id
+    and (
+      p_after_id is null
+      or (us.joined_at, us.id) > (p_after_joined_at, p_after_id)
+    )
+  order by us.joined_at, us.id
+  limit p_limit;
+$$;
+
+grant execute on function server_members_page(bigint, timestamp with time zone, bigint, integer)
+  to anon, authenticated, service_role;
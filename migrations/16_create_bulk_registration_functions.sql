@@ -0,0 +1,49 @@
+-- Migration: Bulk registration of guild members
+-- registered_discord_ids returns every registered Discord id of a server as a
+-- single array, so the bot can diff guild members in one query.
+-- register_members registers a batch of members in one call: missing users
+-- are created and existing memberships are left untouched.
+
+create or replace function registered_discord_ids(p_server_id bigint)
+returns table (discord_ids text[])
+language sql
+stable
+as $$
+  select coalesce(array_agg(u.discord_id), '{}')
+  from user_servers us
+  join users u on u.id = us.user_id
+  where us.server_id = p_server_id;
+$$;
+
+create or replace function register_members(
+  p_server_id bigint,
+  p_registered_by text,
+  p_members jsonb
+)
+returns table (created_users integer, registered integer)
+language plpgsql
+as $$
+declare
+  v_created_users integer;
+  v_registered integer;
+begin
+  -- p_members: [{"discord_id", "username", "avatar_url", "joined_at"}, ...]
+  insert into users (discord_id, username, avatar_url)
+  select m.discord_id, m.username, m.avatar_url
+  from jsonb_to_recordset(p_members) as m(discord_id text, username text, avatar_url text)
+  on conflict (discord_id) do nothing;
+  get diagnostics v_created_users = row_count;
+
+  insert into user_servers (user_id, server_id, joined_at, registered_by)
+  select u.id, p_server_id, coalesce(m.joined_at, timezone('utc'::text, now())), p_registered_by
+  from jsonb_to_recordset(p_members) as m(discord_id text, joined_at timestamp with time zone)
+  join users u on u.discord_id = m.discord_id
+  on conflict (user_id, server_id) do nothing;
+  get diagnostics v_registered = row_count;
+
+  return query select v_created_users, v_registered;
+end;
+$$;
+
+grant execute on function registered_discord_ids(bigint) to anon, authenticated, service_role;
+grant execute on function register_members(bigint, text, jsonb) to anon, authenticated, service_role;
@@ -0,0 +1,61 @@
+-- Migration: Support for the bot's write-behind clock-in queue
+-- Clock-ins acknowledged locally are flushed in batches. Each record carries
+-- a client_ref idempotency key, so a retried flush never inserts twice.
+
+alter table attendance add column client_ref text;
+create unique index idx_attendance_client_ref on attendance(client_ref);
+
+-- Users who already clocked in on a local day, with their clock-in time
+create or replace function clocked_in_today(p_server_id bigint, p_date date)
+returns table (clock_ins jsonb)
+language sql
+stable
+as $$
+  select coalesce(jsonb_object_agg(a.user_id, a.clock_in_time), '{}'::jsonb)
+  from attendance a
+  where a.server_id = p_server_id
+    and a.attendance_date = p_date;
+$$;
+
+-- Insert a batch of queued clock-ins
+-- status per row: 'inserted', 'duplicate' (client_ref already stored by an
+-- earlier flush) or 'conflict' (the user already has another clock-in that day)
+create or replace function flush_clock_ins(p_rows jsonb)
+returns table (client_ref text, status text)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  r record;
+  v_id bigint;
+begin
+  for r in
+    select * from jsonb_to_recordset(p_rows) as x(
+      client_ref text,
+      server_id bigint,
+      user_id bigint,
+      clock_in_time timestamp with time zone,
+      image_url text,
+      notes text
+    )
+  loop
+    insert into attendance (user_id, server_id, clock_in_time, image_url, notes, client_ref)
+    values (r.user_id, r.server_id, r.clock_in_time, r.image_url, r.notes, r.client_ref)
+    on conflict do nothing
+    returning id into v_id;
+
+    client_ref := r.client_ref;
+    if v_id is not null then
+      status := 'inserted';
+    elsif exists (select 1 from attendance a where a.client_ref = r.client_ref) then
+      status := 'duplicate';
+    else
+      status := 'conflict';
+    end if;
+    return next;
+  end loop;
+end;
+$$;
+
+grant execute on function clocked_in_today(bigint, date) to anon, authenticated, service_role;
+grant execute on function flush_clock_ins(jsonb) to anon, authenticated, service_role;
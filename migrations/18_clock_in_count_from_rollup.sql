@@ -0,0 +1,68 @@
+-- Migration: Read the clock-in count of the day from the daily rollup
+-- The rollup row is updated by the trigger of the insert, so counting the
+-- day's attendance rows on every clock-in is no longer needed.
+
+create or replace function clock_in(
+  p_server_id bigint,
+  p_discord_id text,
+  p_clock_in_time timestamp with time zone,
+  p_image_url text,
+  p_notes text
+)
+returns table (
+  status text,
+  user_id bigint,
+  username text,
+  attendance_id bigint,
+  clock_in_time timestamp with time zone,
+  today_count bigint
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  v_user users%rowtype;
+  v_attendance attendance%rowtype;
+  v_date date := (p_clock_in_time at time zone 'Asia/Jakarta')::date;
+begin
+  select * into v_user from users u where u.discord_id = p_discord_id;
+  if not found then
+    return query select 'not_registered'::text, null::bigint, null::text,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  if not exists (
+    select 1 from user_servers us
+    where us.user_id = v_user.id and us.server_id = p_server_id
+  ) then
+    return query select 'not_member'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  insert into attendance (user_id, server_id, clock_in_time, image_url, notes)
+  values (v_user.id, p_server_id, p_clock_in_time, p_image_url, p_notes)
+  on conflict (server_id, user_id, attendance_date) do nothing
+  returning * into v_attendance;
+
+  if not found then
+    select * into v_attendance from attendance a
+    where a.server_id = p_server_id
+      and a.user_id = v_user.id
+      and a.attendance_date = v_date;
+
+    return query select 'already_clocked_in'::text, v_user.id, v_user.username,
+      v_attendance.id, v_attendance.clock_in_time, null::bigint;
+    return;
+  end if;
+
+  return query select 'ok'::text, v_user.id, v_user.username,
+    v_attendance.id, v_attendance.clock_in_time,
+    (
+      select r.unique_users::bigint from attendance_daily_rollup r
+      where r.server_id = p_server_id
+        and r.attendance_date = v_date
+    );
+end;
+$$;
@@ -0,0 +1,48 @@
+-- Migration: Keep clock-in images in Supabase Storage
+-- Discord CDN links expire, so the bot copies every clock-in image and a
+-- thumbnail into a public bucket and points the attendance row at the copy.
+
+alter table attendance add column thumbnail_url text;
+
+insert into storage.buckets (id, name, public)
+values ('attendance-images', 'attendance-images', true)
+on conflict (id) do nothing;
+
+-- Queued clock-ins may already carry the stored image and thumbnail
+create or replace function flush_clock_ins(p_rows jsonb)
+returns table (client_ref text, status text)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  r record;
+  v_id bigint;
+begin
+  for r in
+    select * from jsonb_to_recordset(p_rows) as x(
+      client_ref text,
+      server_id bigint,
+      user_id bigint,
+      clock_in_time timestamp with time zone,
+      image_url text,
+      thumbnail_url text,
+      notes text
+    )
+  loop
+    insert into attendance (user_id, server_id, clock_in_time, image_url, thumbnail_url, notes, client_ref)
+    values (r.user_id, r.server_id, r.clock_in_time, r.image_url, r.thumbnail_url, r.notes, r.client_ref)
+    on conflict do nothing
+    returning id into v_id;
+
+    client_ref := r.client_ref;
+    if v_id is not null then
+      status := 'inserted';
+    elsif exists (select 1 from attendance a where a.client_ref = r.client_ref) then
+      status := 'duplicate';
+    else
+      status := 'conflict';
+    end if;
+    return next;
+  end loop;
+end;
+$$;
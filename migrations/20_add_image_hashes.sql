@@ -0,0 +1,183 @@
+-- Migration: Perceptual-hash duplicate detection for clock-in images
+-- The bot hashes every clock-in image and compares it with the same user's
+-- recent images. A near-duplicate records the date of the earlier clock-in
+-- and how many bits the hashes differ by.
+
+alter table attendance
+  add column image_hash bigint,
+  add column similar_to_date date,
+  add column image_distance smallint;
+
+-- Exact image re-use across the whole server
+create index idx_attendance_image_hash on attendance(server_id, image_hash)
+  where image_hash is not null;
+
+-- Flagged clock-ins of a server by date
+create index idx_attendance_flagged on attendance(server_id, attendance_date)
+  where similar_to_date is not null;
+
+-- Queued clock-ins may carry the image hash and duplicate check
+create or replace function flush_clock_ins(p_rows jsonb)
+returns table (client_ref text, status text)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  r record;
+  v_id bigint;
+begin
+  for r in
+    select * from jsonb_to_recordset(p_rows) as x(
+      client_ref text,
+      server_id bigint,
+      user_id bigint,
+      clock_in_time timestamp with time zone,
+      image_url text,
+      thumbnail_url text,
+      image_hash bigint,
+      similar_to_date date,
+      image_distance smallint,
+      notes text
+    )
+  loop
+    insert into attendance (
+      user_id, server_id, clock_in_time, image_url, thumbnail_url,
+      image_hash, similar_to_date, image_distance, notes, client_ref
+    )
+    values (
+      r.user_id, r.server_id, r.clock_in_time, r.image_url, r.thumbnail_url,
+      r.image_hash, r.similar_to_date, r.image_distance, r.notes, r.client_ref
+    )
+    on conflict do nothing
+    returning id into v_id;
+
+    client_ref := r.client_ref;
+    if v_id is not null then
+      status := 'inserted';
+    elsif exists (select 1 from attendance a where a.client_ref = r.client_ref) then
+      status := 'duplicate';
+    else
+      status := 'conflict';
+    end if;
+    return next;
+  end loop;
+end;
+$$;
+
+-- Most recent flagged clock-ins of a server
+create or replace function suspicious_clock_ins(
+  p_server_id bigint,
+  p_since date,
+  p_limit integer default 20
+)
+returns table (
+  username text,
+  attendance_date date,
+  similar_to_date date,
+  image_distance smallint,
+  image_url text
+)
+language sql
+stable
+as $$
+  select u.username, a.attendance_date, a.similar_to_date, a.image_distance, a.image_url
+  from attendance a
+  join users u on u.id = a.user_id
+  where a.server_id = p_server_id
+    and a.attendance_date >= p_since
+    and a.similar_to_date is not null
+  order by a.attendance_date desc, a.clock_in_time desc
+  limit p_limit;
+$$;
+
+grant execute on function suspicious_clock_ins(bigint, date, integer)
+  to anon, authenticated, service_role;
+
+-- The report also counts flagged images; the return type changes, so the
+-- function is recreated
+drop function attendance_report(bigint, date, date, integer, integer, integer);
+
+create or replace function attendance_report(
+  p_server_id bigint,
+  p_start_date date,
+  p_end_date date,
+  p_daily_limit integer default 7,
+  p_top_limit integer default 5,
+  p_names_per_day integer default 5
+)
+returns table (
+  total_clock_ins bigint,
+  unique_users bigint,
+  active_days bigint,
+  daily jsonb,
+  top_users jsonb,
+  flagged_images bigint
+)
+language sql
+stable
+as $$
+  with days as (
+    select r.attendance_date, r.clock_ins, r.with_images
+    from attendance_daily_rollup r
+    where r.server_id = p_server_id
+      and r.attendance_date between p_start_date and p_end_date
+  ),
+  recent_days as (
+    select * from days
+    order by attendance_date desc
+    limit p_daily_limit
+  ),
+  period_users as (
+    select a.user_id, count(*) as clock_ins
+    from attendance a
+    where a.server_id = p_server_id
+      and a.attendance_date between p_start_date and p_end_date
+    group by a.user_id
+  ),
+  top as (
+    select * from period_users
+    order by clock_ins desc, user_id
+    limit p_top_limit
+  )
+  select
+    (select coalesce(sum(clock_ins), 0)::bigint from days),
+    (select count(*) from period_users),
+    (select count(*) from days),
+    coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'date', d.attendance_date,
+        'clock_ins', d.clock_ins,
+        'with_images', d.with_images,
+        'usernames', (
+          select coalesce(jsonb_agg(s.username order by s.clock_in_time desc), '[]'::jsonb)
+          from (
+            select u.username, a.clock_in_time
+            from attendance a
+            join users u on u.id = a.user_id
+            where a.server_id = p_server_id
+              and a.attendance_date = d.attendance_date
+            order by a.clock_in_time desc
+            limit p_names_per_day
+          ) s
+        )
+      ) order by d.attendance_date desc)
+      from recent_days d
+    ), '[]'::jsonb),
+    coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'username', u.username,
+        'clock_ins', t.clock_ins
+      ) order by t.clock_ins desc, t.user_id)
+      from top t
+      join users u on u.id = t.user_id
+    ), '[]'::jsonb),
+    (
+      select count(*) from attendance a
+      where a.server_id = p_server_id
+        and a.attendance_date between p_start_date and p_end_date
+        and a.similar_to_date is not null
+    );
+$$;
+
+grant execute on function attendance_report(bigint, date, date, integer, integer, integer)
+  to anon, authenticated, service_role;
@@ -0,0 +1,278 @@
+-- Migration: Attendance points and leaderboards
+-- Every clock-in is classified by the bot (on_time, almost_late or late) and
+-- earns points. Totals and streaks per user are kept up to date by a trigger,
+-- one row update per clock-in, so leaderboards are read straight from an
+-- index instead of being recomputed from attendance history.
+
+alter table attendance
+  add column punctuality text check (punctuality in ('on_time', 'almost_late', 'late')),
+  add column points smallint not null default 0;
+
+-- All-time totals; streak counts consecutive clock-ins that were not late
+create table user_points (
+  server_id bigint references servers(id) not null,
+  user_id bigint references users(id) on delete cascade not null,
+  points integer not null default 0,
+  clock_ins integer not null default 0,
+  on_time integer not null default 0,
+  streak integer not null default 0,
+  best_streak integer not null default 0,
+  last_date date,
+  primary key (server_id, user_id)
+);
+
+-- Totals per calendar week (starting Monday) and month
+create table user_points_period (
+  server_id bigint references servers(id) not null,
+  period text not null check (period in ('week', 'month')),
+  period_start date not null,
+  user_id bigint references users(id) on delete cascade not null,
+  points integer not null default 0,
+  clock_ins integer not null default 0,
+  primary key (server_id, period, period_start, user_id)
+);
+
+create index idx_user_points_rank on user_points(server_id, points desc, user_id);
+create index idx_user_points_period_rank on user_points_period(server_id, period, period_start, points desc, user_id);
+
+alter table user_points disable row level security;
+alter table user_points_period disable row level security;
+grant all privileges on user_points, user_points_period to anon, authenticated, service_role;
+
+-- Add (p_sign = 1) or remove (p_sign = -1) the points of one attendance row
+create or replace function apply_user_points(p_row attendance, p_sign integer)
+returns void
+language plpgsql
+as $$
+declare
+  v_on_time integer := case when p_row.punctuality = 'on_time' then 1 else 0 end;
+begin
+  insert into user_points as p (server_id, user_id, points, clock_ins, on_time)
+  values (p_row.server_id, p_row.user_id, p_sign * p_row.points, p_sign, p_sign * v_on_time)
+  on conflict (server_id, user_id) do update
+  set points = p.points + excluded.points,
+      clock_ins = p.clock_ins + excluded.clock_ins,
+      on_time = p.on_time + excluded.on_time;
+
+  insert into user_points_period as p (server_id, period, period_start, user_id, points, clock_ins)
+  values
+    (p_row.server_id, 'week', date_trunc('week', p_row.attendance_date)::date, p_row.user_id, p_sign * p_row.points, p_sign),
+    (p_row.server_id, 'month', date_trunc('month', p_row.attendance_date)::date, p_row.user_id, p_sign * p_row.points, p_sign)
+  on conflict (server_id, period, period_start, user_id) do update
+  set points = p.points + excluded.points,
+      clock_ins = p.clock_ins + excluded.clock_ins;
+end;
+$$;
+
+create or replace function maintain_user_points()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    perform apply_user_points(old, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform apply_user_points(new, 1);
+  end if;
+
+  -- Streaks only move forward with new clock-ins
+  if tg_op = 'INSERT' then
+    update user_points p
+    set streak = case when new.punctuality = 'late' then 0 else p.streak + 1 end,
+        best_streak = greatest(p.best_streak, case when new.punctuality = 'late' then 0 else p.streak + 1 end),
+        last_date = greatest(p.last_date, new.attendance_date)
+    where p.server_id = new.server_id
+      and p.user_id = new.user_id;
+  end if;
+  return null;
+end;
+$$;
+
+-- Existing clock-ins are scored and totalled by
+-- 26_backfill_attendance_points.sql, which runs once per-server schedules
+-- (23_create_guild_settings.sql) exist
+
+-- Keep the totals current from now on
+create trigger attendance_maintain_user_points
+  after insert or delete or update of server_id, user_id, attendance_date, punctuality, points on attendance
+  for each row execute function maintain_user_points();
+
+-- Clock-in takes the classification and points from the bot
+drop function clock_in(bigint, text, timestamp with time zone, text, text);
+
+create or replace function clock_in(
+  p_server_id bigint,
+  p_discord_id text,
+  p_clock_in_time timestamp with time zone,
+  p_image_url text,
+  p_notes text,
+  p_punctuality text default null,
+  p_points integer default 0
+)
+returns table (
+  status text,
+  user_id bigint,
+  username text,
+  attendance_id bigint,
+  clock_in_time timestamp with time zone,
+  today_count bigint
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  v_user users%rowtype;
+  v_attendance attendance%rowtype;
+  v_date date := (p_clock_in_time at time zone 'Asia/Jakarta')::date;
+begin
+  select * into v_user from users u where u.discord_id = p_discord_id;
+  if not found then
+    return query select 'not_registered'::text, null::bigint, null::text,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  if not exists (
+    select 1 from user_servers us
+    where us.user_id = v_user.id and us.server_id = p_server_id
+  ) then
+    return query select 'not_member'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  insert into attendance (user_id, server_id, clock_in_time, image_url, notes, punctuality, points)
+  values (v_user.id, p_server_id, p_clock_in_time, p_image_url, p_notes, p_punctuality, p_points)
+  on conflict (server_id, user_id, attendance_date) do nothing
+  returning * into v_attendance;
+
+  if not found then
+    select * into v_attendance from attendance a
+    where a.server_id = p_server_id
+      and a.user_id = v_user.id
+      and a.attendance_date = v_date;
+
+    return query select 'already_clocked_in'::text, v_user.id, v_user.username,
+      v_attendance.id, v_attendance.clock_in_time, null::bigint;
+    return;
+  end if;
+
+  return query select 'ok'::text, v_user.id, v_user.username,
+    v_attendance.id, v_attendance.clock_in_time,
+    (
+      select r.unique_users::bigint from attendance_daily_rollup r
+      where r.server_id = p_server_id
+        and r.attendance_date = v_date
+    );
+end;
+$$;
+
+grant execute on function clock_in(bigint, text, timestamp with time zone, text, text, text, integer)
+  to anon, authenticated, service_role;
+
+-- Queued clock-ins carry their classification and points too
+create or replace function flush_clock_ins(p_rows jsonb)
+returns table (client_ref text, status text)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  r record;
+  v_id bigint;
+begin
+  for r in
+    select * from jsonb_to_recordset(p_rows) as x(
+      client_ref text,
+      server_id bigint,
+      user_id bigint,
+      clock_in_time timestamp with time zone,
+      image_url text,
+      thumbnail_url text,
+      image_hash bigint,
+      similar_to_date date,
+      image_distance smallint,
+      notes text,
+      punctuality text,
+      points smallint
+    )
+  loop
+    insert into attendance (
+      user_id, server_id, clock_in_time, image_url, thumbnail_url,
+      image_hash, similar_to_date, image_distance, notes, client_ref,
+      punctuality, points
+    )
+    values (
+      r.user_id, r.server_id, r.clock_in_time, r.image_url, r.thumbnail_url,
+      r.image_hash, r.similar_to_date, r.image_distance, r.notes, r.client_ref,
+      r.punctuality, coalesce(r.points, 0)
+    )
+    on conflict do nothing
+    returning id into v_id;
+
+    client_ref := r.client_ref;
+    if v_id is not null then
+      status := 'inserted';
+    elsif exists (select 1 from attendance a where a.client_ref = r.client_ref) then
+      status := 'duplicate';
+    else
+      status := 'conflict';
+    end if;
+    return next;
+  end loop;
+end;
+$$;
+
+-- Top users of a server for 'week', 'month' or 'all' time
+-- p_period_start is the first day of the week or month, ignored for 'all'
+create or replace function leaderboard(
+  p_server_id bigint,
+  p_period text,
+  p_period_start date default null,
+  p_limit integer default 10
+)
+returns table (
+  rank bigint,
+  username text,
+  points integer,
+  clock_ins integer,
+  streak integer,
+  best_streak integer
+)
+language plpgsql
+stable
+as $$
+#variable_conflict use_column
+begin
+  if p_period = 'all' then
+    return query
+    select rank() over (order by p.points desc), u.username, p.points, p.clock_ins, p.streak, p.best_streak
+    from (
+      select * from user_points p
+      where p.server_id = p_server_id
+      order by p.points desc, p.user_id
+      limit p_limit
+    ) p
+    join users u on u.id = p.user_id
+    order by p.points desc, p.user_id;
+  else
+    return query
+    select rank() over (order by t.points desc), u.username, t.points, t.clock_ins,
+      coalesce(a.streak, 0), coalesce(a.best_streak, 0)
+    from (
+      select * from user_points_period p
+      where p.server_id = p_server_id
+        and p.period = p_period
+        and p.period_start = p_period_start
+      order by p.points desc, p.user_id
+      limit p_limit
+    ) t
+    join users u on u.id = t.user_id
+    left join user_points a on a.server_id = t.server_id and a.user_id = t.user_id
+    order by t.points desc, t.user_id;
+  end if;
+end;
+$$;
+
+grant execute on function leaderboard(bigint, text, date, integer)
+  to anon, authenticated, service_role;
@@ -0,0 +1,39 @@
+-- Migration: Clock-in reminders
+-- Each row is a daily local time at which the bot reminds the registered
+-- members of a server who have not clocked in yet, by DM or with one ping
+-- in a channel.
+
+create table clock_in_reminders (
+  id bigserial primary key,
+  server_id bigint references servers(id) on delete cascade not null,
+  remind_at time not null,
+  -- Discord channel to ping in, or null to send DMs
+  channel_id text,
+  created_by text not null,
+  created_at timestamp with time zone default now(),
+  unique (server_id, remind_at)
+);
+
+alter table clock_in_reminders disable row level security;
+grant all privileges on clock_in_reminders to anon, authenticated, service_role;
+grant usage, select on sequence clock_in_reminders_id_seq to anon, authenticated, service_role;
+
+-- Registered members of a server without a clock-in on a local day, in one query
+create or replace function unclocked_members(p_server_id bigint, p_date date)
+returns table (user_id bigint, discord_id text)
+language sql
+stable
+as $$
+  select u.id, u.discord_id
+  from user_servers us
+  join users u on u.id = us.user_id
+  where us.server_id = p_server_id
+    and not exists (
+      select 1 from attendance a
+      where a.server_id = p_server_id
+        and a.user_id = us.user_id
+        and a.attendance_date = p_date
+    );
+$$;
+
+grant execute on function unclocked_members(bigint, date) to anon, authenticated, service_role;
@@ -0,0 +1,113 @@
+-- Migration: Per-server work schedule
+-- Timezone, earliest clock-in time and lateness thresholds of each server,
+-- changed with `!oke settings`. Servers without a row keep the original
+-- schedule: Asia/Jakarta, clock-in from 07:30, almost late from 08:45 and
+-- late after 09:00.
+
+create table guild_settings (
+  server_id bigint primary key references servers(id) on delete cascade,
+  -- IANA timezone name, also used for the local date of clock-ins
+  timezone text not null default 'Asia/Jakarta',
+  earliest_time time not null default '07:30',
+  almost_late_time time not null default '08:45',
+  late_time time not null default '09:00',
+  updated_by text,
+  updated_at timestamp with time zone default now(),
+  check (earliest_time <= almost_late_time and almost_late_time <= late_time)
+);
+
+alter table guild_settings disable row level security;
+grant all privileges on guild_settings to anon, authenticated, service_role;
+
+-- Timezone of a server, Asia/Jakarta unless configured
+create or replace function server_timezone(p_server_id bigint)
+returns text
+language sql
+stable
+as $$
+  select coalesce(
+    (select s.timezone from guild_settings s where s.server_id = p_server_id),
+    'Asia/Jakarta'
+  );
+$$;
+
+grant execute on function server_timezone(bigint) to anon, authenticated, service_role;
+
+-- The local date of new clock-ins follows the server's timezone. Existing
+-- rows keep the date they were recorded with.
+create or replace function set_attendance_date()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.attendance_date := (new.clock_in_time at time zone server_timezone(new.server_id))::date;
+  return new;
+end;
+$$;
+
+create or replace function clock_in(
+  p_server_id bigint,
+  p_discord_id text,
+  p_clock_in_time timestamp with time zone,
+  p_image_url text,
+  p_notes text,
+  p_punctuality text default null,
+  p_points integer default 0
+)
+returns table (
+  status text,
+  user_id bigint,
+  username text,
+  attendance_id bigint,
+  clock_in_time timestamp with time zone,
+  today_count bigint
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  v_user users%rowtype;
+  v_attendance attendance%rowtype;
+  v_date date := (p_clock_in_time at time zone server_timezone(p_server_id))::date;
+begin
+  select * into v_user from users u where u.discord_id = p_discord_id;
+  if not found then
+    return query select 'not_registered'::text, null::bigint, null::text,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  if not exists (
+    select 1 from user_servers us
+    where us.user_id = v_user.id and us.server_id = p_server_id
+  ) then
+    return query select 'not_member'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::bigint;
+    return;
+  end if;
+
+  insert into attendance (user_id, server_id, clock_in_time, image_url, notes, punctuality, points)
+  values (v_user.id, p_server_id, p_clock_in_time, p_image_url, p_notes, p_punctuality, p_points)
+  on conflict (server_id, user_id, attendance_date) do nothing
+  returning * into v_attendance;
+
+  if not found then
+    select * into v_attendance from attendance a
+    where a.server_id = p_server_id
+      and a.user_id = v_user.id
+      and a.attendance_date = v_date;
+
+    return query select 'already_clocked_in'::text, v_user.id, v_user.username,
+      v_attendance.id, v_attendance.clock_in_time, null::bigint;
+    return;
+  end if;
+
+  return query select 'ok'::text, v_user.id, v_user.username,
+    v_attendance.id, v_attendance.clock_in_time,
+    (
+      select r.unique_users::bigint from attendance_daily_rollup r
+      where r.server_id = p_server_id
+        and r.attendance_date = v_date
+    );
+end;
+$$;
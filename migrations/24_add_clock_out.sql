@@ -0,0 +1,148 @@
+-- Migration: Clock-out and worked hours
+-- A clock-in opens a session that `!oke clockout` closes. Open sessions are
+-- found through a partial index that only holds rows without a clock-out, so
+-- it stays small however long the attendance history grows. Sessions left
+-- open too long are closed by the bot's sweeper and marked auto_clocked_out;
+-- they count as sessions but not as worked time.
+
+alter table attendance
+  add column clock_out_time timestamp with time zone,
+  add column auto_clocked_out boolean not null default false,
+  add constraint attendance_clock_out_after_clock_in check (clock_out_time >= clock_in_time);
+
+-- Clock-ins recorded before clock-outs existed are closed without worked time
+update attendance
+set clock_out_time = clock_in_time,
+    auto_clocked_out = true
+where clock_in_time < now() - interval '1 day';
+
+-- Open session of a user, and open sessions by age for the sweeper
+create index idx_attendance_open_user on attendance(server_id, user_id) where clock_out_time is null;
+create index idx_attendance_open_since on attendance(clock_in_time) where clock_out_time is null;
+
+-- Close the open session of a user in a single round-trip. Sessions opened
+-- more than p_max_duration ago are left to the sweeper.
+create or replace function clock_out(
+  p_server_id bigint,
+  p_discord_id text,
+  p_clock_out_time timestamp with time zone,
+  p_max_duration interval default '16 hours'
+)
+returns table (
+  status text,
+  user_id bigint,
+  username text,
+  attendance_id bigint,
+  clock_in_time timestamp with time zone,
+  clock_out_time timestamp with time zone
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  v_user users%rowtype;
+  v_id bigint;
+  v_clock_in_time timestamp with time zone;
+begin
+  select * into v_user from users u where u.discord_id = p_discord_id;
+  if not found then
+    return query select 'not_registered'::text, null::bigint, null::text,
+      null::bigint, null::timestamp with time zone, null::timestamp with time zone;
+    return;
+  end if;
+
+  if not exists (
+    select 1 from user_servers us
+    where us.user_id = v_user.id and us.server_id = p_server_id
+  ) then
+    return query select 'not_member'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::timestamp with time zone;
+    return;
+  end if;
+
+  select a.id, a.clock_in_time into v_id, v_clock_in_time
+  from attendance a
+  where a.server_id = p_server_id
+    and a.user_id = v_user.id
+    and a.clock_out_time is null
+    and a.clock_in_time >= p_clock_out_time - p_max_duration
+  order by a.clock_in_time desc
+  limit 1
+  for update;
+
+  if v_id is null then
+    return query select 'not_clocked_in'::text, v_user.id, v_user.username,
+      null::bigint, null::timestamp with time zone, null::timestamp with time zone;
+    return;
+  end if;
+
+  update attendance a
+  set clock_out_time = greatest(p_clock_out_time, v_clock_in_time)
+  where a.id = v_id;
+
+  return query select 'ok'::text, v_user.id, v_user.username,
+    v_id, v_clock_in_time, greatest(p_clock_out_time, v_clock_in_time);
+end;
+$$;
+
+grant execute on function clock_out(bigint, text, timestamp with time zone, interval)
+  to anon, authenticated, service_role;
+
+-- Close every session open for longer than p_max_duration, returning how many
+create or replace function close_stale_sessions(p_max_duration interval)
+returns table (closed bigint)
+language sql
+as $$
+  with closed as (
+    update attendance a
+    set clock_out_time = a.clock_in_time + p_max_duration,
+        auto_clocked_out = true
+    where a.clock_out_time is null
+      and a.clock_in_time < now() - p_max_duration
+    returning 1
+  )
+  select count(*) from closed;
+$$;
+
+grant execute on function close_stale_sessions(interval) to anon, authenticated, service_role;
+
+-- Worked time per user and local day or week (starting Monday) of a server,
+-- optionally for a single user. Open and auto-closed sessions add no time.
+create or replace function worked_hours(
+  p_server_id bigint,
+  p_start_date date,
+  p_end_date date,
+  p_period text default 'day',
+  p_user_id bigint default null
+)
+returns table (
+  period_start date,
+  user_id bigint,
+  username text,
+  sessions bigint,
+  worked_seconds bigint,
+  open_sessions bigint,
+  missed_clock_outs bigint
+)
+language sql
+stable
+as $$
+  select
+    date_trunc(p_period, a.attendance_date)::date,
+    a.user_id,
+    u.username,
+    count(*),
+    coalesce(sum(extract(epoch from a.clock_out_time - a.clock_in_time))
+      filter (where a.clock_out_time is not null and not a.auto_clocked_out), 0)::bigint,
+    count(*) filter (where a.clock_out_time is null),
+    count(*) filter (where a.auto_clocked_out)
+  from attendance a
+  join users u on u.id = a.user_id
+  where a.server_id = p_server_id
+    and a.attendance_date between p_start_date and p_end_date
+    and (p_user_id is null or a.user_id = p_user_id)
+  group by 1, a.user_id, u.username
+  order by 1, 5 desc, u.username;
+$$;
+
+grant execute on function worked_hours(bigint, date, date, text, bigint) to anon, authenticated, service_role;
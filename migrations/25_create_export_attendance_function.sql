@@ -0,0 +1,52 @@
+-- Migration: Keyset pagination of attendance for exports
+-- `!oke export` reads a date range page by page, ordered by
+-- (attendance_date, id) and starting after the last row of the previous
+-- page, so every page costs the same however far into the export it is.
+
+-- Replaces idx_attendance_server_date, which is a prefix of it; user_id stays
+-- included for the index-only per-day counts
+create index idx_attendance_server_date_id on attendance(server_id, attendance_date, id) include (user_id);
+drop index if exists idx_attendance_server_date;
+
+create or replace function export_attendance(
+  p_server_id bigint,
+  p_start_date date,
+  p_end_date date,
+  p_after_date date default null,
+  p_after_id bigint default null,
+  p_limit integer default 1000
+)
+returns table (
+  id bigint,
+  attendance_date date,
+  discord_id text,
+  username text,
+  clock_in_time timestamp with time zone,
+  clock_out_time timestamp with time zone,
+  auto_clocked_out boolean,
+  punctuality text,
+  points smallint,
+  notes text,
+  image_url text,
+  similar_to_date date
+)
+language sql
+stable
+as $$
+  select a.id, a.attendance_date, u.discord_id, u.username, a.clock_in_time,
+    a.clock_out_time, a.auto_clocked_out, a.punctuality, a.points, a.notes,
+    a.image_url, a.similar_to_date
+  from attendance a
+  join users u on u.id = a.user_id
+  where a.server_id = p_server_id
+    and a.attendance_date between p_start_date and p_end_date
+    and (
+      p_after_id is null
+      or (a.attendance_date, a.id) > (p_after_date, p_after_id)
+    )
+  order by a.attendance_date, a.id
+  limit p_limit;
+$$;
+
+grant execute on function export_attendance(bigint, date, date, date, bigint, integer)
+  to anon, authenticated, service_role;
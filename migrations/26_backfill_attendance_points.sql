@@ -0,0 +1,73 @@
+-- Migration: Score existing clock-ins and rebuild the points totals
+-- Clock-ins recorded before points existed have no punctuality. They are
+-- classified with their server's schedule from guild_settings (the original
+-- Asia/Jakarta 08:45 / 09:00 schedule for servers without one) and given the
+-- bot's default points: 10 on time, 7 almost late, 3 late. Deployments that
+-- set POINTS_* differently should adjust the values below before running it;
+-- the database does not know the bot's environment.
+--
+-- Safe to run again: only unscored clock-ins are classified and the totals
+-- are rebuilt from attendance. Writes to attendance are blocked meanwhile.
+
+lock table attendance in share row exclusive mode;
+
+-- The totals are rebuilt below, maintaining them row by row would be wasted work
+alter table attendance disable trigger attendance_maintain_user_points;
+
+update attendance a
+set punctuality = scored.punctuality,
+    points = case scored.punctuality
+      when 'late' then 3
+      when 'almost_late' then 7
+      else 10
+    end
+from (
+  select a.id,
+    case
+      when (a.clock_in_time at time zone coalesce(gs.timezone, 'Asia/Jakarta'))::time > coalesce(gs.late_time, '09:00') then 'late'
+      when (a.clock_in_time at time zone coalesce(gs.timezone, 'Asia/Jakarta'))::time >= coalesce(gs.almost_late_time, '08:45') then 'almost_late'
+      else 'on_time'
+    end as punctuality
+  from attendance a
+  left join guild_settings gs on gs.server_id = a.server_id
+  where a.punctuality is null
+) scored
+where a.id = scored.id;
+
+alter table attendance enable trigger attendance_maintain_user_points;
+
+delete from user_points;
+delete from user_points_period;
+
+-- Totals of all clock-ins in one pass
+insert into user_points (server_id, user_id, points, clock_ins, on_time, streak, best_streak, last_date)
+with numbered as (
+  select a.server_id, a.user_id, a.attendance_date, a.points, a.punctuality,
+    -- Clock-ins separated by a late one fall in different islands
+    sum(case when a.punctuality = 'late' then 1 else 0 end)
+      over (partition by a.server_id, a.user_id order by a.attendance_date) as island,
+    sum(case when a.punctuality = 'late' then 1 else 0 end)
+      over (partition by a.server_id, a.user_id order by a.attendance_date desc) as lates_after
+  from attendance a
+),
+islands as (
+  select server_id, user_id, island, count(*) filter (where punctuality <> 'late') as length
+  from numbered
+  group by server_id, user_id, island
+)
+select n.server_id, n.user_id,
+  sum(n.points),
+  count(*),
+  count(*) filter (where n.punctuality = 'on_time'),
+  count(*) filter (where n.lates_after = 0),
+  (select coalesce(max(i.length), 0) from islands i where i.server_id = n.server_id and i.user_id = n.user_id),
+  max(n.attendance_date)
+from numbered n
+group by n.server_id, n.user_id;
+
+insert into user_points_period (server_id, period, period_start, user_id, points, clock_ins)
+select a.server_id, p.period, date_trunc(p.period, a.attendance_date)::date, a.user_id, sum(a.points), count(*)
+from attendance a
+cross join (values ('week'), ('month')) as p(period)
+group by a.server_id, p.period, date_trunc(p.period, a.attendance_date)::date, a.user_id;
+
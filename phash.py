@@ -0,0 +1,100 @@
+"""Perceptual hashes of clock-in images and a near-duplicate index
+
+`phash` reduces an image to 64 bits that barely change when the same photo
+is re-encoded, resized or slightly cropped, so re-used images end up a few
+bits apart. `HashIndex` finds hashes within a small Hamming distance
+without comparing against every stored hash.
+"""
+import math
+from PIL import Image
+
+# The hash keeps the HASH_SIZE x HASH_SIZE lowest frequencies of a
+# SAMPLE_SIZE x SAMPLE_SIZE grayscale copy of the image
+HASH_SIZE = 8
+SAMPLE_SIZE = 32
+
+# DCT-II basis for the frequencies that are kept
+_COSINES = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * SAMPLE_SIZE)) for x in range(SAMPLE_SIZE)]
+    for u in range(HASH_SIZE)
+]
+
+def phash(image: Image.Image):
+    """Return the 64-bit perceptual hash of an image as an unsigned int"""
+    pixels = list(image.convert('L').resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.LANCZOS).getdata())
+    rows = [pixels[y * SAMPLE_SIZE:(y + 1) * SAMPLE_SIZE] for y in range(SAMPLE_SIZE)]
+
+    # Separable DCT: transform the rows, then the columns of the result
+    row_freqs = [[sum(p * c for p, c in zip(row, cosines)) for cosines in _COSINES] for row in rows]
+    freqs = [
+        sum(row_freqs[y][u] * _COSINES[v][y] for y in range(SAMPLE_SIZE))
+        for v in range(HASH_SIZE)
+        for u in range(HASH_SIZE)
+    ]
+
+    # The DC term only reflects overall brightness, leave it out of the median
+    median = sorted(freqs[1:])[len(freqs[1:]) // 2]
+    value = 0
+    for freq in freqs:
+        value = (value << 1) | (freq > median)
+    return value
+
+def to_signed(value: int):
+    """Convert an unsigned 64-bit hash for a Postgres bigint column"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value: int):
+    """Convert a hash read from a bigint column back to unsigned"""
+    return value + (1 << 64) if value < 0 else value
+
+def hamming(a: int, b: int):
+    """Number of differing bits between two hashes"""
+    return (a ^ b).bit_count()
+
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes
+
+    Hashes are split into BANDS bands of 8 bits, each with its own lookup
+    table. Two hashes at most BANDS - 1 bits apart agree exactly on at
+    least one band, so a query only compares the few hashes sharing a band
+    with it instead of the whole history.
+    """
+
+    BANDS = 8
+    BAND_BITS = 64 // BANDS
+
+    def __init__(self):
+        self._values = []
+        self._refs = []
+        # band value -> positions in _values
+        self._tables = [{} for _ in range(self.BANDS)]
+
+    def _bands(self, value: int):
+        mask = (1 << self.BAND_BITS) - 1
+        return [(value >> (band * self.BAND_BITS)) & mask for band in range(self.BANDS)]
+
+    def add(self, value: int, ref):
+        """Index a hash together with a reference returned by `query`"""
+        position = len(self._values)
+        self._values.append(value)
+        self._refs.append(ref)
+        for table, key in zip(self._tables, self._bands(value)):
+            table.setdefault(key, []).append(position)
+
+    def query(self, value: int, max_distance: int):
+        """Return [(distance, ref)] of indexed hashes within `max_distance`, closest first"""
+        if max_distance >= self.BANDS:
+            raise ValueError(f"max_distance must be below {self.BANDS}")
+        matches = {}
+        for table, key in zip(self._tables, self._bands(value)):
+            for position in table.get(key, ()):
+                if position not in matches:
+                    matches[position] = hamming(value, self._values[position])
+        return sorted(
+            (distance, self._refs[position])
+            for position, distance in matches.items()
+            if distance <= max_distance
+        )
+
+    def __len__(self):
+        return len(self._values)
@@ -0,0 +1,70 @@
+"""Per-guild token buckets for database calls
+
+When a whole guild clocks in at once, its requests are spread out at a
+steady rate instead of hitting Supabase together. Callers over the limit
+wait for a token in arrival order; nothing is rejected.
+"""
+import asyncio
+import time
+
+# Seconds between sweeps of idle buckets
+PRUNE_INTERVAL = 60
+
+class TokenBucket:
+    """Allows `rate` calls per second with bursts of up to `burst` calls"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # Serves waiting callers first-come first-served
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Take one token, waiting until one is available"""
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def idle(self):
+        """True when the bucket is full and nobody is waiting on it"""
+        self._refill()
+        return self.tokens >= self.burst and not self._lock.locked()
+
+class GuildRateLimiter:
+    """One token bucket per guild, created on first use"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._pruned = time.monotonic()
+
+    async def acquire(self, key):
+        """Wait for a token from the bucket of `key`"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+    def _prune(self):
+        # Full buckets behave like new ones, drop them instead of keeping one per guild forever
+        now = time.monotonic()
+        if now - self._pruned < PRUNE_INTERVAL:
+            return
+        self._pruned = now
+        for key in [k for k, b in self._buckets.items() if b.idle()]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
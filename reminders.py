@@ -0,0 +1,209 @@
+"""Daily reminders for members who have not clocked in yet
+
+Every reminder is one job in a shared `Scheduler`. When it fires, the
+members still missing are found with a single query and the messages are
+handed to a `MessageSender`, whose fixed set of workers paces them below
+Discord's rate limits. The number of background tasks does not grow with
+the number of servers, reminders or members.
+"""
+import asyncio
+import datetime
+import discord
+import database
+from cache import guild_cache
+from clockin_queue import clockin_queue
+from guild_settings import guild_settings, GuildSettings
+from ratelimit import TokenBucket
+from scheduler import Scheduler
+from config import (
+    BOT_PREFIX, CLOCKIN_WRITE_BEHIND, REMINDER_SEND_RATE, REMINDER_QUEUE_SIZE,
+    REMINDER_WEEKDAYS_ONLY
+)
+
+# Workers draining the send queue; the token bucket sets the actual pace
+SENDER_WORKERS = 2
+
+# Largest message Discord accepts
+MESSAGE_LIMIT = 2000
+
+class MessageSender:
+    """Bounded queue of outgoing messages, sent at a steady rate"""
+
+    def __init__(self, rate: float, queue_size: int):
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._bucket = TokenBucket(rate, max(1, int(rate)))
+        self._workers = []
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the send workers"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(SENDER_WORKERS)]
+
+    async def stop(self):
+        """Stop sending, dropping queued messages"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def pending(self):
+        """Messages waiting to be sent"""
+        return self._queue.qsize()
+
+    def submit(self, destination: discord.abc.Messageable, content: str):
+        """Queue a message, returning False when the queue is full"""
+        try:
+            self._queue.put_nowait((destination, content))
+            return True
+        except asyncio.QueueFull:
+            self.failed += 1
+            return False
+
+    async def _worker(self):
+        while True:
+            destination, content = await self._queue.get()
+            try:
+                await self._bucket.acquire()
+                await destination.send(content)
+                self.sent += 1
+            except discord.Forbidden:
+                # Members who closed their DMs
+                self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error sending reminder: {e}")
+            finally:
+                self._queue.task_done()
+
+def next_occurrence(remind_at: datetime.time, now: datetime.datetime, settings: GuildSettings):
+    """Next local datetime of a server at `remind_at` strictly after `now`"""
+    local_now = now.astimezone(settings.tz)
+    candidate = settings.localize(local_now.date(), remind_at)
+    if candidate <= local_now:
+        candidate = settings.localize(local_now.date() + datetime.timedelta(days=1), remind_at)
+    return candidate
+
+class DirectMessage:
+    """DM destination of a member who is not in the member cache"""
+
+    def __init__(self, bot, user_id: int):
+        self.bot = bot
+        self.user_id = user_id
+
+    async def send(self, content: str):
+        # Opening the DM channel is one request, it is cached afterwards
+        channel = await self.bot.create_dm(discord.Object(self.user_id))
+        await channel.send(content)
+
+def chunk_mentions(header: str, mentions: list):
+    """Split a ping of many members into messages within Discord's size limit"""
+    messages = []
+    current = header
+    for mention in mentions:
+        if len(current) + len(mention) + 1 > MESSAGE_LIMIT:
+            messages.append(current)
+            current = mention
+        else:
+            current += " " + mention
+    messages.append(current)
+    return messages
+
+class ReminderService:
+    """Schedules the clock-in reminders of every server the bot is in"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.scheduler = Scheduler()
+        self.sender = MessageSender(REMINDER_SEND_RATE, REMINDER_QUEUE_SIZE)
+        # server_id -> {reminder id: (reminder row, guild id)}
+        self._by_server = {}
+
+    def start(self):
+        self.scheduler.start()
+        self.sender.start()
+
+    async def stop(self):
+        await self.scheduler.stop()
+        await self.sender.stop()
+
+    async def load(self, guilds):
+        """Schedule the stored reminders of the given guilds"""
+        servers = {guild_cache.get(guild.id): guild.id for guild in guilds}
+        servers.pop(None, None)
+        reminders = await database.list_reminders(servers.keys())
+        await guild_settings.load({reminder['server_id'] for reminder in reminders})
+        for reminder in reminders:
+            await self.add(reminder, servers[reminder['server_id']])
+        print(f"⏰ Scheduled {len(self.scheduler)} clock-in reminders")
+
+    async def add(self, reminder: dict, guild_id: int):
+        """Schedule a reminder row, replacing an earlier schedule of it"""
+        self._by_server.setdefault(reminder['server_id'], {})[reminder['id']] = (reminder, guild_id)
+        settings = await guild_settings.get(reminder['server_id'])
+        self._schedule(reminder, guild_id, settings)
+
+    def remove(self, reminder: dict):
+        """Stop a reminder"""
+        self.scheduler.cancel(reminder['id'])
+        self._by_server.get(reminder['server_id'], {}).pop(reminder['id'], None)
+
+    def remove_server(self, server_id: int):
+        """Stop every reminder of a server"""
+        for reminder_id in self._by_server.pop(server_id, {}):
+            self.scheduler.cancel(reminder_id)
+
+    async def reschedule_server(self, server_id: int):
+        """Plan the reminders of a server again after its timezone changed"""
+        settings = await guild_settings.get(server_id)
+        for reminder, guild_id in self._by_server.get(server_id, {}).values():
+            self._schedule(reminder, guild_id, settings)
+
+    def _schedule(self, reminder: dict, guild_id: int, settings: GuildSettings):
+        remind_at = datetime.time.fromisoformat(reminder['remind_at'])
+        when = next_occurrence(remind_at, datetime.datetime.now(datetime.timezone.utc), settings)
+
+        async def fire():
+            # Plan tomorrow's run first so a failure today does not stop the reminder
+            self._schedule(reminder, guild_id, settings)
+            await self._remind(reminder, guild_id, when.date())
+
+        self.scheduler.schedule(reminder['id'], when.timestamp(), fire)
+
+    async def _remind(self, reminder: dict, guild_id: int, day: datetime.date):
+        if REMINDER_WEEKDAYS_ONLY and day.weekday() >= 5:
+            return
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+
+        server_id = reminder['server_id']
+        missing = await database.unclocked_members(server_id, day.isoformat())
+        if CLOCKIN_WRITE_BEHIND:
+            # Clock-ins still waiting in the local queue count as done
+            queued = await clockin_queue.user_ids_of_day(server_id, day.isoformat())
+            missing = [(user_id, discord_id) for user_id, discord_id in missing if user_id not in queued]
+
+        # Members are usually not cached; registered users are people, cached bots are skipped
+        discord_ids = [int(discord_id) for _, discord_id in missing]
+        discord_ids = [
+            discord_id for discord_id in discord_ids
+            if not getattr(guild.get_member(discord_id), 'bot', False)
+        ]
+        if not discord_ids:
+            return
+
+        if reminder['channel_id']:
+            channel = guild.get_channel(int(reminder['channel_id']))
+            if channel is None:
+                return
+            header = f"⏰ Reminder: you have not clocked in today! Use `{BOT_PREFIX}clockin` with a photo."
+            for message in chunk_mentions(header, [f"<@{discord_id}>" for discord_id in discord_ids]):
+                self.sender.submit(channel, message)
+        else:
+            content = f"⏰ Reminder: you have not clocked in today in **{guild.name}**! Use `{BOT_PREFIX}clockin` there with a photo."
+            for discord_id in discord_ids:
+                self.sender.submit(guild.get_member(discord_id) or DirectMessage(self.bot, discord_id), content)
+        print(f"⏰ Reminded {len(discord_ids)} members in {guild.name}")
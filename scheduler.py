@@ -0,0 +1,99 @@
+"""Single-timer scheduler for jobs at wall-clock times
+
+All jobs live in one heap ordered by due time and a single task sleeps
+until the earliest one, so thousands of scheduled jobs cost one sleeping
+task instead of one each.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+# Longest single sleep, so changes of the system clock are picked up
+MAX_SLEEP = 60
+
+# Callbacks running at the same time; due jobs wait for a free slot beyond that
+MAX_RUNNING = 16
+
+class Scheduler:
+    """Runs `callback()` coroutines at given Unix timestamps
+
+    Jobs are identified by a key; scheduling a key again replaces its
+    previous run. Each due callback runs in a task of its own, at most
+    `max_running` at a time, so a slow one does not hold back the next.
+    """
+
+    def __init__(self, max_running: int = MAX_RUNNING):
+        self._heap = []
+        # key -> sequence number of its current heap entry, older entries are stale
+        self._current = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._slots = asyncio.Semaphore(max_running)
+        self._running = set()
+
+    def schedule(self, key, when: float, callback):
+        """Run `callback` at Unix time `when`, replacing an earlier schedule of `key`"""
+        seq = next(self._counter)
+        self._current[key] = seq
+        heapq.heappush(self._heap, (when, seq, key, callback))
+        if self._heap[0][1] == seq:
+            # The new job is due before the one being waited for
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Forget the pending run of `key`, if any"""
+        self._current.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._current
+
+    def __len__(self):
+        return len(self._current)
+
+    def start(self):
+        """Start the timer task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the timer task and running callbacks, dropping pending jobs"""
+        tasks = list(self._running)
+        if self._task:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _discard_stale(self):
+        while self._heap and self._current.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._discard_stale()
+            delay = self._heap[0][0] - time.time() if self._heap else MAX_SLEEP
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, key, callback = heapq.heappop(self._heap)
+            del self._current[key]
+            await self._slots.acquire()
+            task = asyncio.create_task(self._call(key, callback))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _call(self, key, callback):
+        try:
+            await callback()
+        except Exception as e:
+            print(f"Error running scheduled job {key}: {e}")
+        finally:
+            self._slots.release()
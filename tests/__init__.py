@@ -0,0 +1,6 @@
+import os
+
+# config.py refuses to load without these; the tests never reach Discord or Supabase
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ.setdefault('SUPABASE_URL', 'https://example.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'test.supabase.key')
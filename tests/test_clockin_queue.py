@@ -0,0 +1,158 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import clockin_queue
+import database
+from clockin_queue import ClockInQueue
+
+DAY = '2024-05-01'
+
+class ClockInSeedTest(unittest.IsolatedAsyncioTestCase):
+    """Clock-ins are answered from the local queue while Supabase is unavailable"""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = ClockInQueue(os.path.join(self.directory.name, 'queue.db'))
+        self.queue.pending = await self.queue._run(self.queue._open)
+
+    async def asyncTearDown(self):
+        await self.queue.stop()
+        self.directory.cleanup()
+
+    async def submit(self, user_id: int):
+        return await self.queue.submit(1, user_id, DAY, f'{DAY}T01:00:00+00:00', None, None)
+
+    async def test_hanging_lookup_does_not_delay_clock_in(self):
+        async def hang(server_id, attendance_date):
+            await asyncio.sleep(3600)
+
+        with mock.patch.object(database, 'clocked_in_today', hang), \
+                mock.patch.object(clockin_queue, 'SEED_TIMEOUT', 0.05):
+            started = time.monotonic()
+            first = await self.submit(1)
+            second = await self.submit(1)
+            self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(first['status'], 'ok')
+        self.assertEqual(second['status'], 'already_clocked_in')
+
+    async def test_failed_lookup_is_retried_after_backoff(self):
+        calls = []
+
+        async def fail(server_id, attendance_date):
+            calls.append(attendance_date)
+            raise ConnectionError('Supabase is down')
+
+        with mock.patch.object(database, 'clocked_in_today', fail):
+            self.assertEqual((await self.submit(1))['status'], 'ok')
+            self.assertEqual((await self.submit(2))['status'], 'ok')
+            self.assertEqual(len(calls), 1)
+
+            # Once the backoff has passed the lookup is tried again
+            _, backoff = self.queue._seed_retry[(1, DAY)]
+            self.queue._seed_retry[(1, DAY)] = (0, backoff)
+            await self.submit(3)
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(self.queue._seed_retry[(1, DAY)][1], backoff * 2)
+
+    async def test_stored_clock_ins_are_merged_when_lookup_succeeds(self):
+        async def stored(server_id, attendance_date):
+            return {7: f'{DAY}T00:30:00+00:00'}
+
+        with mock.patch.object(database, 'clocked_in_today', stored):
+            result = await self.submit(7)
+        self.assertEqual(result['status'], 'already_clocked_in')
+        self.assertIn((1, DAY), self.queue._seeded)
+
+class ClockInFlushTest(unittest.IsolatedAsyncioTestCase):
+    """Acknowledged clock-ins are only dropped when the database refuses their data"""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = ClockInQueue(os.path.join(self.directory.name, 'queue.db'))
+        self.queue.pending = await self.queue._run(self.queue._open)
+
+        async def nothing_stored(server_id, attendance_date):
+            return {}
+
+        with mock.patch.object(database, 'clocked_in_today', nothing_stored):
+            self.refs = [
+                (await self.queue.submit(1, user_id, DAY, f'{DAY}T01:00:00+00:00', None, None))['client_ref']
+                for user_id in range(8)
+            ]
+
+    async def asyncTearDown(self):
+        await self.queue.stop()
+        self.directory.cleanup()
+
+    async def statuses(self):
+        def read():
+            rows = self.queue._conn.execute("select client_ref, status from pending_clock_ins").fetchall()
+            return {row['client_ref']: row['status'] for row in rows}
+        return await self.queue._run(read)
+
+    async def test_server_error_keeps_rows_pending(self):
+        flush = mock.AsyncMock(side_effect=database.APIError({'code': '57014', 'message': 'canceling statement due to statement timeout'}))
+        with mock.patch.object(database, 'flush_clock_ins', flush):
+            with self.assertRaises(database.APIError):
+                await self.queue.flush()
+        self.assertEqual(flush.await_count, 1)
+        self.assertEqual(set((await self.statuses()).values()), {'pending'})
+        self.assertEqual(self.queue.pending, 8)
+
+    async def test_gateway_error_keeps_rows_pending(self):
+        # A 503 page without a JSON body carries the HTTP status as its code
+        flush = mock.AsyncMock(side_effect=database.APIError({'code': 503, 'message': 'JSON could not be generated'}))
+        with mock.patch.object(database, 'flush_clock_ins', flush):
+            with self.assertRaises(database.APIError):
+                await self.queue.flush()
+        self.assertEqual(set((await self.statuses()).values()), {'pending'})
+
+    async def test_refused_row_is_found_by_bisecting(self):
+        bad = self.refs[5]
+
+        async def flush(rows):
+            if any(row['client_ref'] == bad for row in rows):
+                raise database.APIError({'code': '23503', 'message': 'violates foreign key constraint'})
+            return {row['client_ref']: 'inserted' for row in rows}
+
+        flush = mock.AsyncMock(side_effect=flush)
+        with mock.patch.object(database, 'flush_clock_ins', flush):
+            await self.queue.flush()
+        statuses = await self.statuses()
+        self.assertEqual(statuses.pop(bad), 'rejected')
+        self.assertEqual(set(statuses.values()), {'flushed'})
+        # Halving 8 rows down to the bad one, instead of one call per row
+        self.assertEqual(flush.await_count, 7)
+
+    async def test_conflict_is_kept_for_review(self):
+        async def flush(rows):
+            return {row['client_ref']: 'conflict' if row['user_id'] == 3 else 'inserted' for row in rows}
+
+        with mock.patch.object(database, 'flush_clock_ins', flush):
+            await self.queue.flush()
+        rejected = await self.queue.rejected(1, DAY)
+        self.assertEqual([(row['user_id'], row['reject_reason']) for row in rejected], [(3, 'conflict')])
+
+        # Flushed rows are pruned after their day, rejected ones are kept for a while
+        await self.queue._run(self.queue._prune, '2024-05-02', '2024-04-01')
+        self.assertEqual(list((await self.statuses()).values()), ['rejected'])
+        await self.queue._run(self.queue._prune, '2024-06-01', '2024-05-02')
+        self.assertEqual(await self.statuses(), {})
+
+    async def test_missing_result_does_not_spin(self):
+        async def flush(rows):
+            return {row['client_ref']: 'inserted' for row in rows[1:]}
+
+        with mock.patch.object(database, 'flush_clock_ins', flush), \
+                mock.patch.object(clockin_queue, 'CLOCKIN_FLUSH_BATCH_SIZE', 8):
+            with self.assertRaisesRegex(Exception, 'no flush result'):
+                await asyncio.wait_for(self.queue.flush(), timeout=2)
+        statuses = await self.statuses()
+        self.assertEqual(statuses[self.refs[0]], 'pending')
+        self.assertEqual(list(statuses.values()).count('flushed'), 7)
+
+if __name__ == '__main__':
+    unittest.main()
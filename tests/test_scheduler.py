@@ -0,0 +1,69 @@
+import asyncio
+import time
+import unittest
+from scheduler import Scheduler
+
+class SchedulerTest(unittest.IsolatedAsyncioTestCase):
+    """Due jobs run on time even while earlier callbacks are still busy"""
+
+    async def asyncSetUp(self):
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+
+    async def test_slow_callback_does_not_delay_next_deadline(self):
+        fired = asyncio.Event()
+        fired_at = []
+
+        async def slow():
+            await asyncio.sleep(3600)
+
+        async def quick():
+            fired_at.append(time.time())
+            fired.set()
+
+        now = time.time()
+        self.scheduler.schedule('slow', now, slow)
+        self.scheduler.schedule('quick', now + 0.1, quick)
+        await asyncio.wait_for(fired.wait(), timeout=2)
+        self.assertLess(fired_at[0] - (now + 0.1), 0.5)
+
+    async def test_running_callbacks_are_bounded(self):
+        scheduler = Scheduler(max_running=2)
+        scheduler.start()
+        release = asyncio.Event()
+        running = []
+
+        async def job():
+            running.append(1)
+            await release.wait()
+
+        for key in range(3):
+            scheduler.schedule(key, time.time(), job)
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(running), 2)
+        release.set()
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(running), 3)
+        await scheduler.stop()
+
+    async def test_failing_callback_frees_its_slot(self):
+        scheduler = Scheduler(max_running=1)
+        scheduler.start()
+        done = asyncio.Event()
+
+        async def fail():
+            raise RuntimeError('boom')
+
+        async def succeed():
+            done.set()
+
+        scheduler.schedule('fail', time.time(), fail)
+        scheduler.schedule('succeed', time.time() + 0.05, succeed)
+        await asyncio.wait_for(done.wait(), timeout=2)
+        await scheduler.stop()
+
+if __name__ == '__main__':
+    unittest.main()